@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import time
+
+from src.cloud.bucket.storage_firebase import list_blob_names, exists_file_on_bucket
+from src.file.path import PhotospherePath
+
+BUCKET_MANIFEST_FILE = 'photosphere_bucket_manifest.json'
+
+
+def is_in_prefix(storage_path: str, prefix: str) -> bool:
+    """
+    :param prefix: a folder ending with '/' (all the files below it), or '' for the files in the root of the bucket
+    """
+    if prefix == '':
+        return '/' not in storage_path
+    return storage_path.startswith(prefix)
+
+
+class BucketManifest:
+    """
+    In memory set of the file names under some prefixes of a bucket, listed once with a paginated list_blobs,
+    so the existence checks before the uploads don't need a request each.
+    The files uploaded with upload_blob_if_not_exist are added to it.
+    With a cache path the listing is saved on disk and reused until it is older than ttl seconds.
+    Paths outside the prefixes are checked on the bucket.
+    """
+
+    def __init__(
+            self,
+            bucket_name: str,
+            prefixes: list[str],
+            cache_path: PhotospherePath = None,
+            ttl: float = 0
+        ):
+        """
+        :param bucket_name: without the gs://
+        :param prefixes: folders ending with '/', '' for the files in the root of the bucket
+        :param cache_path: json file of the listing, None to keep it only in memory
+        :param ttl: seconds a listing saved on disk is valid, 0 to always list the bucket
+        """
+        self.bucket_name = bucket_name
+        self.prefixes = sorted(set(prefixes))
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.names: set[str] = set()
+        self.listed_prefixes: list[str] = []
+        self.listed_at = time.time()
+        self.lock = threading.Lock()
+
+    def load(self) -> 'BucketManifest':
+        """
+        Reads the listing saved on disk if still valid, and lists the prefixes it doesn't contain.
+        """
+        if self.cache_path is not None and self.ttl > 0 and self.cache_path.exists():
+            with open(self.cache_path.get_string(), 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached["bucket"] == self.bucket_name and time.time() - cached["listed_at"] < self.ttl:
+                self.names = set(cached["names"])
+                self.listed_prefixes = cached["prefixes"]
+                self.listed_at = cached["listed_at"]
+        missing = [prefix for prefix in self.prefixes if prefix not in self.listed_prefixes]
+        for prefix in missing:
+            self.names.update(list_blob_names(prefix, self.bucket_name, recursive=prefix != ''))
+        self.listed_prefixes = sorted(set(self.listed_prefixes) | set(missing))
+        return self
+
+    def exists(self, storage_path: str) -> bool:
+        if any(is_in_prefix(storage_path, prefix) for prefix in self.listed_prefixes):
+            with self.lock:
+                return storage_path in self.names
+        return exists_file_on_bucket(storage_path, self.bucket_name)
+
+    def add(self, storage_path: str) -> None:
+        with self.lock:
+            self.names.add(storage_path)
+
+    def save(self) -> None:
+        """
+        Saves the listing on disk, with the time of the bucket listing: the files added since are the uploaded ones.
+        """
+        if self.cache_path is None or self.ttl <= 0:
+            return
+        tmp_path = self.cache_path.get_string() + '.tmp'
+        with self.lock:
+            content = {
+                "bucket": self.bucket_name,
+                "listed_at": self.listed_at,
+                "prefixes": self.listed_prefixes,
+                "names": sorted(self.names),
+            }
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(content, f)
+        os.replace(tmp_path, self.cache_path.get_string())
+
+    def __len__(self) -> int:
+        return len(self.names)
@@ -2,23 +2,42 @@ import os
 import firebase_admin
 from firebase_admin import credentials, storage
 
+from src.cloud.bucket.upload_engine import get_source_size, get_content_type
 from src.file.path import PhotospherePath
+from src.util.profiling import span
 
-# Initialize Firebase Admin SDK
-if not firebase_admin._apps:
-    firebase_config_path = os.environ.get("FIREBASE_CONFIG_PATH", None)
-    if firebase_config_path and os.path.exists(firebase_config_path):
-        cred = credentials.Certificate(firebase_config_path)
-        firebase_admin.initialize_app(cred)
-    else:
-        firebase_admin.initialize_app()
+FIREBASE_CONFIG_PATH_ENV = "FIREBASE_CONFIG_PATH"
+
+
+def get_firebase_app() -> firebase_admin.App:
+    """
+    The Firebase Admin SDK app of the storage client, initialized on first use and not at import: the commands that
+    don't use a bucket don't look up the credentials. The credentials are the service account json file of the
+    FIREBASE_CONFIG_PATH environment variable, or the application default ones.
+    """
+    if not firebase_admin._apps:
+        firebase_config_path = os.environ.get(FIREBASE_CONFIG_PATH_ENV, None)
+        if firebase_config_path and os.path.exists(firebase_config_path):
+            cred = credentials.Certificate(firebase_config_path)
+            firebase_admin.initialize_app(cred)
+        else:
+            firebase_admin.initialize_app()
+    return firebase_admin.get_app()
+
+
+def get_bucket(bucket_name: str):
+    """
+    :param bucket_name: without the gs://
+    :return: the google.cloud.storage.Bucket, of the client of get_firebase_app
+    """
+    return storage.bucket(bucket_name, app=get_firebase_app())
 
 def create_bucket(bucket_name: str):
     """
     :param bucket_name: without the gs://
     :return: if created return True, else False
     """
-    bucket = storage.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     list(bucket.list_blobs(max_results=1))
     return True
 
@@ -27,7 +46,7 @@ def delete_bucket(bucket_name: str):
     :param bucket_name: without the gs://
     :return: if deleted return True, else False
     """
-    bucket = storage.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     return True
 
 def delete_file(storage_path: str, bucket_name: str):
@@ -36,7 +55,7 @@ def delete_file(storage_path: str, bucket_name: str):
     :param bucket_name: without the gs://
     :return: if deleted return True, else False
     """
-    bucket = storage.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(storage_path)
     blob.delete()
     return True
@@ -46,7 +65,7 @@ def exists_bucket(bucket_name: str):
     :param bucket_name: without the gs://
     :return: if exists return True, else False
     """
-    bucket = storage.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     list(bucket.list_blobs(max_results=1))
     return True
 
@@ -57,34 +76,53 @@ def exists_file_on_bucket(storage_path: str, bucket_name: str):
     :return: True if file exists, False otherwise
     """
     try:
-        bucket = storage.bucket(bucket_name)
+        bucket = get_bucket(bucket_name)
         blob = bucket.blob(storage_path)
-        return blob.exists()
+        with span("bucket.exists"):
+            return blob.exists()
     except Exception:
         return False
 
-def upload_blob(source_file: str, storage_path: str, bucket_name: str):
+def upload_blob(source_file: str | bytes, storage_path: str, bucket_name: str):
     """
-    :param source_file: local file path
+    :param source_file: local file path, or the content to upload (the content type is guessed from storage_path,
+        like the one of a file from its name)
     :param storage_path: path to the file in the bucket
     :param bucket_name: without the gs://
     :return: gs path to the file
     """
-    bucket = storage.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(storage_path)
-    blob.upload_from_filename(source_file)
+    with span("bucket.upload", get_source_size(source_file)):
+        if isinstance(source_file, bytes):
+            blob.upload_from_string(source_file, content_type=get_content_type(storage_path))
+        else:
+            blob.upload_from_filename(source_file)
     gs_path = f"gs://{bucket_name}/{storage_path}"
     return gs_path
 
-def upload_blob_if_not_exist(source_file: str, storage_path: str, bucket_name: str):
-    """
-    :param source_file: local file path
+def upload_blob_if_not_exist(
+        source_file: str | bytes,
+        storage_path: str,
+        bucket_name: str,
+        manifest=None,
+        uploader=None
+    ):
+    """
+    :param source_file: local file path, or the content to upload
     :param storage_path: path to the file in the bucket
     :param bucket_name: without the gs://
+    :param manifest: BucketManifest answering the existence check without a request, updated after the upload
+    :param uploader: function with the upload_blob signature used for the upload (e.g. AsyncUploadEngine.upload_blob),
+        default upload_blob
     :return: gs path to the file
     """
-    if not exists_file_on_bucket(storage_path, bucket_name):
-        return upload_blob(source_file, storage_path, bucket_name)
+    exists = manifest.exists(storage_path) if manifest is not None else exists_file_on_bucket(storage_path, bucket_name)
+    if not exists:
+        gs_path = (uploader or upload_blob)(source_file, storage_path, bucket_name)
+        if manifest is not None:
+            manifest.add(storage_path)
+        return gs_path
     else:
         return f"gs://{bucket_name}/{storage_path}"
 
@@ -94,9 +132,12 @@ def download_file_as_str(storage_path: str, bucket_name: str):
     :param bucket_name: without the gs://
     :return: file content as string
     """
-    bucket = storage.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(storage_path)
-    return blob.download_as_bytes().decode('utf-8')
+    with span("bucket.download") as download_span:
+        content = blob.download_as_bytes()
+        download_span.add_bytes(len(content))
+    return content.decode('utf-8')
 
 def download_file_to_local(storage_path: str, bucket_name: str, local_path: PhotospherePath):
     """
@@ -105,17 +146,36 @@ def download_file_to_local(storage_path: str, bucket_name: str, local_path: Phot
     :param local_path: local path to save the file
     :return: True if downloaded successfully, False otherwise
     """
-    bucket = storage.bucket(bucket_name)
+    bucket = get_bucket(bucket_name)
     blob = bucket.blob(storage_path)
-    blob.download_to_filename(local_path.get_string())
+    with span("bucket.download"):
+        blob.download_to_filename(local_path.get_string())
     return True
 
+def list_blob_names(prefix: str, bucket_name: str, recursive: bool = True):
+    """
+    :param prefix: folder path/prefix to list
+    :param bucket_name: without the gs://
+    :param recursive: False to list only the files directly in the prefix
+    :return: generator of the file names, the pages are requested while iterating
+    """
+    bucket = get_bucket(bucket_name)
+    blobs = bucket.list_blobs(
+        prefix=prefix or None,
+        delimiter=None if recursive else '/',
+        fields='items(name),nextPageToken',
+        page_size=1000
+    )
+    for blob in blobs:
+        yield blob.name
+
 def list_all_files_in_bucket_folder(folder: str, bucket_name: str):
     """
     :param folder: folder path/prefix to search in
     :param bucket_name: without the gs://
     :return: list of file names in the folder
     """
-    bucket = storage.bucket(bucket_name)
-    blobs = bucket.list_blobs(prefix=folder, delimiter='/')
-    return [blob.name for blob in blobs]
+    bucket = get_bucket(bucket_name)
+    with span("bucket.list"):
+        blobs = bucket.list_blobs(prefix=folder, delimiter='/')
+        return [blob.name for blob in blobs]
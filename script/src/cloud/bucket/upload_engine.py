@@ -0,0 +1,291 @@
+import asyncio
+import io
+import json
+import mimetypes
+import os
+import random
+import threading
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.util.profiling import span
+
+# firebase: storage_firebase.upload_blob, one request per file, async: AsyncUploadEngine
+FIREBASE_UPLOAD_ENGINE = 'firebase'
+ASYNC_UPLOAD_ENGINE = 'async'
+UPLOAD_ENGINES = [FIREBASE_UPLOAD_ENGINE, ASYNC_UPLOAD_ENGINE]
+GCS_API_URL = 'https://storage.googleapis.com'
+GCS_SCOPE = 'https://www.googleapis.com/auth/devstorage.read_write'
+# resumable chunks must be a multiple of 256 KiB
+CHUNK_ALIGNMENT = 256 * 1024
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_MAX_IN_FLIGHT_BYTES = 64 * 1024 * 1024
+DEFAULT_CONCURRENCY = 8
+DEFAULT_MAX_RETRIES = 6
+# status codes worth a retry, see the GCS retry strategy
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# status of a resumable chunk accepted, the upload is not complete
+RESUME_INCOMPLETE = 308
+
+
+class UploadError(Exception):
+    pass
+
+
+def get_source_size(source_file: str | bytes) -> int:
+    """
+    :param source_file: local file path, or the content to upload
+    """
+    return len(source_file) if isinstance(source_file, bytes) else os.path.getsize(source_file)
+
+
+def get_content_type(storage_path: str) -> str:
+    """
+    :param storage_path: path to the file in the bucket
+    :return: the content type of the file from its name, application/octet-stream if unknown
+    """
+    return mimetypes.guess_type(storage_path)[0] or 'application/octet-stream'
+
+
+class _ByteBudget:
+    """
+    Caps the bytes read in memory and sent at the same time. A request bigger than the cap waits
+    until nothing else is in flight.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, size: int):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight == 0 or self.in_flight + size <= self.max_bytes)
+            self.in_flight += size
+
+    async def release(self, size: int):
+        async with self.condition:
+            self.in_flight -= size
+            self.condition.notify_all()
+
+
+def create_gcs_session(pool_size: int = DEFAULT_CONCURRENCY) -> requests.Session:
+    """
+    :return: an authorized session with the credentials of the firebase app, keeping up to pool_size connections
+    """
+    from google.auth.transport.requests import AuthorizedSession
+    from src.cloud.bucket.storage_firebase import get_firebase_app
+    credentials = get_firebase_app().credential.get_credential()
+    if hasattr(credentials, 'with_scopes_if_required'):
+        credentials = credentials.with_scopes_if_required([GCS_SCOPE])
+    session = AuthorizedSession(credentials)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class AsyncUploadEngine:
+    """
+    Uploads files to a bucket with the GCS JSON API:
+     - one pooled HTTP session for all the uploads, up to `concurrency` uploads at the same time
+     - files larger than chunk_size are sent as resumable uploads in chunks of chunk_size, a failed chunk
+       is resumed from the last byte the server received
+     - failed requests (network errors, 408, 429, 5xx) are retried with jittered exponential backoff
+     - at most max_in_flight_bytes are read in memory and sent at the same time
+    The HTTP calls run in threads, the coroutines only schedule them.
+    """
+
+    def __init__(
+            self,
+            session: requests.Session,
+            api_url: str = GCS_API_URL,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            max_in_flight_bytes: int = DEFAULT_MAX_IN_FLIGHT_BYTES,
+            concurrency: int = DEFAULT_CONCURRENCY,
+            max_retries: int = DEFAULT_MAX_RETRIES,
+            backoff_base: float = 0.5,
+            backoff_max: float = 32,
+            timeout: float = 120
+        ):
+        if chunk_size <= 0 or chunk_size % CHUNK_ALIGNMENT != 0:
+            raise ValueError(f"chunk_size must be a multiple of {CHUNK_ALIGNMENT} bytes")
+        self.session = session
+        self.api_url = api_url.rstrip('/')
+        self.chunk_size = chunk_size
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self._loop = None
+        self._thread = None
+        self._budget = None
+        self._slots = None
+
+    def _backoff(self, attempt: int) -> float:
+        """
+        Full jitter: a random delay between 0 and the exponential backoff of the attempt.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Runs the request in a thread, retrying network errors and RETRY_STATUS_CODES.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await asyncio.to_thread(self.session.request, method, url, timeout=self.timeout, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+                error = UploadError(f"{method} {url}: HTTP {response.status_code} {response.text}")
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            if attempt == self.max_retries:
+                raise error
+            await asyncio.sleep(self._backoff(attempt))
+
+    def _upload_url(self, bucket_name: str) -> str:
+        return f"{self.api_url}/upload/storage/v1/b/{quote(bucket_name, safe='')}/o"
+
+    async def _upload_simple(self, source_file: str | bytes, storage_path: str, bucket_name: str, size: int):
+        await self._budget.acquire(size)
+        try:
+            if isinstance(source_file, bytes):
+                data = source_file
+            else:
+                with open(source_file, 'rb') as f:
+                    data = f.read()
+            response = await self._request(
+                'POST',
+                self._upload_url(bucket_name),
+                params={'uploadType': 'media', 'name': storage_path},
+                data=data,
+                headers={'Content-Type': get_content_type(storage_path)}
+            )
+        finally:
+            await self._budget.release(size)
+        if response.status_code not in (200, 201):
+            raise UploadError(f"Upload of {storage_path} failed: HTTP {response.status_code} {response.text}")
+
+    async def _resume_offset(self, session_url: str, size: int) -> int | None:
+        """
+        :return: the offset of the first byte the server doesn't have, None if the upload is complete
+        """
+        response = await self._request(
+            'PUT', session_url, headers={'Content-Range': f'bytes */{size}'}, allow_redirects=False
+        )
+        if response.status_code in (200, 201):
+            return None
+        if response.status_code != RESUME_INCOMPLETE:
+            raise UploadError(f"Resumable upload status failed: HTTP {response.status_code} {response.text}")
+        received = response.headers.get('Range')
+        return int(received.split('-')[1]) + 1 if received else 0
+
+    async def _upload_resumable(self, source_file: str | bytes, storage_path: str, bucket_name: str, size: int):
+        response = await self._request(
+            'POST',
+            self._upload_url(bucket_name),
+            params={'uploadType': 'resumable', 'name': storage_path},
+            data=json.dumps({'name': storage_path}),
+            headers={
+                'Content-Type': 'application/json; charset=UTF-8',
+                'X-Upload-Content-Type': get_content_type(storage_path),
+                'X-Upload-Content-Length': str(size)
+            }
+        )
+        if response.status_code != 200 or 'Location' not in response.headers:
+            raise UploadError(f"Resumable upload of {storage_path} not started: HTTP {response.status_code}")
+        session_url = response.headers['Location']
+        offset = 0
+        failures = 0
+        with io.BytesIO(source_file) if isinstance(source_file, bytes) else open(source_file, 'rb') as f:
+            while offset is not None:
+                length = min(self.chunk_size, size - offset)
+                await self._budget.acquire(length)
+                try:
+                    f.seek(offset)
+                    chunk = f.read(length)
+                    response = await asyncio.to_thread(
+                        self.session.put,
+                        session_url,
+                        data=chunk,
+                        headers={'Content-Range': f'bytes {offset}-{offset + length - 1}/{size}'},
+                        timeout=self.timeout,
+                        # 308 is "resume incomplete", not a redirect
+                        allow_redirects=False
+                    )
+                    status = response.status_code
+                except (requests.ConnectionError, requests.Timeout):
+                    status = None
+                finally:
+                    await self._budget.release(length)
+                if status in (200, 201):
+                    offset = None
+                elif status == RESUME_INCOMPLETE:
+                    received = response.headers.get('Range')
+                    offset = int(received.split('-')[1]) + 1 if received else 0
+                    failures = 0
+                elif status is None or status in RETRY_STATUS_CODES:
+                    if failures == self.max_retries:
+                        raise UploadError(f"Upload of {storage_path} failed at byte {offset}")
+                    await asyncio.sleep(self._backoff(failures))
+                    failures += 1
+                    # the chunk may have been partially received
+                    offset = await self._resume_offset(session_url, size)
+                else:
+                    raise UploadError(f"Upload of {storage_path} failed: HTTP {status} {response.text}")
+
+    async def upload(self, source_file: str | bytes, storage_path: str, bucket_name: str) -> str:
+        """
+        :param source_file: local file path, or the content to upload
+        :param storage_path: path to the file in the bucket
+        :param bucket_name: without the gs://
+        :return: gs path to the file
+        """
+        if self._budget is None:
+            self._budget = _ByteBudget(self.max_in_flight_bytes)
+            self._slots = asyncio.Semaphore(self.concurrency)
+        size = get_source_size(source_file)
+        async with self._slots:
+            if size > self.chunk_size:
+                await self._upload_resumable(source_file, storage_path, bucket_name, size)
+            else:
+                await self._upload_simple(source_file, storage_path, bucket_name, size)
+        return f"gs://{bucket_name}/{storage_path}"
+
+    async def upload_many(self, uploads: list[tuple[str, str, str]]) -> list[str]:
+        """
+        :param uploads: (source_file, storage_path, bucket_name) of each file
+        :return: the gs paths, in the same order
+        """
+        return list(await asyncio.gather(*(self.upload(*upload) for upload in uploads)))
+
+    def start(self) -> 'AsyncUploadEngine':
+        """
+        Starts an event loop in a background thread, used by upload_blob.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='upload-engine', daemon=True)
+        self._thread.start()
+        return self
+
+    def upload_blob(self, source_file: str | bytes, storage_path: str, bucket_name: str) -> str:
+        """
+        Same as storage_firebase.upload_blob, the upload runs in the loop of start(): calls from many threads
+        share the session, the concurrency and the in-flight bytes cap.
+        """
+        with span("bucket.upload", get_source_size(source_file)):
+            future = asyncio.run_coroutine_threadsafe(self.upload(source_file, storage_path, bucket_name), self._loop)
+            return future.result()
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+        self.session.close()
@@ -0,0 +1,171 @@
+import json
+import os
+import uuid
+from typing import Iterable
+
+from src.cloud.bucket.storage_firebase import upload_blob, download_file_to_local, delete_file, exists_file_on_bucket
+from src.file.path import PhotospherePath
+from src.local.hashing import SHA1_ALGORITHM
+from src.local.utils import create_folder_if_not_exists
+from src.protobuf.converter import create_protobuf_file_list
+from src.protobuf.shards import create_protobuf_shards, SHARD_INDEX_FILE
+
+CATALOGUE_FOLDER = 'catalogue/'
+CATALOGUE_MANIFEST_FILE = CATALOGUE_FOLDER + 'manifest.json'
+CATALOGUE_SEGMENTS_FOLDER = CATALOGUE_FOLDER + 'segments/'
+CATALOGUE_SHARDS_FOLDER = CATALOGUE_FOLDER + 'shards/'
+LOCAL_CATALOGUE_FOLDER = 'photosphere_catalogue/'
+COMPACTION_THRESHOLD = 32
+
+
+class SegmentedCatalogue:
+    """
+    Append only cloud database: every batch of records is uploaded as an immutable segment (json and protobuf)
+    and a small manifest lists the segments, so the upload cost of a batch depends only on the batch size.
+    When there are more than compaction_threshold segments, the adjacent segments with the fewest records
+    are merged. Segments never change, so the local copies downloaded once are reused by the next syncs.
+    """
+
+    def __init__(
+            self,
+            bucket_name: str,
+            local_folder: PhotospherePath = PhotospherePath(LOCAL_CATALOGUE_FOLDER),
+            compaction_threshold: int = COMPACTION_THRESHOLD
+        ):
+        self.bucket_name = bucket_name
+        self.local_folder = create_folder_if_not_exists(local_folder.join(bucket_name))
+        self.compaction_threshold = compaction_threshold
+        self.manifest = {"version": 1, "next_sequence": 1, "segments": []}
+
+    def load(self) -> list[dict] | None:
+        """
+        Downloads the manifest and the segments that are not in the local folder yet.
+        :return: all the records of the catalogue, None if the bucket has no catalogue
+        """
+        if not exists_file_on_bucket(CATALOGUE_MANIFEST_FILE, self.bucket_name):
+            return None
+        manifest_path = self.local_folder.join(os.path.basename(CATALOGUE_MANIFEST_FILE))
+        download_file_to_local(CATALOGUE_MANIFEST_FILE, self.bucket_name, manifest_path)
+        with open(manifest_path.get_string(), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        records = []
+        for segment in self.manifest["segments"]:
+            records.extend(self._read_segment(segment))
+        return records
+
+    def get_segments(self) -> list[dict]:
+        return self.manifest["segments"]
+
+    def get_hash_algorithm(self) -> str | None:
+        """
+        :return: the algorithm of the hashes of the records, None if the catalogue is empty and any can be chosen.
+            The catalogues written before the algorithm could be chosen are sha1.
+        """
+        if "hash_algorithm" in self.manifest:
+            return self.manifest["hash_algorithm"]
+        return SHA1_ALGORITHM if self.manifest["segments"] else None
+
+    def set_hash_algorithm(self, hash_algorithm: str) -> None:
+        """
+        Records the algorithm in the manifest, uploaded with the next segment.
+        """
+        self.manifest["hash_algorithm"] = hash_algorithm
+
+    def append(self, records: list[dict]) -> None:
+        """
+        Uploads the records as a new segment, then the manifest.
+        """
+        if not records:
+            return
+        self.manifest["segments"].append(self._write_segment(records))
+        if len(self.manifest["segments"]) > self.compaction_threshold:
+            self.compact()
+        else:
+            self._upload_manifest()
+
+    def compact(self) -> None:
+        """
+        Merges the adjacent segments with the fewest records until there are at most compaction_threshold segments.
+        The replaced segments are deleted after the new manifest is uploaded.
+        """
+        segments = self.manifest["segments"]
+        replaced = []
+        while len(segments) > max(self.compaction_threshold, 1):
+            index = min(range(len(segments) - 1), key=lambda i: segments[i]["count"] + segments[i + 1]["count"])
+            first, second = segments[index], segments[index + 1]
+            merged = self._write_segment(self._read_segment(first) + self._read_segment(second))
+            segments[index:index + 2] = [merged]
+            replaced.extend([first, second])
+        self._upload_manifest()
+        for segment in replaced:
+            delete_file(segment["json"], self.bucket_name)
+            delete_file(segment["pb"], self.bucket_name)
+            local_path = self._local_segment_path(segment)
+            if local_path.exists():
+                local_path.remove()
+
+    def _local_segment_path(self, segment: dict) -> PhotospherePath:
+        return self.local_folder.join(os.path.basename(segment["json"]))
+
+    def _read_segment(self, segment: dict) -> list[dict]:
+        local_path = self._local_segment_path(segment)
+        if not local_path.exists():
+            download_file_to_local(segment["json"], self.bucket_name, local_path)
+        with open(local_path.get_string(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_segment(self, records: list[dict]) -> dict:
+        name = f"{self.manifest['next_sequence']:08d}-{uuid.uuid4().hex[:8]}"
+        self.manifest["next_sequence"] += 1
+        timestamps = [record["created_at_timestamp"] for record in records if record.get("created_at_timestamp")]
+        segment = {
+            "name": name,
+            "json": CATALOGUE_SEGMENTS_FOLDER + name + '.json',
+            "pb": CATALOGUE_SEGMENTS_FOLDER + name + '.pb',
+            "count": len(records),
+            "min_created_at_timestamp": min(timestamps, default=None),
+            "max_created_at_timestamp": max(timestamps, default=None),
+        }
+        json_path = self._local_segment_path(segment)
+        with open(json_path.get_string(), 'w', encoding='utf-8') as f:
+            json.dump(records, f)
+        pb_path = self.local_folder.join(name + '.pb')
+        create_protobuf_file_list(records, pb_path)
+        upload_blob(json_path.get_string(), segment["json"], self.bucket_name)
+        upload_blob(pb_path.get_string(), segment["pb"], self.bucket_name)
+        pb_path.remove()
+        return segment
+
+    def _upload_manifest(self) -> None:
+        manifest_path = self.local_folder.join(os.path.basename(CATALOGUE_MANIFEST_FILE))
+        with open(manifest_path.get_string(), 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        upload_blob(manifest_path.get_string(), CATALOGUE_MANIFEST_FILE, self.bucket_name)
+
+
+def publish_protobuf_shards(
+        files: Iterable[dict],
+        bucket_name: str,
+        local_folder: PhotospherePath = PhotospherePath(LOCAL_CATALOGUE_FOLDER)
+    ) -> dict:
+    """
+    Writes the month shards of the files (see create_protobuf_shards) and uploads the shards that are not
+    in the bucket index yet, then the index. Shards of the previous index that are not used anymore are deleted.
+    :return: the new index
+    """
+    folder = local_folder.join(bucket_name, 'shards')
+    index = create_protobuf_shards(files, folder)
+    previous_files = set()
+    if exists_file_on_bucket(CATALOGUE_SHARDS_FOLDER + SHARD_INDEX_FILE, bucket_name):
+        previous_index_path = local_folder.join(bucket_name, 'previous_' + SHARD_INDEX_FILE)
+        download_file_to_local(CATALOGUE_SHARDS_FOLDER + SHARD_INDEX_FILE, bucket_name, previous_index_path)
+        with open(previous_index_path.get_string(), 'r', encoding='utf-8') as f:
+            previous_files = {shard["file"] for shard in json.load(f)["shards"]}
+        previous_index_path.remove()
+    current_files = {shard["file"] for shard in index["shards"]}
+    for file_name in sorted(current_files - previous_files):
+        upload_blob(folder.join(file_name).get_string(), CATALOGUE_SHARDS_FOLDER + file_name, bucket_name)
+    upload_blob(folder.join(SHARD_INDEX_FILE).get_string(), CATALOGUE_SHARDS_FOLDER + SHARD_INDEX_FILE, bucket_name)
+    for file_name in sorted(previous_files - current_files):
+        delete_file(CATALOGUE_SHARDS_FOLDER + file_name, bucket_name)
+    return index
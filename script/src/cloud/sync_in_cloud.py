@@ -1,88 +1,382 @@
 import os.path
+from typing import Callable
+from tqdm import tqdm
 from src.cloud.bucket.storage_firebase import exists_bucket, download_file_to_local, upload_blob, \
     upload_blob_if_not_exist
+from src.cloud.bucket.manifest import BucketManifest, BUCKET_MANIFEST_FILE
+from src.cloud.bucket.upload_engine import AsyncUploadEngine, create_gcs_session, DEFAULT_CHUNK_SIZE, \
+    DEFAULT_MAX_IN_FLIGHT_BYTES, FIREBASE_UPLOAD_ENGINE, ASYNC_UPLOAD_ENGINE
+from src.cloud.catalogue import SegmentedCatalogue, publish_protobuf_shards
+from src.cloud.sync_journal import SyncJournal, SYNC_JOURNAL_FILE, HASHED, THUMBNAIL_UPLOADED, SOURCE_UPLOADED
+from src.cloud.sync_pipeline import run_pipeline
 from src.file.image.image import PhotosphereImage
-from src.file.local_file import PhotosphereFile
+from src.file.image.rendition import RenditionOptions
 from src.file.path import PhotospherePath
-from tinydb import TinyDB, Query
+from src.database.photosphere_database import PhotosphereDatabase, check_video_hash_version
+from src.database.utils import open_database, TINYDB_BACKEND
+from src.file.video.analyzer import VIDEO_HASH_VERSION
 from src.file.video.video import PhotosphereVideo
-from src.local.utils import loop_on_files_in_folder_decorator, from_source_directory_to_nested_file_path
+from src.local.file_cache import FileStatCache, SUPPORTED_EXTENSIONS, cached_file_hash, get_file_cache_path, \
+    load_photosphere_file
+from src.local.hashing import DEFAULT_HASH_ALGORITHM, check_hash_algorithm
+from src.local.utils import loop_on_files_in_folder_decorator, from_source_directory_to_nested_file_path, \
+    list_files_in_folder
 from src.protobuf.converter import create_protobuf_file_list
 
 MOD_FOR_UPLOAD = 20
 CLOUD_DB_JSON_FILE = 'photosphere_database_cloud.json'
 CLOUD_DB_PB_FILE = 'photosphere_database_cloud.pb'
 
-def copy_in_cloud(source_path: PhotospherePath, bucket_name: str, subfolder: str = None):
+def copy_in_cloud(
+        source_path: PhotospherePath,
+        bucket_name: str,
+        subfolder: str = None,
+        workers: int = 1,
+        upload_concurrency: int = 4,
+        db_backend: str = TINYDB_BACKEND,
+        legacy_catalogue: bool = True,
+        manifest_ttl: float = 0,
+        upload_engine: str = FIREBASE_UPLOAD_ENGINE,
+        upload_chunk_size: int = DEFAULT_CHUNK_SIZE,
+        max_in_flight_bytes: int = DEFAULT_MAX_IN_FLIGHT_BYTES,
+        resume: bool = False,
+        hash_algorithm: str = None,
+        rendition_options: RenditionOptions = None
+    ):
 
     if exists_bucket(bucket_name):
         print(f"Bucket {bucket_name} already exists, continuing...")
     else:
         print(f"Please create new bucket in your cloud storage")
 
+    catalogue = SegmentedCatalogue(bucket_name)
+    db = open_cloud_database(bucket_name, catalogue, db_backend)
+    check_video_hash_version(db, VIDEO_HASH_VERSION, f"The catalogue of bucket {bucket_name}")
+    hash_algorithm = resolve_hash_algorithm(catalogue, hash_algorithm)
+    print(f"Hashing the files with {hash_algorithm}")
+    manifest = BucketManifest(
+        bucket_name,
+        _storage_prefixes(source_path, subfolder, rendition_options is not None),
+        PhotospherePath(BUCKET_MANIFEST_FILE),
+        manifest_ttl
+    ).load()
+    print(f"Found {len(manifest)} files in bucket {bucket_name}")
+    journal = SyncJournal(PhotospherePath(SYNC_JOURNAL_FILE), bucket_name, resume, hash_algorithm)
+    _commit_pending_records(db, catalogue, journal)
+    engine = None
+    uploader = None
+    if upload_engine == ASYNC_UPLOAD_ENGINE:
+        engine = AsyncUploadEngine(
+            create_gcs_session(upload_concurrency),
+            chunk_size=upload_chunk_size,
+            max_in_flight_bytes=max_in_flight_bytes,
+            concurrency=upload_concurrency
+        ).start()
+        uploader = engine.upload_blob
+
     try:
-        local_db_file = download_file_to_local(CLOUD_DB_JSON_FILE, bucket_name, PhotospherePath(CLOUD_DB_JSON_FILE))
-        db = TinyDB(local_db_file.get_string())
-    except:
-        print(f"Creating new database file {CLOUD_DB_JSON_FILE} in bucket {bucket_name}")
-        db = TinyDB(CLOUD_DB_JSON_FILE)
+        if workers > 1:
+            sync_files_in_parallel(
+                source_path, bucket_name, db, subfolder, workers, upload_concurrency, catalogue, manifest, uploader,
+                journal, hash_algorithm, rendition_options
+            )
+        else:
+            cache = FileStatCache(get_file_cache_path(get_cloud_database_path(catalogue)))
+            try:
+                loop_on_files(
+                    source_path, source_path, bucket_name, db, subfolder, cache, catalogue, manifest, uploader,
+                    journal, hash_algorithm, rendition_options
+                )
+            finally:
+                cache.close()
+        _flush_records(db, catalogue, journal)
+    finally:
+        manifest.save()
+        if engine is not None:
+            engine.close()
+    # every record is committed, a new sync starts from scratch
+    journal.close(remove=True)
+    index = publish_protobuf_shards(db.iterate(), bucket_name)
+    print(f"Published {len(index['shards'])} monthly protobuf shards with {index['count']} files")
+    if legacy_catalogue:
+        upload_blob(db.to_json().get_string(), CLOUD_DB_JSON_FILE, bucket_name)
+        create_protobuf_file_list(db.iterate(), PhotospherePath(CLOUD_DB_PB_FILE))
+        upload_blob(CLOUD_DB_PB_FILE, CLOUD_DB_PB_FILE, bucket_name)
+    db.close()
+
+
+def get_cloud_database_path(catalogue: SegmentedCatalogue) -> PhotospherePath:
+    """
+    :return: the local database of the bucket of the catalogue (CLOUD_DB_JSON_FILE), in the local folder of the
+        catalogue: the records of a bucket never end up in the catalogue of another
+    """
+    return catalogue.local_folder.join(CLOUD_DB_JSON_FILE)
+
+
+def open_cloud_database(bucket_name: str, catalogue: SegmentedCatalogue, db_backend: str) -> PhotosphereDatabase:
+    """
+    Opens the local database of the bucket and adds the records of the cloud catalogue it doesn't have yet.
+    If the bucket has no catalogue, it is created from the json database (photosphere_database_cloud.json).
+    """
+    db_path = get_cloud_database_path(catalogue)
+    records = catalogue.load()
+    if records is None:
+        try:
+            download_file_to_local(CLOUD_DB_JSON_FILE, bucket_name, db_path)
+        except:
+            print(f"Creating new database file {CLOUD_DB_JSON_FILE} in bucket {bucket_name}")
+        db = open_database(db_path, db_backend)
+        print(f"Creating catalogue in bucket {bucket_name} with {len(db)} files")
+        catalogue.append(db.all())
+        return db
+    db = open_database(db_path, db_backend)
+    known_hashes = db.all_hashes()
+    db.insert_multiple([record for record in records if record["hash"] not in known_hashes])
+    return db
+
+
+def resolve_hash_algorithm(catalogue: SegmentedCatalogue, hash_algorithm: str = None) -> str:
+    """
+    The hashes of a catalogue are all of one algorithm, otherwise the same file would be uploaded again:
+    an empty catalogue records the algorithm chosen, the others keep theirs.
+    :param hash_algorithm: the algorithm chosen, None for the one of the catalogue (sha1 for a new one)
+    :return: the algorithm of the sync
+    :raise ValueError: if the catalogue has another algorithm or the algorithm is not installed
+    """
+    catalogue_algorithm = catalogue.get_hash_algorithm()
+    if catalogue_algorithm is None:
+        hash_algorithm = check_hash_algorithm(hash_algorithm or DEFAULT_HASH_ALGORITHM)
+        catalogue.set_hash_algorithm(hash_algorithm)
+        return hash_algorithm
+    if hash_algorithm is not None and hash_algorithm != catalogue_algorithm:
+        raise ValueError(
+            f"The catalogue of bucket {catalogue.bucket_name} has {catalogue_algorithm} hashes, "
+            f"it can't be synced with {hash_algorithm}"
+        )
+    return check_hash_algorithm(catalogue_algorithm)
+
+
+buffer_list = []
+
+THUMBNAILS_FOLDER = 'thumbnails/'
+RENDITIONS_FOLDER = 'renditions/'
+
+def _thumbnail_storage_path(thumbnail_name: str) -> str:
+    return THUMBNAILS_FOLDER + thumbnail_name
+
+def _upload_renditions(
+        renditions: list[dict] | None,
+        bucket_name: str,
+        manifest: BucketManifest = None,
+        uploader: Callable[[str | bytes, str, str], str] = None
+    ) -> list[dict] | None:
+    """
+    :param renditions: the renditions of generate_renditions, None if they are not made
+    :return: the renditions of the record: name, size and uri, smallest first
+    """
+    if renditions is None:
+        return None
+    return [
+        {
+            "name": rendition["name"],
+            "size": rendition["size"],
+            "uri": upload_blob_if_not_exist(
+                rendition["data"], RENDITIONS_FOLDER + rendition["file_name"], bucket_name, manifest, uploader
+            )
+        }
+        for rendition in renditions
+    ]
 
-    loop_on_files(source_path, source_path, bucket_name, db, subfolder)
+def _storage_prefixes(source_path: PhotospherePath, subfolder: str = None, renditions: bool = False) -> list[str]:
+    """
+    :param renditions: the renditions are uploaded too
+    :return: the bucket prefixes where the files of source_path are uploaded (see
+        from_source_directory_to_nested_file_path), '' for the root of the bucket
+    """
+    prefixes = [THUMBNAILS_FOLDER, RENDITIONS_FOLDER] if renditions else [THUMBNAILS_FOLDER]
+    for entry in os.scandir(source_path.get_string()):
+        if entry.is_dir():
+            prefixes.append(entry.name + '/')
+        elif subfolder is not None:
+            prefixes.append(subfolder.rstrip('/') + '/')
+        else:
+            prefixes.append('')
+    return sorted(set(prefixes))
+
+def _flush_records(db: PhotosphereDatabase, catalogue: SegmentedCatalogue, journal: SyncJournal = None):
+    """
+    The catalogue is written first: a record in the catalogue and not in the database is added to the database
+    by open_cloud_database, so a sync killed in the middle doesn't lose it.
+    """
+    if not buffer_list:
+        return
+    catalogue.append(buffer_list)
     db.insert_multiple(buffer_list)
+    if journal is not None:
+        journal.commit(buffer_list)
     buffer_list.clear()
-    upload_blob(CLOUD_DB_JSON_FILE, CLOUD_DB_JSON_FILE, bucket_name)
-    create_protobuf_file_list(db.all(), PhotospherePath(CLOUD_DB_PB_FILE))
-    upload_blob(CLOUD_DB_PB_FILE, CLOUD_DB_PB_FILE, bucket_name)
 
+def _buffer_record(dic: dict, db: PhotosphereDatabase, catalogue: SegmentedCatalogue, journal: SyncJournal = None):
+    buffer_list.append(dic)
+    if len(buffer_list) >= 100:
+        print(f"Uploading {len(buffer_list)} files to the catalogue...")
+        _flush_records(db, catalogue, journal)
 
-buffer_list = []
+def _commit_pending_records(db: PhotosphereDatabase, catalogue: SegmentedCatalogue, journal: SyncJournal):
+    """
+    Commits the records uploaded by a killed sync and not committed yet, the ones already in the catalogue
+    (and so in the database) are only marked as committed.
+    """
+    pending = journal.get_pending_records()
+    if not pending:
+        return
+    journal.commit([record for record in pending if db.contains_hash(record["hash"])])
+    for record in pending:
+        if not db.contains_hash(record["hash"]):
+            _buffer_record(record, db, catalogue, journal)
+    print(f"Committing {len(buffer_list)} files uploaded by the interrupted sync...")
+    _flush_records(db, catalogue, journal)
 
-@loop_on_files_in_folder_decorator
+@loop_on_files_in_folder_decorator(extensions=SUPPORTED_EXTENSIONS)
 def loop_on_files(
         file_path: PhotospherePath,
         source_path: PhotospherePath,
         bucket_name: str,
-        db: TinyDB,
-        subfolder: str = None
+        db: PhotosphereDatabase,
+        subfolder: str = None,
+        cache: FileStatCache = None,
+        catalogue: SegmentedCatalogue = None,
+        manifest: BucketManifest = None,
+        uploader: Callable[[str | bytes, str, str], str] = None,
+        journal: SyncJournal = None,
+        hash_algorithm: str = DEFAULT_HASH_ALGORITHM,
+        rendition_options: RenditionOptions = None
     ):
 
-    hash = PhotosphereFile(file_path).get_hash()
-    if db.contains(Query().hash == hash):
+    steps = journal.get(file_path) if journal is not None else None
+    if steps is not None and steps["state"] not in (HASHED, THUMBNAIL_UPLOADED):
+        # committed, or committed at the start of the sync
+        return
+    hash = steps["hash"] if steps is not None else cached_file_hash(file_path, cache, hash_algorithm)
+    if db.contains_hash(hash):
         return
 
-    if file_path.is_allowed_extension(PhotosphereImage.ALLOWED_EXTENSIONS):
-        ps = PhotosphereImage(file_path)
-        ps.generate_thumbnail()
-        ps.set_thumbnail_bucket_uri(upload_blob_if_not_exist(
-            ps.thumbnail_local_path.get_string(),
-            'thumbnails/' + os.path.basename(ps.thumbnail_local_path.get_string()),
-            bucket_name)
-        )
-    elif file_path.is_allowed_extension(PhotosphereVideo.ALLOWED_EXTENSIONS):
-        ps = PhotosphereVideo(file_path)
-        ps.generate_thumbnail()
-        ps.set_thumbnail_bucket_uri(upload_blob_if_not_exist(
-            ps.thumbnail_local_path.get_string(),
-            'thumbnails/' + os.path.basename(ps.thumbnail_local_path.get_string()),
-            bucket_name))
-    elif file_path.is_allowed_extension(PhotosphereFile.ALLOWED_EXTENSIONS):
-        ps = PhotosphereFile(file_path)
-    else:
+    ps = load_photosphere_file(file_path, cache, hash_algorithm=hash_algorithm)
+    if ps is None:
         return
+    if journal is not None and steps is None:
+        journal.record(file_path.get_string(), HASHED, file_path.get_stat(), hash=hash)
+    if steps is not None and "thumbnail_bucket_uri" in steps:
+        ps.set_thumbnail_bucket_uri(steps["thumbnail_bucket_uri"])
+        ps.set_renditions(steps.get("renditions"))
+    elif isinstance(ps, (PhotosphereImage, PhotosphereVideo)):
+        if rendition_options is not None and isinstance(ps, PhotosphereImage):
+            # before the thumbnail, that resizes the decoded image
+            ps.set_renditions(_upload_renditions(
+                ps.generate_renditions(rendition_options), bucket_name, manifest, uploader
+            ))
+        thumbnail = ps.generate_thumbnail()
+        if thumbnail is not None:
+            ps.set_thumbnail_bucket_uri(upload_blob_if_not_exist(
+                thumbnail,
+                _thumbnail_storage_path(ps.get_thumbnail_name()),
+                bucket_name,
+                manifest,
+                uploader)
+            )
+        if journal is not None:
+            journal.record(
+                file_path.get_string(),
+                THUMBNAIL_UPLOADED,
+                thumbnail_bucket_uri=ps.thumbnail_bucket_uri,
+                renditions=ps.renditions
+            )
 
     storage_path = from_source_directory_to_nested_file_path(source_path.get_string(), file_path.get_string(), subfolder)
-    source_bucket_uri = upload_blob_if_not_exist(file_path.get_string(), storage_path, bucket_name)
+    source_bucket_uri = upload_blob_if_not_exist(
+        file_path.get_string(), storage_path, bucket_name, manifest, uploader
+    )
     ps.set_source_bucket_uri(source_bucket_uri)
+    if journal is not None:
+        journal.record(file_path.get_string(), SOURCE_UPLOADED, record=ps.get_dic())
 
-    if not db.contains(Query().hash == ps.get_hash()):
-        buffer_list.append(ps.get_dic())
-        if len(buffer_list) >= 100:
-            db.insert_multiple(buffer_list)
-            buffer_list.clear()
-            upload_blob(CLOUD_DB_JSON_FILE, CLOUD_DB_JSON_FILE, bucket_name)
-            print(f"Uploading to {storage_path} the database...")
-
+    if not db.contains_hash(ps.get_hash()):
+        _buffer_record(ps.get_dic(), db, catalogue, journal)
     else:
         print(f"Element with bucket_uri {ps.get_source_bucket_uri()} already exists in db, skipping insert.")
 
 
+def sync_files_in_parallel(
+        source_path: PhotospherePath,
+        bucket_name: str,
+        db: PhotosphereDatabase,
+        subfolder: str = None,
+        workers: int = 2,
+        upload_concurrency: int = 4,
+        catalogue: SegmentedCatalogue = None,
+        manifest: BucketManifest = None,
+        uploader: Callable[[str | bytes, str, str], str] = None,
+        journal: SyncJournal = None,
+        hash_algorithm: str = DEFAULT_HASH_ALGORITHM,
+        rendition_options: RenditionOptions = None
+    ):
+    """
+    Same result of loop_on_files, but hashing, metadata and thumbnails run on `workers` processes
+    and the uploads on `upload_concurrency` threads.
+    """
+
+    def upload(analysis: dict, file_path: PhotospherePath) -> dict:
+        dic = analysis["dic"]
+        thumbnail = analysis["thumbnail"]
+        steps = journal.get(file_path) if journal is not None else None
+        if journal is not None and (steps is None or steps["hash"] != dic["hash"]):
+            journal.record(dic["local_file_path"], HASHED, file_path.get_stat(), hash=dic["hash"])
+        if steps is not None and "thumbnail_bucket_uri" in steps:
+            dic["thumbnail_bucket_uri"] = steps["thumbnail_bucket_uri"]
+            dic["renditions"] = steps.get("renditions")
+        elif thumbnail is not None:
+            dic["renditions"] = _upload_renditions(analysis["renditions"], bucket_name, manifest, uploader)
+            dic["thumbnail_bucket_uri"] = upload_blob_if_not_exist(
+                thumbnail,
+                _thumbnail_storage_path(analysis["thumbnail_name"]),
+                bucket_name,
+                manifest,
+                uploader
+            )
+            if journal is not None:
+                journal.record(
+                    dic["local_file_path"],
+                    THUMBNAIL_UPLOADED,
+                    thumbnail_bucket_uri=dic["thumbnail_bucket_uri"],
+                    renditions=dic["renditions"]
+                )
+        storage_path = from_source_directory_to_nested_file_path(
+            source_path.get_string(), dic["local_file_path"], subfolder
+        )
+        dic["source_bucket_uri"] = upload_blob_if_not_exist(
+            dic["local_file_path"], storage_path, bucket_name, manifest, uploader
+        )
+        if journal is not None:
+            journal.record(dic["local_file_path"], SOURCE_UPLOADED, record=dic)
+        return dic
+
+    with tqdm(desc="Syncing files", unit="file") as progress:
+
+        def commit(dic: dict):
+            _buffer_record(dic, db, catalogue, journal)
+            progress.update(1)
+
+        files = list_files_in_folder(source_path, SUPPORTED_EXTENSIONS)
+        if journal is not None:
+            files = (file_path for file_path in files if not journal.is_done(file_path))
+        run_pipeline(
+            files,
+            db.all_hashes(),
+            upload,
+            commit,
+            workers,
+            upload_concurrency,
+            get_file_cache_path(get_cloud_database_path(catalogue)),
+            hash_algorithm,
+            rendition_options
+        )
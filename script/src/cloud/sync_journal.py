@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+
+from src.file.path import PhotospherePath
+from src.local.hashing import DEFAULT_HASH_ALGORITHM
+
+SYNC_JOURNAL_FILE = 'photosphere_sync_journal.jsonl'
+HASHED = 'hashed'
+THUMBNAIL_UPLOADED = 'thumbnail_uploaded'
+SOURCE_UPLOADED = 'source_uploaded'
+COMMITTED = 'committed'
+_STARTED = 'started'
+# steps fsync'd when appended, an upload or a commit is not redone after a crash. The other steps are flushed
+# to the OS, so they survive a killed sync, and are on disk with the next fsync
+_DURABLE_STATES = {SOURCE_UPLOADED, COMMITTED}
+
+
+class SyncJournal:
+    """
+    Write-ahead journal of a sync: one json line for every step done on a file, appended before the step
+    is considered done (fsync'd for the source uploads and the commits), so a killed sync can be resumed
+    from the last step of every file:
+     - hashed: {"path", "hash", "size", "mtime_ns"}, the steps of a file are reused only while size and mtime match
+     - thumbnail_uploaded: {"path", "thumbnail_bucket_uri", "renditions"}
+     - source_uploaded: {"path", "record"}, the record is ready to be committed
+     - committed: {"paths"}, the records are in the catalogue and in the database
+    A line cut by the kill is dropped when the journal is read.
+    """
+
+    def __init__(
+            self,
+            path: PhotospherePath,
+            bucket_name: str,
+            resume: bool = False,
+            hash_algorithm: str = DEFAULT_HASH_ALGORITHM
+        ):
+        """
+        :param path: the journal file
+        :param bucket_name: the bucket of the sync, a journal of another bucket is not resumed
+        :param resume: read the steps of the existing journal, otherwise the journal is started again
+        :param hash_algorithm: algorithm of the hashes, a journal with other hashes is not resumed
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        # path -> merged steps of the file
+        self.entries: dict[str, dict] = {}
+        if resume and path.exists() and self._replay(bucket_name, hash_algorithm):
+            self.file = open(path.get_string(), 'ab')
+        else:
+            self.entries.clear()
+            self.file = open(path.get_string(), 'wb')
+            self._append({"state": _STARTED, "bucket": bucket_name, "hash_algorithm": hash_algorithm})
+
+    def _replay(self, bucket_name: str, hash_algorithm: str) -> bool:
+        """
+        Reads the steps of the journal, the file is truncated after the last complete line.
+        :return: False if the journal is of another bucket or hash algorithm
+        """
+        valid_size = 0
+        with open(self.path.get_string(), 'rb') as f:
+            for line in f:
+                try:
+                    step = json.loads(line)
+                except ValueError:
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                if step["state"] == _STARTED:
+                    if step["bucket"] != bucket_name:
+                        print(f"The sync journal is of bucket {step['bucket']}, starting a new sync")
+                        return False
+                    if step.get("hash_algorithm", DEFAULT_HASH_ALGORITHM) != hash_algorithm:
+                        print(f"The sync journal has {step.get('hash_algorithm', DEFAULT_HASH_ALGORITHM)} hashes, "
+                              f"starting a new sync")
+                        return False
+                else:
+                    self._merge(step)
+                valid_size += len(line)
+        if valid_size == 0:
+            return False
+        os.truncate(self.path.get_string(), valid_size)
+        print(f"Resuming the sync of {len(self.entries)} files from {self.path.get_string()}")
+        return True
+
+    def _merge(self, step: dict) -> None:
+        if step["state"] == COMMITTED:
+            for path in step["paths"]:
+                self.entries.setdefault(path, {})["state"] = COMMITTED
+            return
+        entry = self.entries.get(step["path"])
+        if step["state"] == HASHED or entry is None:
+            entry = self.entries[step["path"]] = {}
+        entry.update({key: value for key, value in step.items() if key != "path"})
+
+    def _append(self, step: dict) -> None:
+        """
+        The step survives a kill of the process when this returns, and a crash of the system
+        if it is a source upload or a commit.
+        """
+        self.file.write(json.dumps(step).encode('utf-8') + b'\n')
+        self.file.flush()
+        if step["state"] in _DURABLE_STATES:
+            os.fsync(self.file.fileno())
+
+    def record(self, file_path: str, state: str, stat=None, **values) -> None:
+        """
+        :param file_path: local path of the file
+        :param state: HASHED (with hash), THUMBNAIL_UPLOADED (with thumbnail_bucket_uri and renditions)
+            or SOURCE_UPLOADED (with record)
+        :param stat: the stat of the hashed file (see PhotospherePath.get_stat), None to read it
+        """
+        step = {"path": file_path, "state": state, **values}
+        if state == HASHED:
+            stat = stat if stat is not None else os.stat(file_path)
+            step.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+        with self.lock:
+            self._append(step)
+            self._merge(step)
+
+    def commit(self, records: list[dict]) -> None:
+        """
+        Marks the records (of record or of get_pending_records) as in the catalogue and in the database.
+        """
+        if not records:
+            return
+        step = {"state": COMMITTED, "paths": [record["local_file_path"] for record in records]}
+        with self.lock:
+            self._append(step)
+            self._merge(step)
+
+    def get(self, file_path: PhotospherePath) -> dict | None:
+        """
+        :return: the steps done on the file ("state" is the last one), None if there are none
+            or the file changed since it was hashed
+        """
+        with self.lock:
+            entry = self.entries.get(file_path.get_string())
+        if entry is None:
+            return None
+        stat = file_path.get_stat()
+        if entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns:
+            return None
+        return entry
+
+    def is_done(self, file_path: PhotospherePath) -> bool:
+        """
+        :return: True if the record of the file is committed or waiting to be committed
+        """
+        entry = self.get(file_path)
+        return entry is not None and entry["state"] in (SOURCE_UPLOADED, COMMITTED)
+
+    def get_pending_records(self) -> list[dict]:
+        """
+        :return: the records uploaded but not committed, in journal order
+        """
+        with self.lock:
+            return [entry["record"] for entry in self.entries.values() if entry["state"] == SOURCE_UPLOADED]
+
+    def close(self, remove: bool = False) -> None:
+        """
+        :param remove: delete the journal, the sync is complete
+        """
+        self.file.close()
+        if remove:
+            self.path.remove()
@@ -0,0 +1,146 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Iterable
+
+from src.file.image.image import PhotosphereImage
+from src.file.image.rendition import RenditionOptions
+from src.file.local_file import PhotosphereFile
+from src.file.path import PhotospherePath
+from src.local.file_cache import FileStatCache, cached_file_hash, load_photosphere_file
+from src.local.hashing import DEFAULT_HASH_ALGORITHM
+from src.util import profiling
+
+# Hashes already present in the database and file cache of the worker process, set by the pool initializer
+_known_hashes: frozenset[str] = frozenset()
+_cache: FileStatCache | None = None
+_hash_algorithm: str = DEFAULT_HASH_ALGORITHM
+_rendition_options: RenditionOptions | None = None
+
+
+def _init_analyzer(
+        known_hashes: frozenset[str],
+        cache_path: PhotospherePath | None,
+        hash_algorithm: str,
+        profiling_options: dict | None = None,
+        rendition_options: RenditionOptions | None = None
+    ):
+    global _known_hashes, _cache, _hash_algorithm, _rendition_options
+    _known_hashes = known_hashes
+    _cache = FileStatCache(cache_path) if cache_path is not None else None
+    _hash_algorithm = hash_algorithm
+    _rendition_options = rendition_options
+    if profiling_options is not None:
+        profiling.enable(**profiling_options)
+
+
+def analyze_file(file_path: str, stat=None) -> dict | None:
+    """
+    Runs the CPU bound part of the sync on one file (hash, metadata, average hash, renditions and thumbnail).
+    It is executed in a worker process, so it only returns plain picklable data.
+    :param file_path: local file path
+    :param stat: the stat of the file read while listing its folder (see PhotospherePath), None to read it
+    :return: None if the file is not supported or already in the database, otherwise a dict with
+        the database record ("dic"), the JPEG thumbnail ("thumbnail", None if there is no thumbnail), its file name
+        in the bucket ("thumbnail_name") and the renditions of an image ("renditions", see generate_renditions,
+        None if they are not made)
+    """
+    path = PhotospherePath(file_path, stat)
+    if cached_file_hash(path, _cache, _hash_algorithm) in _known_hashes:
+        return None
+
+    ps = load_photosphere_file(path, _cache, hash_algorithm=_hash_algorithm)
+    if ps is None:
+        return None
+    renditions = None
+    if _rendition_options is not None and isinstance(ps, PhotosphereImage):
+        # before the thumbnail, that resizes the decoded image
+        renditions = ps.generate_renditions(_rendition_options)
+    thumbnail = ps.generate_thumbnail() if type(ps) is not PhotosphereFile else None
+    return {
+        "dic": ps.get_dic(),
+        "thumbnail": thumbnail,
+        "thumbnail_name": ps.get_thumbnail_name(),
+        "renditions": renditions
+    }
+
+
+def _analyze_file_profiled(file_path: str, stat=None) -> tuple[dict | None, dict]:
+    """
+    analyze_file and the spans recorded by the worker process while analyzing the file
+    """
+    return analyze_file(file_path, stat), profiling.drain()
+
+
+def run_pipeline(
+        files: Iterable[PhotospherePath],
+        known_hashes: set[str],
+        upload: Callable[[dict, PhotospherePath], dict],
+        commit: Callable[[dict], None],
+        workers: int,
+        upload_concurrency: int,
+        cache_path: PhotospherePath | None = None,
+        hash_algorithm: str = DEFAULT_HASH_ALGORITHM,
+        rendition_options: RenditionOptions | None = None
+    ):
+    """
+    Staged sync pipeline: files are analyzed by `analyze_file` on a process pool, then uploaded on a thread pool.
+    Both stages are bounded, the walk stops submitting new files while either stage is full.
+    Records are committed in the main thread and in the same order of `files`, so the database
+    is the same the serial loop would produce.
+    :param files: files to sync, in walk order
+    :param known_hashes: hashes already in the database, they are skipped
+    :param upload: called in a thread with the result of `analyze_file` and the file, returns the record to commit
+    :param commit: called in the main thread with each record to persist
+    :param workers: number of analyzer processes
+    :param upload_concurrency: number of upload threads
+    :param cache_path: FileStatCache used by the analyzer processes, None to disable it
+    :param hash_algorithm: algorithm of the file hashes, the one of known_hashes
+    :param rendition_options: renditions made by the analyzer processes, None to make only the thumbnails
+    """
+    max_analyses = workers * 2
+    max_uploads = upload_concurrency * 2
+    # index of the first file (in walk order) for each new hash, later duplicates are not committed
+    hash_owners = {}
+    analyses = {}
+    uploads = {}
+    results = {}
+    next_commit = 0
+    # the spans of the analyzer processes are sent back with every analysis
+    profiling_options = profiling.get_options()
+    analyze = analyze_file if profiling_options is None else _analyze_file_profiled
+
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_analyzer,
+            initargs=(frozenset(known_hashes), cache_path, hash_algorithm, profiling_options, rendition_options)
+    ) as analyzer_pool, ThreadPoolExecutor(max_workers=upload_concurrency) as upload_pool:
+
+        def step():
+            nonlocal next_commit
+            done, _ = wait(list(analyses) + list(uploads), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in analyses:
+                    index, file_path = analyses.pop(future)
+                    analysis = future.result()
+                    if profiling_options is not None:
+                        analysis, spans = analysis
+                        profiling.merge(spans)
+                    hash = analysis["dic"]["hash"] if analysis is not None else None
+                    if analysis is None or hash in known_hashes or hash_owners.get(hash, index) < index:
+                        results[index] = None
+                    else:
+                        hash_owners[hash] = index
+                        uploads[upload_pool.submit(upload, analysis, file_path)] = index
+                else:
+                    results[uploads.pop(future)] = future.result()
+            while next_commit in results:
+                record = results.pop(next_commit)
+                if record is not None and hash_owners[record["hash"]] == next_commit:
+                    commit(record)
+                next_commit += 1
+
+        for index, file_path in enumerate(files):
+            analyses[analyzer_pool.submit(analyze, file_path.get_string(), file_path.stat)] = index, file_path
+            while len(analyses) >= max_analyses or len(uploads) >= max_uploads:
+                step()
+        while analyses or uploads:
+            step()
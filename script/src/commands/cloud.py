@@ -0,0 +1,158 @@
+"""
+Commands on the bucket. The Firebase Admin SDK is imported and initialized when a command runs, see LAZY_COMMANDS
+in src.main.
+"""
+from pathlib import Path
+
+import click
+
+from src.cloud.bucket.upload_engine import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_IN_FLIGHT_BYTES, FIREBASE_UPLOAD_ENGINE, \
+    UPLOAD_ENGINES
+from src.commands.local import check_hash_algorithm_option
+from src.database.utils import DATABASE_BACKENDS, TINYDB_BACKEND
+from src.file.image.rendition import RENDITION_FORMATS, DEFAULT_RENDITION_FORMAT, DEFAULT_RENDITION_QUALITY, \
+    RENDITION_SIZES, RenditionOptions
+from src.file.path import PhotospherePath
+from src.local.hashing import HASH_ALGORITHMS
+
+
+# create a command called "sync-in-cloud" that will copy files in the cloud and save all references in a CSV file
+@click.command('sync-in-cloud')
+@click.option('--source', required=True,
+              type=click.Path(
+                  exists=True,
+                  dir_okay=True,
+                  readable=True,
+                  resolve_path=True
+              ),
+              help='Source directory from where the photos will be taken.'
+              )
+@click.option('--bucket', required=True,
+              type=str,
+              help='Name of the bucket where the files will be uploaded.'
+              )
+@click.option(
+    '--subfolder',
+    required=False,
+    type=str,
+    help='Subfolder in the bucket where the files will be uploaded (if source is "result" will be ignored)'
+)
+@click.option('--workers', default=1, show_default=True,
+              type=click.IntRange(min=1),
+              help='Number of processes used to hash files and generate thumbnails (1 = sequential sync).'
+              )
+@click.option('--upload-concurrency', default=4, show_default=True,
+              type=click.IntRange(min=1),
+              help='Number of parallel uploads, used when --workers is greater than 1.'
+              )
+@click.option('--db-backend', default=TINYDB_BACKEND, show_default=True,
+              type=click.Choice(DATABASE_BACKENDS),
+              help='Database backend: tinydb (json file) or sqlite (indexed, imports and exports the json file).'
+              )
+@click.option('--legacy-catalogue/--no-legacy-catalogue', default=True, show_default=True,
+              help='Upload also the full database (photosphere_database_cloud.json/.pb) at the end of the sync.'
+              )
+@click.option('--manifest-ttl', default=0, show_default=True,
+              type=click.FloatRange(min=0),
+              help='Seconds the bucket file listing saved in photosphere_bucket_manifest.json is reused '
+                   '(0 = list the bucket at every sync).'
+              )
+@click.option('--upload-engine', default=FIREBASE_UPLOAD_ENGINE, show_default=True,
+              type=click.Choice(UPLOAD_ENGINES),
+              help='firebase (one request per file) or async (pooled connections, resumable chunked uploads, '
+                   'retries with backoff).'
+              )
+@click.option('--upload-chunk-size', default=DEFAULT_CHUNK_SIZE // (1024 * 1024), show_default=True,
+              type=click.IntRange(min=1),
+              help='Chunk size in MiB of the resumable uploads of the async engine, larger files are sent in chunks.'
+              )
+@click.option('--max-in-flight', default=DEFAULT_MAX_IN_FLIGHT_BYTES // (1024 * 1024), show_default=True,
+              type=click.IntRange(min=1),
+              help='Max MiB read and sent at the same time by the async engine.'
+              )
+@click.option('--resume', is_flag=True, default=False,
+              help='Continue an interrupted sync from its journal (photosphere_sync_journal.jsonl): '
+                   'the files already hashed, uploaded or committed are not processed again.'
+              )
+@click.option('--hash-algorithm', default=None,
+              type=click.Choice(HASH_ALGORITHMS),
+              help='Algorithm of the file hashes of a new catalogue (default sha1), blake3 and xxh3_128 are faster '
+                   'and need the fast-hash extra (pip install "photosphere[fast-hash]"). '
+                   'An existing catalogue keeps its algorithm.'
+              )
+@click.option('--renditions', default=None,
+              type=str,
+              help='Comma separated renditions of the images uploaded besides the thumbnail and recorded in the '
+                   'catalogue: ' + ', '.join(f'{name} ({size} px)' for name, size in RENDITION_SIZES.items()) +
+                   '. None by default.'
+              )
+@click.option('--rendition-format', default=DEFAULT_RENDITION_FORMAT, show_default=True,
+              type=click.Choice(RENDITION_FORMATS),
+              help='Format of the renditions, avif needs Pillow built with libavif.'
+              )
+@click.option('--rendition-quality', default=DEFAULT_RENDITION_QUALITY, show_default=True,
+              type=click.IntRange(min=1, max=100),
+              help='Quality of the renditions.'
+              )
+def sync_in_cloud(
+        source: Path,
+        bucket: str,
+        subfolder: str = None,
+        workers: int = 1,
+        upload_concurrency: int = 4,
+        db_backend: str = TINYDB_BACKEND,
+        legacy_catalogue: bool = True,
+        manifest_ttl: float = 0,
+        upload_engine: str = FIREBASE_UPLOAD_ENGINE,
+        upload_chunk_size: int = DEFAULT_CHUNK_SIZE // (1024 * 1024),
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT_BYTES // (1024 * 1024),
+        resume: bool = False,
+        hash_algorithm: str = None,
+        renditions: str = None,
+        rendition_format: str = DEFAULT_RENDITION_FORMAT,
+        rendition_quality: int = DEFAULT_RENDITION_QUALITY
+    ):
+    """ Copy the photos and videos in a bucket and update the catalogue """
+
+    print('Syncing files in the cloud from {}'.format(source))
+    print('Uploading files to bucket {}'.format(bucket))
+    if subfolder is not None: print('Uploading files in subfolder {}'.format(subfolder))
+
+    from src.cloud.sync_in_cloud import copy_in_cloud
+
+    check_hash_algorithm_option(hash_algorithm)
+    rendition_options = get_rendition_options(renditions, rendition_format, rendition_quality)
+    copy_in_cloud(
+        PhotospherePath(source),
+        bucket,
+        subfolder,
+        workers,
+        upload_concurrency,
+        db_backend,
+        legacy_catalogue,
+        manifest_ttl,
+        upload_engine,
+        upload_chunk_size * 1024 * 1024,
+        max_in_flight * 1024 * 1024,
+        resume,
+        hash_algorithm,
+        rendition_options
+    )
+
+
+def get_rendition_options(
+        renditions: str | None,
+        rendition_format: str,
+        rendition_quality: int
+    ) -> RenditionOptions | None:
+    """
+    :param renditions: comma separated rendition names, None to make only the thumbnails
+    """
+    if renditions is None:
+        return None
+    try:
+        return RenditionOptions(
+            [name.strip() for name in renditions.split(',') if name.strip()], rendition_format, rendition_quality
+        )
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--renditions/--rendition-format')
@@ -0,0 +1,242 @@
+"""
+Commands on the databases, see LAZY_COMMANDS in src.main.
+"""
+import json
+import time
+from pathlib import Path
+
+import click
+
+from src.file.path import PhotospherePath
+from src.gps.batch import MAX_PRECISION
+from src.gps.spatial_index import DEFAULT_CELL_PRECISION
+from src.local.duplicates import DEFAULT_MAX_DISTANCE
+
+
+@click.command('find-duplicates')
+@click.option('--source', required=True,
+                type=click.Path(
+                    exists=True,
+                    dir_okay=False,
+                    readable=True,
+                    resolve_path=True
+                ),
+                help='Database file in TinyDB (json) format, or a .sqlite database.'
+                )
+@click.option('--distance', default=DEFAULT_MAX_DISTANCE, show_default=True,
+                type=click.IntRange(min=0),
+                help='Max number of different bits between the average hashes of two near duplicates.'
+                )
+@click.option('--out', required=False,
+                type=click.Path(
+                    dir_okay=False,
+                    resolve_path=True
+                ),
+                help='Json file where the clusters of near duplicates are written.'
+                )
+def find_duplicates(source: Path, distance: int = DEFAULT_MAX_DISTANCE, out: Path = None):
+    """ Find the near duplicate photos and videos of a database by their average hash """
+
+    from src.local.duplicates import find_duplicates as find_near_duplicates
+
+    print('Searching near duplicates in {}'.format(source))
+    start = time.perf_counter()
+    clusters = find_near_duplicates(PhotospherePath(source), distance, PhotospherePath(out) if out else None)
+    elapsed = time.perf_counter() - start
+    for cluster in clusters:
+        print('\n'.join(['---'] + [record.get('local_file_path') or record.get('hash') for record in cluster]))
+    print('Found {} clusters with {} files in {:.2f}s'.format(
+        len(clusters), sum(len(cluster) for cluster in clusters), elapsed
+    ))
+
+
+def _parse_floats(value: str | None, count: int, option: str) -> list[float] | None:
+    if value is None:
+        return None
+    try:
+        numbers = [float(number) for number in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count:
+        raise click.BadParameter(f'expected {count} comma separated numbers', param_hint=option)
+    return numbers
+
+
+@click.command('query')
+@click.option('--source', required=True,
+                type=click.Path(
+                    exists=True,
+                    dir_okay=False,
+                    readable=True,
+                    resolve_path=True
+                ),
+                help='Database file in TinyDB (json) format, or a .sqlite database.'
+                )
+@click.option('--bbox', required=False, type=str,
+                help='Box min_lat,min_lon,max_lat,max_lon (min_lon greater than max_lon crosses the antimeridian).'
+                )
+@click.option('--near', required=False, type=str,
+                help='Position lat,lon, the files within --radius are returned, the nearest first.'
+                )
+@click.option('--radius', default=1000, show_default=True,
+                type=click.FloatRange(min=0),
+                help='Radius in meters of --near.'
+                )
+@click.option('--out', required=False,
+                type=click.Path(
+                    dir_okay=False,
+                    resolve_path=True
+                ),
+                help='Json file where the records found are written.'
+                )
+@click.option('--cell-counts', required=False,
+                type=click.Path(
+                    dir_okay=False,
+                    resolve_path=True
+                ),
+                help='Json file where the number of files of every geohash cell is written.'
+                )
+@click.option('--cell-precision', default=DEFAULT_CELL_PRECISION, show_default=True,
+                type=click.IntRange(min=1, max=MAX_PRECISION),
+                help='Geohash length of the cells of --cell-counts.'
+                )
+def query(
+        source: Path,
+        bbox: str = None,
+        near: str = None,
+        radius: float = 1000,
+        out: Path = None,
+        cell_counts: Path = None,
+        cell_precision: int = DEFAULT_CELL_PRECISION
+    ):
+    """ Find the photos and videos taken in a box or near a position """
+
+    from src.gps.spatial_index import load_spatial_index
+
+    box = _parse_floats(bbox, 4, '--bbox')
+    position = _parse_floats(near, 2, '--near')
+    if (box is None) == (position is None) and (box is not None or cell_counts is None):
+        raise click.UsageError('Use one of --bbox and --near, or only --cell-counts')
+
+    start = time.perf_counter()
+    index = load_spatial_index(PhotospherePath(source))
+    print('Indexed {} files with a position in {:.2f}s'.format(len(index), time.perf_counter() - start))
+    if cell_counts:
+        cells = index.export_cell_counts(PhotospherePath(cell_counts), cell_precision)
+        print('Written {} cells in {}'.format(cells, cell_counts))
+    if box is None and position is None:
+        return
+
+    start = time.perf_counter()
+    if box is not None:
+        records = index.query_bbox(*box)
+    else:
+        found = index.query_near(position[0], position[1], radius)
+        records = [dict(record, distance=round(distance, 1)) for record, distance in found]
+    elapsed = time.perf_counter() - start
+    for record in records:
+        print(record.get('local_file_path') or record.get('hash'))
+    print('Found {} files in {:.4f}s'.format(len(records), elapsed))
+    if out:
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(records, f, indent=2)
+
+
+@click.command('convert-db-to-protobuf')
+@click.option('--source', required=True,
+                type=click.Path(
+                    exists=True,
+                    dir_okay=False,
+                    readable=True,
+                    resolve_path=True
+                ),
+                help='Source database file in TinyDB (json) format, or a .sqlite database.'
+                )
+@click.option('--out', required=True,
+                type=click.Path(
+                    exists=False,
+                    dir_okay=False,
+                    readable=True,
+                    resolve_path=True
+                ),
+                help='Output protobuf file.'
+                )
+# CATALOGUE_FORMATS of src.protobuf.converter, not imported by --help
+@click.option('--format', 'catalogue_format', default='v1',
+                type=click.Choice(['v1', 'v2']),
+                help='v1 (default): PhotosphereFile messages. v2: compact catalogue with a header of uri prefixes, '
+                     'bytes hashes, packed geohashes and delta timestamps.'
+                )
+def convert_db_to_protobuf(source: Path, out: Path, catalogue_format: str = 'v1'):
+    """ Convert TinyDB database to Protobuf file format """
+
+    from src.protobuf.converter import create_protobuf_file_list, create_compact_file_list, CATALOGUE_V2
+    from src.database.utils import open_database_file
+
+    print('Loading database from {}'.format(source))
+    db = open_database_file(PhotospherePath(source))
+    print('Creating {} protobuf file at {}'.format(catalogue_format, out))
+    start = time.perf_counter()
+    create = create_compact_file_list if catalogue_format == CATALOGUE_V2 else create_protobuf_file_list
+    count = create(db.iterate(), PhotospherePath(out))
+    elapsed = time.perf_counter() - start
+    print('Converted {} records in {:.2f}s ({:.0f} records/s)'.format(count, elapsed, count / elapsed if elapsed else 0))
+    db.close()
+
+
+@click.command('import-tinydb')
+@click.option('--source', required=True,
+                type=click.Path(
+                    exists=True,
+                    dir_okay=False,
+                    readable=True,
+                    resolve_path=True
+                ),
+                help='Source database file in TinyDB (json) format.'
+                )
+@click.option('--out', required=True,
+                type=click.Path(
+                    dir_okay=False,
+                    resolve_path=True
+                ),
+                help='SQLite database file, created if it does not exist.'
+                )
+def import_tinydb(source: Path, out: Path):
+    """ Import a TinyDB database in a SQLite database """
+
+    from src.database.photosphere_database import import_tinydb_json
+    from src.database.sqlite_database import SQLitePhotosphereDatabase
+
+    db = SQLitePhotosphereDatabase(PhotospherePath(out))
+    count = import_tinydb_json(PhotospherePath(source), db)
+    print('Imported {} records from {} in {} ({} records)'.format(count, source, out, len(db)))
+    db.close()
+
+
+@click.command('export-tinydb')
+@click.option('--source', required=True,
+                type=click.Path(
+                    exists=True,
+                    dir_okay=False,
+                    readable=True,
+                    resolve_path=True
+                ),
+                help='Source SQLite database file.'
+                )
+@click.option('--out', required=True,
+                type=click.Path(
+                    dir_okay=False,
+                    resolve_path=True
+                ),
+                help='TinyDB (json) file, overwritten.'
+                )
+def export_tinydb(source: Path, out: Path):
+    """ Export a SQLite database in TinyDB format """
+
+    from src.database.photosphere_database import export_tinydb_json
+    from src.database.sqlite_database import SQLitePhotosphereDatabase
+
+    db = SQLitePhotosphereDatabase(PhotospherePath(source))
+    count = export_tinydb_json(db, PhotospherePath(out))
+    print('Exported {} records from {} in {}'.format(count, source, out))
+    db.close()
@@ -0,0 +1,93 @@
+"""
+Commands on the local folders. The modules of the files analysis (PIL, imagehash, ffmpeg) are imported when a
+command runs, see LAZY_COMMANDS in src.main.
+"""
+from pathlib import Path
+
+import click
+
+from src.database.utils import DATABASE_BACKENDS, TINYDB_BACKEND
+from src.file.path import PhotospherePath
+from src.local.file_transfer import COPY_MODE, TRANSFER_MODES
+from src.local.hashing import HASH_ALGORITHMS, check_hash_algorithm
+
+
+@click.command("organize")
+@click.option('--source', required=True,
+              type=click.Path(
+                  exists=True,
+                  dir_okay=True,
+                  readable=True,
+                  resolve_path=True
+              ),
+              help='Source directory from where the photos will be taken.')
+@click.option('--out', required=True,
+              type=click.Path(
+                  resolve_path=True,
+                  writable=True
+              ),
+              help='Destination directory where the photos will be moved.')
+@click.option('--mode', default=COPY_MODE, show_default=True,
+              type=click.Choice(TRANSFER_MODES),
+              help='copy, move, hardlink or reflink (copy on write clone) the files, a hardlink or reflink that is not '
+                   'possible for a file (another filesystem, no support) falls back to a copy.')
+def organize(source: Path, out: Path, mode: str = COPY_MODE):
+
+    """Organize the photos in the directory according to the date and time of the photo taken."""
+
+    print('Organizing photos in {}'.format(source))
+    print('Moving photos to {}'.format(out))
+
+    from src.local.organize_files import organize_all_files
+
+    organize_all_files(PhotospherePath(source), PhotospherePath(out), mode)
+
+
+@click.command('generate')
+@click.option('--source', required=True,
+              type=click.Path(
+                  exists=True,
+                  dir_okay=True,
+                  readable=True,
+                  resolve_path=True
+              ),
+              help='Source directory from where the photos will be taken.'
+              )
+@click.option('--out', required=True,
+              type=click.Path(
+                  exists=False,
+                  dir_okay=True,
+                  readable=True,
+                  resolve_path=True
+              ),
+              help='Generate CSV file of all files in the direcory'
+              )
+@click.option('--db-backend', default=TINYDB_BACKEND, show_default=True,
+              type=click.Choice(DATABASE_BACKENDS),
+              help='Database backend: tinydb (json file) or sqlite (indexed, imports and exports the json file).'
+              )
+@click.option('--hash-algorithm', default=None,
+              type=click.Choice(HASH_ALGORITHMS),
+              help='Algorithm of the file hashes of a new database (default sha1), blake3 and xxh3_128 are faster '
+                   'and need the fast-hash extra (pip install "photosphere[fast-hash]"). '
+                   'An existing database keeps its algorithm.'
+              )
+def generate(source: Path, out: Path, db_backend: str = TINYDB_BACKEND, hash_algorithm: str = None):
+    """ Create CSV database of files in this directory """
+
+    print('Generating database from {}'.format(source))
+    print('Outputting database to {}'.format(out))
+
+    from src.local.generate_local_database import generate_local_database
+
+    check_hash_algorithm_option(hash_algorithm)
+    generate_local_database(PhotospherePath(source), PhotospherePath(out), db_backend, hash_algorithm)
+
+
+def check_hash_algorithm_option(hash_algorithm: str | None):
+    if hash_algorithm is None:
+        return
+    try:
+        check_hash_algorithm(hash_algorithm)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--hash-algorithm')
@@ -0,0 +1,136 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Iterator
+from src.file.path import PhotospherePath
+
+# TinyDB table of the metadata of the database, documents {"key", "value"}
+METADATA_TABLE = 'metadata'
+# metadata key of the algorithm of the hashes of the records
+HASH_ALGORITHM_KEY = 'hash_algorithm'
+# metadata key of the version of the video average hashes of the records, see VIDEO_HASH_VERSION
+VIDEO_HASH_VERSION_KEY = 'video_hash_version'
+# metadata kept by the TinyDB json exports and imports
+EXPORTED_METADATA_KEYS = [HASH_ALGORITHM_KEY, VIDEO_HASH_VERSION_KEY]
+
+
+class PhotosphereDatabase(ABC):
+    """
+    Storage of the PhotosphereFile records (the dict returned by PhotosphereFile.get_dic).
+    The TinyDB json format is the interchange format between backends, the cloud database is always
+    uploaded as json.
+    """
+
+    @abstractmethod
+    def insert(self, dic: dict) -> None:
+        ...
+
+    @abstractmethod
+    def insert_multiple(self, dics: list[dict]) -> None:
+        ...
+
+    @abstractmethod
+    def contains_hash(self, hash: str) -> bool:
+        ...
+
+    @abstractmethod
+    def all_hashes(self) -> set[str]:
+        ...
+
+    @abstractmethod
+    def all(self) -> list[dict]:
+        """
+        :return: all the records, in insertion order
+        """
+
+    def iterate(self) -> Iterator[dict]:
+        """
+        :return: all the records, in insertion order, read in batches when the backend allows it
+        """
+        return iter(self.all())
+
+    @abstractmethod
+    def get_metadata(self, key: str) -> str | None:
+        """
+        :return: the value of the metadata, None if it is not set
+        """
+
+    @abstractmethod
+    def set_metadata(self, key: str, value: str) -> None:
+        ...
+
+    @abstractmethod
+    def to_json(self) -> PhotospherePath:
+        """
+        :return: path of an up to date TinyDB json file with all the records
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+def import_tinydb_json(json_path: PhotospherePath, db: PhotosphereDatabase) -> int:
+    """
+    :param json_path: TinyDB json file
+    :param db: the database where the records (and the EXPORTED_METADATA_KEYS) are inserted
+    :return: number of records read from the json file
+    """
+    with open(json_path.get_string(), 'r', encoding='utf-8') as f:
+        content = f.read()
+    if not content.strip():
+        return 0
+    tables = json.loads(content)
+    table = tables.get("_default", {})
+    documents = [table[doc_id] for doc_id in sorted(table, key=int)]
+    db.insert_multiple(documents)
+    for document in tables.get(METADATA_TABLE, {}).values():
+        if document["key"] in EXPORTED_METADATA_KEYS:
+            db.set_metadata(document["key"], document["value"])
+    return len(documents)
+
+
+def check_video_hash_version(db: PhotosphereDatabase, version: str, name: str) -> None:
+    """
+    The video average hashes of a database are all of one version, otherwise find-duplicates would compare hashes
+    that are not comparable: a database without video hashes records the version, the others must have it.
+    :param db: the database where video records are going to be inserted
+    :param version: the version of the new video hashes, VIDEO_HASH_VERSION
+    :param name: the database in the error message
+    :raise ValueError: if the database has video hashes of another version, or of a version it didn't record
+        (made before the version was recorded)
+    """
+    db_version = db.get_metadata(VIDEO_HASH_VERSION_KEY)
+    if db_version is None:
+        if any(record.get("file_type") == "VIDEO" and record.get("average_hash") for record in db.iterate()):
+            raise ValueError(
+                f"{name} has video hashes of an older version, they can't be compared with the ones of the new videos"
+            )
+        db.set_metadata(VIDEO_HASH_VERSION_KEY, version)
+    elif db_version != version:
+        raise ValueError(
+            f"{name} has video hashes of version {db_version}, they can't be compared with the version {version} "
+            f"hashes of the new videos"
+        )
+
+
+def export_tinydb_json(db: PhotosphereDatabase, json_path: PhotospherePath) -> int:
+    """
+    Writes all the records of the database in a TinyDB json file, with the same document ids TinyDB would give,
+    and the EXPORTED_METADATA_KEYS set in the metadata table.
+    :param db: the database to export
+    :param json_path: TinyDB json file, overwritten
+    :return: number of exported records
+    """
+    documents = db.all()
+    tables = {"_default": {str(doc_id): document for doc_id, document in enumerate(documents, start=1)}}
+    metadata = [{"key": key, "value": db.get_metadata(key)} for key in EXPORTED_METADATA_KEYS]
+    metadata = [document for document in metadata if document["value"] is not None]
+    if metadata:
+        tables[METADATA_TABLE] = {str(doc_id): document for doc_id, document in enumerate(metadata, start=1)}
+    with open(json_path.get_string(), 'w', encoding='utf-8') as f:
+        json.dump(tables, f)
+    return len(documents)
@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+from typing import Iterator
+
+from src.database.photosphere_database import PhotosphereDatabase, export_tinydb_json
+from src.file.path import PhotospherePath
+from src.util.profiling import span
+
+# metadata key of the mtime (ns) of the json file when its records were last in the database
+JSON_MTIME_NS_KEY = 'json_mtime_ns'
+
+
+class SQLitePhotosphereDatabase(PhotosphereDatabase):
+    """
+    SQLite (WAL) database, the full record is stored as json and the fields used for lookups
+    are indexed columns: hash (unique), average_hash and created_at_timestamp.
+    """
+
+    def __init__(self, path: PhotospherePath, json_path: PhotospherePath = None):
+        """
+        :param path: the sqlite file
+        :param json_path: where to_json exports the records, default is path with .json suffix
+        """
+        self.path = path
+        self.json_path = json_path or PhotospherePath(path.path.with_suffix(".json"))
+        self.connection = sqlite3.connect(path.get_string())
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS photosphere_file (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                hash TEXT NOT NULL,
+                average_hash TEXT,
+                created_at_timestamp INTEGER,
+                document TEXT NOT NULL
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS photosphere_file_hash ON photosphere_file (hash);
+            CREATE INDEX IF NOT EXISTS photosphere_file_average_hash ON photosphere_file (average_hash);
+            CREATE INDEX IF NOT EXISTS photosphere_file_created_at_timestamp ON photosphere_file (created_at_timestamp);
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self.connection.commit()
+
+    def insert(self, dic: dict) -> None:
+        self.insert_multiple([dic])
+
+    def insert_multiple(self, dics: list[dict]) -> None:
+        """
+        Records with a hash already in the database are ignored.
+        """
+        with span("db.sqlite.write"), self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO photosphere_file (hash, average_hash, created_at_timestamp, document) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (dic["hash"], dic.get("average_hash"), dic.get("created_at_timestamp"), json.dumps(dic))
+                    for dic in dics
+                ]
+            )
+
+    def contains_hash(self, hash: str) -> bool:
+        row = self.connection.execute("SELECT 1 FROM photosphere_file WHERE hash = ?", (hash,)).fetchone()
+        return row is not None
+
+    def all_hashes(self) -> set[str]:
+        return {row[0] for row in self.connection.execute("SELECT hash FROM photosphere_file")}
+
+    def all(self) -> list[dict]:
+        return [json.loads(row[0]) for row in self.connection.execute("SELECT document FROM photosphere_file ORDER BY id")]
+
+    def iterate(self, batch_size: int = 10000) -> Iterator[dict]:
+        cursor = self.connection.execute("SELECT document FROM photosphere_file ORDER BY id")
+        while rows := cursor.fetchmany(batch_size):
+            for row in rows:
+                yield json.loads(row[0])
+
+    def get_metadata(self, key: str) -> str | None:
+        row = self.connection.execute("SELECT value FROM metadata WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def set_metadata(self, key: str, value: str) -> None:
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (key, value))
+
+    def is_json_imported(self) -> bool:
+        """
+        :return: True if the json file doesn't exist, or didn't change since it was imported or exported
+        """
+        if not self.json_path.exists():
+            return True
+        imported = self.get_metadata(JSON_MTIME_NS_KEY)
+        return imported is not None and os.stat(self.json_path.get_string()).st_mtime_ns <= int(imported)
+
+    def set_json_imported(self) -> None:
+        """
+        Records that the records of the json file are in the database, see is_json_imported.
+        """
+        self.set_metadata(JSON_MTIME_NS_KEY, str(os.stat(self.json_path.get_string()).st_mtime_ns))
+
+    def to_json(self) -> PhotospherePath:
+        export_tinydb_json(self, self.json_path)
+        # the export has the records of the database, it doesn't need to be imported again
+        self.set_json_imported()
+        return self.json_path
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM photosphere_file").fetchone()[0]
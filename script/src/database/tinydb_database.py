@@ -0,0 +1,51 @@
+import os
+
+from tinydb import TinyDB, Query
+
+from src.database.photosphere_database import PhotosphereDatabase, METADATA_TABLE
+from src.file.path import PhotospherePath
+from src.util.profiling import span
+
+
+class TinyDBPhotosphereDatabase(PhotosphereDatabase):
+    """
+    The json database, every lookup is a scan of all the records.
+    """
+
+    def __init__(self, path: PhotospherePath):
+        self.path = path
+        self.db = TinyDB(path.get_string())
+
+    def insert(self, dic: dict) -> None:
+        self.insert_multiple([dic])
+
+    def insert_multiple(self, dics: list[dict]) -> None:
+        # every write rewrites the whole json file, the bytes of the span are the size of the file
+        with span("db.tinydb.write") as write_span:
+            self.db.insert_multiple(dics)
+            write_span.add_bytes(os.path.getsize(self.path.get_string()))
+
+    def contains_hash(self, hash: str) -> bool:
+        return self.db.contains(Query().hash == hash)
+
+    def all_hashes(self) -> set[str]:
+        return {document.get("hash") for document in self.db.all()}
+
+    def all(self) -> list[dict]:
+        return self.db.all()
+
+    def get_metadata(self, key: str) -> str | None:
+        document = self.db.table(METADATA_TABLE).get(Query().key == key)
+        return document["value"] if document is not None else None
+
+    def set_metadata(self, key: str, value: str) -> None:
+        self.db.table(METADATA_TABLE).upsert({"key": key, "value": value}, Query().key == key)
+
+    def to_json(self) -> PhotospherePath:
+        return self.path
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __len__(self) -> int:
+        return len(self.db)
@@ -0,0 +1,37 @@
+from src.database.photosphere_database import PhotosphereDatabase, import_tinydb_json
+from src.database.sqlite_database import SQLitePhotosphereDatabase
+from src.database.tinydb_database import TinyDBPhotosphereDatabase
+from src.file.path import PhotospherePath
+
+TINYDB_BACKEND = 'tinydb'
+SQLITE_BACKEND = 'sqlite'
+DATABASE_BACKENDS = [TINYDB_BACKEND, SQLITE_BACKEND]
+
+
+def open_database(json_path: PhotospherePath, backend: str = TINYDB_BACKEND) -> PhotosphereDatabase:
+    """
+    :param json_path: the TinyDB json file of the database. With the sqlite backend the records are stored
+        in a .sqlite file with the same name and the json file is used for exports. The json file is imported
+        when the .sqlite file is new or the json file changed since it was last imported or exported
+    :param backend: one of DATABASE_BACKENDS
+    :return: the database
+    """
+    if backend == TINYDB_BACKEND:
+        return TinyDBPhotosphereDatabase(json_path)
+    if backend == SQLITE_BACKEND:
+        db = SQLitePhotosphereDatabase(PhotospherePath(json_path.path.with_suffix(".sqlite")), json_path)
+        if not db.is_json_imported():
+            import_tinydb_json(json_path, db)
+            db.set_json_imported()
+        return db
+    raise ValueError(f"Unknown database backend {backend}, allowed: {', '.join(DATABASE_BACKENDS)}")
+
+
+def open_database_file(path: PhotospherePath) -> PhotosphereDatabase:
+    """
+    :param path: a .sqlite database or a TinyDB json file
+    :return: the database, the backend is chosen by the file extension
+    """
+    if path.is_allowed_extension({'.sqlite'}):
+        return SQLitePhotosphereDatabase(path)
+    return TinyDBPhotosphereDatabase(path)
@@ -0,0 +1,168 @@
+import mmap
+import struct
+from PIL import Image
+from src.file.path import PhotospherePath
+
+DATE_TIME_TAG = 0x0132
+EXIF_IFD_TAG = 0x8769
+GPS_IFD_TAG = 0x8825
+DATE_TIME_ORIGINAL_TAG = 0x9003
+ORIENTATION_TAG = 0x0112
+
+_JPEG_SOI = b'\xff\xd8'
+_TIFF_HEADERS = (b'II*\x00', b'MM\x00*')
+_EXIF_HEADER = b'Exif\x00\x00'
+# markers without length: TEM and RST0-RST7
+_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+# markers after which there is no more metadata: SOS (start of the compressed data) and EOI
+_END_OF_METADATA_MARKERS = {0xDA, 0xD9}
+# TIFF type: (struct format, size in bytes)
+_TIFF_TYPES = {
+    1: ('B', 1),
+    2: ('s', 1),
+    3: ('H', 2),
+    4: ('L', 4),
+    5: ('LL', 8),
+    7: ('B', 1),
+    9: ('l', 4),
+    10: ('ll', 8),
+    # IFD offset, the SubIFDs of the RAW files
+    13: ('L', 4),
+}
+
+
+def read_jpeg_exif_segment(path: PhotospherePath) -> bytes | None:
+    """
+    Reads the markers of a JPEG file until the APP1 Exif segment, the compressed image data is never read.
+    :param path: the file path
+    :return: the TIFF content of the APP1 segment, empty if the JPEG has no Exif segment, None if the file is not a JPEG
+    """
+    with open(path.get_string(), 'rb') as f:
+        if f.read(2) != _JPEG_SOI:
+            return None
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                return b''
+            code = marker[1]
+            while code == 0xFF:
+                fill = f.read(1)
+                if not fill:
+                    return b''
+                code = fill[0]
+            if code in _END_OF_METADATA_MARKERS:
+                return b''
+            if code in _STANDALONE_MARKERS:
+                continue
+            length_bytes = f.read(2)
+            if len(length_bytes) < 2:
+                return b''
+            length = struct.unpack('>H', length_bytes)[0] - 2
+            if code == 0xE1:
+                payload = f.read(length)
+                if payload.startswith(_EXIF_HEADER):
+                    return payload[len(_EXIF_HEADER):]
+            else:
+                f.seek(length, 1)
+
+
+def _read_ifd(tiff: bytes, offset: int, endian: str) -> dict[int, object]:
+    """
+    :return: the entries of the IFD at offset: tag -> value. Strings are decoded, rationals are floats,
+        values with a single element are not in a tuple.
+    """
+    entries = {}
+    count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+    for i in range(count):
+        tag, tiff_type, value_count, value_offset = struct.unpack_from(endian + 'HHL4s', tiff, offset + 2 + i * 12)
+        if tiff_type not in _TIFF_TYPES:
+            continue
+        value_format, size = _TIFF_TYPES[tiff_type]
+        data_size = size * value_count
+        if data_size <= 4:
+            data = value_offset[:data_size]
+        else:
+            start = struct.unpack(endian + 'L', value_offset)[0]
+            data = tiff[start:start + data_size]
+            if len(data) < data_size:
+                continue
+        if tiff_type == 2:
+            entries[tag] = data.split(b'\x00', 1)[0].decode('ascii', errors='replace').strip()
+            continue
+        values = struct.unpack(endian + value_format * value_count, data)
+        if tiff_type in (5, 10):
+            values = tuple(
+                values[j] / values[j + 1] if values[j + 1] else None for j in range(0, len(values), 2)
+            )
+        entries[tag] = values[0] if len(values) == 1 else values
+    return entries
+
+
+def _tiff_endian(tiff: bytes) -> str | None:
+    """
+    :return: the struct byte order of the TIFF structure, None if it doesn't start with a byte order
+    """
+    if tiff[:2] == b'II':
+        return '<'
+    if tiff[:2] == b'MM':
+        return '>'
+    return None
+
+
+def _next_ifd_offset(tiff: bytes, offset: int, endian: str) -> int:
+    """
+    :return: the offset of the IFD after the IFD at offset, 0 if it is the last one
+    """
+    count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+    return struct.unpack_from(endian + 'L', tiff, offset + 2 + count * 12)[0]
+
+
+def parse_exif(tiff: bytes) -> dict:
+    """
+    Parses the TIFF structure of an Exif segment, only the IFDs used by Photosphere are read.
+    :param tiff: the TIFF content, starting with the byte order
+    :return: {"date_time": str|None, "date_time_original": str|None, "gps_info": dict} where gps_info
+        has the GPS tag ids as keys, like PIL
+    """
+    metadata = {"date_time": None, "date_time_original": None, "gps_info": {}}
+    endian = _tiff_endian(tiff)
+    if endian is None:
+        return metadata
+    try:
+        ifd0 = _read_ifd(tiff, struct.unpack_from(endian + 'L', tiff, 4)[0], endian)
+        metadata["date_time"] = ifd0.get(DATE_TIME_TAG)
+        if EXIF_IFD_TAG in ifd0:
+            metadata["date_time_original"] = _read_ifd(tiff, ifd0[EXIF_IFD_TAG], endian).get(DATE_TIME_ORIGINAL_TAG)
+        if GPS_IFD_TAG in ifd0:
+            metadata["gps_info"] = _read_ifd(tiff, ifd0[GPS_IFD_TAG], endian)
+    except struct.error:
+        # truncated or corrupted segment: keep what was read
+        pass
+    return metadata
+
+
+def read_exif_metadata(path: PhotospherePath) -> dict:
+    """
+    Reads date and GPS information of an image without decoding the pixels.
+    JPEG files are parsed up to the APP1 segment and the TIFF based files (TIFF, DNG, CR2, NEF, ARW) are memory
+    mapped, only their IFDs are read. The other formats are opened with PIL, that reads only the header.
+    PNG files are decoded by PIL to find an eXIf chunk after the image data, so only a chunk before it is read.
+    :param path: the file path
+    :return: see parse_exif
+    """
+    tiff = read_jpeg_exif_segment(path)
+    if tiff is not None:
+        return parse_exif(tiff)
+    with open(path.get_string(), 'rb') as f:
+        if f.read(4) in _TIFF_HEADERS:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as tiff:
+                return parse_exif(tiff)
+    metadata = {"date_time": None, "date_time_original": None, "gps_info": {}}
+    with Image.open(path.get_string()) as image:
+        if image.format == 'PNG' and 'exif' not in image.info:
+            return metadata
+        exif = image.getexif()
+        metadata["date_time"] = exif.get(DATE_TIME_TAG)
+        metadata["date_time_original"] = exif.get_ifd(EXIF_IFD_TAG).get(DATE_TIME_ORIGINAL_TAG)
+        metadata["gps_info"] = dict(exif.get_ifd(GPS_IFD_TAG))
+    return metadata
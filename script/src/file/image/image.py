@@ -1,43 +1,181 @@
+import io
+import math
 import os
 import re
 from datetime import datetime
-import PIL
 from PIL import Image
+from src.file.image.exif import read_exif_metadata
+from src.file.image.preview import read_embedded_preview
+from src.file.image.rendition import RenditionOptions, encode_renditions
 from src.file.local_file import PhotosphereFile
 from src.file.path import PhotospherePath
 from src.gps.gps import dms_to_decimal
+from src.util.profiling import span
 import imagehash
 
 
 class PhotosphereImage(PhotosphereFile):
     TYPE = "IMAGE"
-    ALLOWED_EXTENSIONS: set[str] = {'.png', '.jpg', '.jpeg', '.tiff', '.heic'}
+    # RAW files are never demosaiced, their embedded JPEG previews are decoded instead, see _decode
+    RAW_EXTENSIONS: set[str] = {'.dng', '.cr2', '.nef', '.arw'}
+    ALLOWED_EXTENSIONS: set[str] = {'.png', '.jpg', '.jpeg', '.tiff', '.heic'} | RAW_EXTENSIONS
     HASH_SIZE = 16
+    # decoded once, at the smallest scale still large enough for the thumbnail (or the renditions), see _decode
+    pilImage = None
+    # pilImage is at least this large (max of width and height), or full size
+    _decoded_pixel_size = 0
+    # EXIF orientation of an embedded preview decoded in pilImage, None when pilImage has the EXIF of the file
+    _orientation = None
+    # date, GPS and average hash are computed on first access, see _load_metadata and _load_average_hash.
+    # True when the object is created from the cache
+    _metadata_loaded = True
+    _average_hash_loaded = True
 
-    def __init__(self, local_file_path: PhotospherePath):
-        super().__init__(local_file_path)
+    def __init__(self, local_file_path: PhotospherePath, hash: str = None):
+        super().__init__(local_file_path, hash)
         if not local_file_path.is_allowed_extension(self.ALLOWED_EXTENSIONS):
             raise ValueError("We don't support this image file format")
-        self.pilImage = Image.open(local_file_path.get_string())
-        self.__set_metadata()
-        self._set_geohash()
-        self.__set_average_hash()
+        self._metadata_loaded = False
+        self._average_hash_loaded = False
 
-    def __set_metadata(self):
-        exif = self.pilImage._getexif()
-        if exif is None:
-            return None
-        for k, v in exif.items():
+    @classmethod
+    def from_cache_entry(cls, local_file_path: PhotospherePath, entry: dict) -> 'PhotosphereImage':
+        ps = super().from_cache_entry(local_file_path, entry)
+        # the entry was cached before the average hash was needed
+        ps._average_hash_loaded = entry["average_hash"] is not None
+        return ps
+
+    @property
+    def created_at(self) -> datetime | None:
+        self._load_metadata()
+        return self._created_at
+
+    @created_at.setter
+    def created_at(self, value: datetime | None):
+        self._load_metadata()
+        self._created_at = value
+
+    @property
+    def latitude(self) -> float | None:
+        self._load_metadata()
+        return self._latitude
+
+    @latitude.setter
+    def latitude(self, value: float | None):
+        self._load_metadata()
+        self._latitude = value
+
+    @property
+    def longitude(self) -> float | None:
+        self._load_metadata()
+        return self._longitude
+
+    @longitude.setter
+    def longitude(self, value: float | None):
+        self._load_metadata()
+        self._longitude = value
+
+    @property
+    def geohash(self) -> str | None:
+        self._load_metadata()
+        return self._geohash
+
+    @geohash.setter
+    def geohash(self, value: str | None):
+        self._load_metadata()
+        self._geohash = value
+
+    @property
+    def average_hash(self) -> str | None:
+        self._load_average_hash()
+        return self._average_hash
+
+    @average_hash.setter
+    def average_hash(self, value: str | None):
+        self._average_hash_loaded = True
+        self._average_hash = value
+
+    def is_average_hash_loaded(self) -> bool:
+        return self._average_hash_loaded
+
+    def _load_metadata(self):
+        """
+        Reads date and GPS from the EXIF metadata, without decoding the image.
+        """
+        if self._metadata_loaded:
+            return
+        self._metadata_loaded = True
+        with span("image.metadata"):
+            metadata = read_exif_metadata(self.file_path)
+        try:
+            self.__set_gps_info(metadata["gps_info"])
+        except (TypeError, ValueError, IndexError):
+            pass
+        for date in (metadata["date_time_original"], metadata["date_time"]):
+            if self.created_at is not None:
+                break
             try:
-                tag = PIL.ExifTags.TAGS[k]
-                if tag == "GPSInfo":
-                    self.__set_gps_info(v)
-                elif tag == "DateTimeOriginal" or tag == "date_time_original":
-                    self.__set_create_datetime(v)
-                elif tag == "DateTime" and self.created_at is None:
-                        self.__set_create_datetime(v)
-            except:
+                if isinstance(date, str):
+                    self.__set_create_datetime(date)
+            except ValueError:
                 pass
+        self._set_geohash()
+
+    def _load_average_hash(self):
+        if self._average_hash_loaded:
+            return
+        self._decode()
+        with span("image.average_hash"):
+            self.average_hash = imagehash.average_hash(self.pilImage, self.HASH_SIZE).__str__()
+
+    def _decode(self, pixel_size: int = None):
+        """
+        Decodes the image once, at the smallest scale that is still at least the thumbnail size (or pixel_size):
+        the smallest embedded JPEG preview large enough is decoded instead of the image (see read_embedded_preview,
+        a RAW file without one uses its largest preview), and JPEG files are decoded directly at 1/2, 1/4 or 1/8 of
+        their size (see PIL draft).
+        The renditions, the thumbnail and the average hash are all computed from this image, so the renditions
+        are generated first. An image already decoded at a smaller scale is decoded again.
+        :param pixel_size: min of the max of width and height, default the thumbnail size
+        """
+        pixel_size = max(pixel_size or 0, self.THUMBNAIL_PIXEL_SIZE)
+        if self.pilImage is not None:
+            if self._decoded_pixel_size >= pixel_size:
+                return
+            self.pilImage.close()
+        with span("image.decode"):
+            image = self._load_preview(pixel_size)
+            full_size = False
+            if image is None:
+                image = Image.open(self.file_path.get_string())
+                self._orientation = None
+                width, height = image.size
+                scale = min(pixel_size / width, pixel_size / height, 1)
+                image.draft(None, (math.ceil(width * scale), math.ceil(height * scale)))
+                image.load()
+                full_size = image.size == (width, height)
+        self.pilImage = image
+        # a smaller image is the full image, or the largest preview of a RAW file: nothing larger to decode
+        self._decoded_pixel_size = math.inf if full_size or max(image.size) < pixel_size else max(image.size)
+
+    def _load_preview(self, pixel_size: int) -> Image.Image | None:
+        """
+        :return: the decoded embedded preview at least pixel_size large, None if there is none or it can't be decoded
+        """
+        is_raw = self.file_path.is_allowed_extension(self.RAW_EXTENSIONS)
+        preview = read_embedded_preview(self.file_path, pixel_size, allow_smaller=is_raw)
+        if preview is None:
+            return None
+        image, orientation = preview
+        try:
+            width, height = image.size
+            scale = min(pixel_size / width, pixel_size / height, 1)
+            image.draft(None, (math.ceil(width * scale), math.ceil(height * scale)))
+            image.load()
+        except OSError:
+            return None
+        self._orientation = orientation
+        return image
 
     def __set_gps_info(self, gps_info):
         if 1 in gps_info and 2 in gps_info and 3 in gps_info and 4 in gps_info:
@@ -58,17 +196,47 @@ class PhotosphereImage(PhotosphereFile):
                 longitude_direction
             )
 
-    def __set_average_hash(self):
-        self.average_hash = imagehash.average_hash(self.pilImage, self.HASH_SIZE).__str__()
+    def generate_thumbnail(self) -> bytes:
+        """
+        :return: the JPEG thumbnail, also kept in thumbnail_jpeg. Nothing is written on disk.
+        """
+        # the average hash uses the decoded image before it is resized
+        self._load_average_hash()
+        self._decode()
+        with span("image.thumbnail") as thumbnail_span:
+            self.pilImage.thumbnail((self.THUMBNAIL_PIXEL_SIZE, self.THUMBNAIL_PIXEL_SIZE))
+            self._decoded_pixel_size = min(self._decoded_pixel_size, self.THUMBNAIL_PIXEL_SIZE)
+            # Convert RGBA to RGB if necessary
+            if self.pilImage.mode == "RGBA":
+                self.pilImage = self.pilImage.convert("RGB")
+            buffer = io.BytesIO()
+            self.pilImage.save(buffer, "JPEG")
+            self.thumbnail_jpeg = buffer.getvalue()
+            thumbnail_span.add_bytes(len(self.thumbnail_jpeg))
+        return self.thumbnail_jpeg
+
+    def generate_renditions(self, options: RenditionOptions) -> list[dict]:
+        """
+        Encodes the renditions of the image from one decode, see encode_renditions. Nothing is written on disk.
+        :return: the renditions, smallest first: name, size (max of width and height in pixels), file_name in the
+            bucket (see get_rendition_name) and data (the encoded image)
+        """
+        self._decode(options.get_max_size())
+        # the average hash uses the same decoded image
+        self._load_average_hash()
+        with span("image.renditions") as renditions_span:
+            renditions = encode_renditions(self.pilImage, options, self._orientation)
+            renditions_span.add_bytes(sum(len(data) for _, _, data in renditions))
+        return [
+            {"name": name, "size": size, "file_name": self.get_rendition_name(name, options.format), "data": data}
+            for name, size, data in renditions
+        ]
 
-    def generate_thumbnail(self):
-        thumbnail_path = f"{self.LOCAL_TMP_FOLDER}{os.path.basename(self.file_path.get_string())}.{self.hash}.thumbnail.jpg"
-        self.pilImage.thumbnail((self.THUMBNAIL_PIXEL_SIZE, self.THUMBNAIL_PIXEL_SIZE))
-        # Convert RGBA to RGB if necessary
-        if self.pilImage.mode == "RGBA":
-            self.pilImage = self.pilImage.convert("RGB")
-        self.pilImage.save(thumbnail_path, "JPEG")
-        self.thumbnail_local_path = PhotospherePath(thumbnail_path)
+    def get_rendition_name(self, name: str, format: str) -> str:
+        """
+        :return: the file name of a rendition in the bucket, like the one of the thumbnail
+        """
+        return f"{os.path.basename(self.file_path.get_string())}.{self.hash}.{name}.{format}"
 
     def __set_create_datetime(self, date: str):
         if "0000:00:00" in date:
@@ -86,8 +254,6 @@ class PhotosphereImage(PhotosphereFile):
     def __del__(self):
         if self.pilImage is not None:
             self.pilImage.close()
-        if self.thumbnail_local_path and self.thumbnail_local_path.exists():
-            self.thumbnail_local_path.remove()
 
     def __str__(self):
         return f"PhotosphereImage(file_path={self.file_path}, created_at={self.created_at}, latitude={self.latitude}, longitude={self.longitude}, hash={self.average_hash})"
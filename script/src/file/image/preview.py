@@ -0,0 +1,214 @@
+import io
+import mmap
+import struct
+from typing import Iterator
+from PIL import Image
+from src.file.image.exif import ORIENTATION_TAG, EXIF_IFD_TAG, _read_ifd, _next_ifd_offset, _tiff_endian
+from src.file.path import PhotospherePath
+
+NEW_SUBFILE_TYPE_TAG = 0x00FE
+IMAGE_WIDTH_TAG = 0x0100
+IMAGE_LENGTH_TAG = 0x0101
+COMPRESSION_TAG = 0x0103
+STRIP_OFFSETS_TAG = 0x0111
+STRIP_BYTE_COUNTS_TAG = 0x0117
+SUB_IFDS_TAG = 0x014A
+JPEG_INTERCHANGE_FORMAT_TAG = 0x0201
+JPEG_INTERCHANGE_FORMAT_LENGTH_TAG = 0x0202
+EXIF_IMAGE_WIDTH_TAG = 0xA002
+EXIF_IMAGE_HEIGHT_TAG = 0xA003
+MP_ENTRY_TAG = 0xB002
+# a preview with another aspect ratio (letterboxed, cropped or rotated) is not a preview of the image
+ASPECT_RATIO_TOLERANCE = 0.03
+
+_JPEG_SOI = b'\xff\xd8'
+_EXIF_HEADER = b'Exif\x00\x00'
+_MPF_HEADER = b'MPF\x00'
+_TIFF_HEADERS = (b'II*\x00', b'MM\x00*')
+# old and new style JPEG compression of a TIFF strip
+_JPEG_COMPRESSIONS = {6, 7}
+# start of frame of the JPEG decoded by PIL: baseline, extended and progressive (not lossless, the RAW data)
+_DECODABLE_SOF_MARKERS = {0xC0, 0xC1, 0xC2}
+_SOF_MARKERS = {*range(0xC0, 0xD0)} - {0xC4, 0xC8, 0xCC}
+_STANDALONE_MARKERS = {0x01, *range(0xD0, 0xD8)}
+# IFDs read at most, a corrupted chain can loop
+_MAX_IFDS = 32
+
+
+def _jpeg_segments(data, start: int = 0) -> Iterator[tuple[int, int, int]]:
+    """
+    :param data: the bytes of a JPEG file, or of a file with a JPEG stream at start
+    :return: generator of (marker, start of the payload, payload length) of the segments before the compressed data
+    """
+    position = start + 2
+    while position + 4 <= len(data) and data[position] == 0xFF:
+        code = data[position + 1]
+        if code == 0xFF:
+            position += 1
+            continue
+        if code in (0xDA, 0xD9):
+            return
+        if code in _STANDALONE_MARKERS:
+            position += 2
+            continue
+        length = struct.unpack_from('>H', data, position + 2)[0]
+        yield code, position + 4, length - 2
+        position += 2 + length
+
+
+def _jpeg_size(data, start: int) -> tuple[int, int] | None:
+    """
+    :return: width and height of the JPEG stream at start, None if it is not a JPEG PIL can decode
+    """
+    if data[start:start + 2] != _JPEG_SOI:
+        return None
+    for code, payload, length in _jpeg_segments(data, start):
+        if code in _SOF_MARKERS:
+            if code not in _DECODABLE_SOF_MARKERS or length < 5:
+                return None
+            height, width = struct.unpack_from('>HH', data, payload + 1)
+            return width, height
+    return None
+
+
+def _tiff_previews(tiff, base: int, endian: str) -> tuple[list[tuple[int, int]], dict]:
+    """
+    Reads the IFD chain and the sub IFDs of every IFD.
+    :param tiff: the TIFF structure, starting with the byte order
+    :param base: position of the TIFF structure in the file, the offsets of the IFDs are relative to it
+    :return: (position, length) in the file of the JPEG streams of the IFDs, and the tags of the image: "orientation",
+        "exif_size" (the EXIF image size) and "size" (the largest full resolution IFD), if found
+    """
+    previews = []
+    tags = {"orientation": 1}
+    first_ifd = struct.unpack_from(endian + 'L', tiff, 4)[0]
+    ifds = [first_ifd]
+    visited = set()
+    while ifds and len(visited) < _MAX_IFDS:
+        offset = ifds.pop(0)
+        if not offset or offset in visited or offset + 2 > len(tiff):
+            continue
+        visited.add(offset)
+        ifd = _read_ifd(tiff, offset, endian)
+        if offset == first_ifd:
+            tags["orientation"] = ifd.get(ORIENTATION_TAG, 1)
+            if EXIF_IFD_TAG in ifd:
+                exif = _read_ifd(tiff, ifd[EXIF_IFD_TAG], endian)
+                if EXIF_IMAGE_WIDTH_TAG in exif and EXIF_IMAGE_HEIGHT_TAG in exif:
+                    tags["exif_size"] = (exif[EXIF_IMAGE_WIDTH_TAG], exif[EXIF_IMAGE_HEIGHT_TAG])
+        if ifd.get(NEW_SUBFILE_TYPE_TAG) == 0 and IMAGE_WIDTH_TAG in ifd and IMAGE_LENGTH_TAG in ifd:
+            width, height = ifd[IMAGE_WIDTH_TAG], ifd[IMAGE_LENGTH_TAG]
+            if "size" not in tags or width * height > tags["size"][0] * tags["size"][1]:
+                tags["size"] = (width, height)
+        if JPEG_INTERCHANGE_FORMAT_TAG in ifd and JPEG_INTERCHANGE_FORMAT_LENGTH_TAG in ifd:
+            previews.append((base + ifd[JPEG_INTERCHANGE_FORMAT_TAG], ifd[JPEG_INTERCHANGE_FORMAT_LENGTH_TAG]))
+        elif ifd.get(COMPRESSION_TAG) in _JPEG_COMPRESSIONS and isinstance(ifd.get(STRIP_OFFSETS_TAG), int) \
+                and isinstance(ifd.get(STRIP_BYTE_COUNTS_TAG), int):
+            previews.append((base + ifd[STRIP_OFFSETS_TAG], ifd[STRIP_BYTE_COUNTS_TAG]))
+        sub_ifds = ifd.get(SUB_IFDS_TAG, ())
+        ifds.extend(sub_ifds if isinstance(sub_ifds, tuple) else (sub_ifds,))
+        ifds.append(_next_ifd_offset(tiff, offset, endian))
+    return previews, tags
+
+
+def _mpf_previews(tiff: bytes, base: int) -> list[tuple[int, int]]:
+    """
+    :param tiff: the TIFF structure of the APP2 MPF segment
+    :param base: position of the TIFF structure in the file, the offsets of the images are relative to it
+    :return: (position, length) of the images of the multi-picture format index, but the first one (the image)
+    """
+    endian = _tiff_endian(tiff)
+    if endian is None:
+        return []
+    entries = _read_ifd(tiff, struct.unpack_from(endian + 'L', tiff, 4)[0], endian).get(MP_ENTRY_TAG)
+    if not isinstance(entries, tuple):
+        return []
+    entries = bytes(entries)
+    previews = []
+    for index in range(1, len(entries) // 16):
+        _, size, offset, _, _ = struct.unpack_from(endian + 'LLLHH', entries, index * 16)
+        previews.append((base + offset, size))
+    return previews
+
+
+def find_embedded_previews(data) -> tuple[list[tuple[int, int, int]], tuple[int, int] | None, int]:
+    """
+    Finds the JPEG previews of a JPEG file (EXIF IFD1 thumbnail, multi-picture format images) or of a TIFF based
+    RAW file (the JPEG streams of its IFDs and sub IFDs: PreviewImage, JpegFromRaw, thumbnails), without decoding.
+    :param data: the content of the file, bytes or memory mapped
+    :return: the previews PIL can decode as (position, length, max of width and height), the size of the image
+        (None if unknown) and its EXIF orientation. Previews are stored with the orientation of the image.
+    """
+    candidates = []
+    size = None
+    orientation = 1
+    try:
+        if data[:2] == _JPEG_SOI:
+            for code, payload, length in _jpeg_segments(data):
+                if code == 0xE1 and data[payload:payload + 6] == _EXIF_HEADER:
+                    tiff = data[payload + 6:payload + length]
+                    endian = _tiff_endian(tiff)
+                    if endian is not None:
+                        previews, tags = _tiff_previews(tiff, payload + 6, endian)
+                        candidates.extend(previews)
+                        orientation = tags["orientation"]
+                elif code == 0xE2 and data[payload:payload + 4] == _MPF_HEADER:
+                    candidates.extend(_mpf_previews(data[payload + 4:payload + length], payload + 4))
+                elif code in _SOF_MARKERS and length >= 5:
+                    height, width = struct.unpack_from('>HH', data, payload + 1)
+                    size = (width, height)
+        elif data[:4] in _TIFF_HEADERS:
+            candidates, tags = _tiff_previews(data, 0, _tiff_endian(data[:2]))
+            size = tags.get("exif_size") or tags.get("size")
+            orientation = tags["orientation"]
+    except (struct.error, IndexError, ValueError):
+        # truncated or corrupted file: the previews found until there
+        pass
+    previews = []
+    for position, length in candidates:
+        if length <= 0 or position + length > len(data):
+            continue
+        try:
+            preview_size = _jpeg_size(data, position)
+        except (struct.error, IndexError):
+            continue
+        if preview_size is None or (size is not None and not _same_aspect_ratio(preview_size, size)):
+            continue
+        previews.append((position, length, max(preview_size)))
+    return previews, size, orientation
+
+
+def _same_aspect_ratio(first: tuple[int, int], second: tuple[int, int]) -> bool:
+    if not first[1] or not second[1]:
+        return False
+    return abs(first[0] / first[1] - second[0] / second[1]) <= ASPECT_RATIO_TOLERANCE * second[0] / second[1]
+
+
+def read_embedded_preview(
+        path: PhotospherePath,
+        pixel_size: int,
+        allow_smaller: bool = False
+    ) -> tuple[Image.Image, int] | None:
+    """
+    The smallest embedded preview at least pixel_size large (max of width and height), see find_embedded_previews.
+    The file is memory mapped, only its metadata and the chosen preview are read.
+    :param allow_smaller: if no preview is large enough, the largest one (a RAW file can't be decoded otherwise)
+    :return: the preview opened with PIL (not decoded yet) and the EXIF orientation of the image, None if there
+        is no preview
+    """
+    with open(path.get_string(), 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+    with data:
+        previews, _, orientation = find_embedded_previews(data)
+        large_enough = [preview for preview in previews if preview[2] >= pixel_size]
+        if large_enough:
+            position, length, _ = min(large_enough, key=lambda preview: preview[2])
+        elif allow_smaller and previews:
+            position, length, _ = max(previews, key=lambda preview: preview[2])
+        else:
+            return None
+        preview = data[position:position + length]
+    return Image.open(io.BytesIO(preview)), orientation
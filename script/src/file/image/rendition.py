@@ -0,0 +1,131 @@
+import io
+from PIL import Image, features
+from src.file.image.exif import ORIENTATION_TAG
+
+WEBP_FORMAT = 'webp'
+AVIF_FORMAT = 'avif'
+RENDITION_FORMATS = [WEBP_FORMAT, AVIF_FORMAT]
+DEFAULT_RENDITION_FORMAT = WEBP_FORMAT
+DEFAULT_RENDITION_QUALITY = 80
+GRID_RENDITION = 'grid'
+PREVIEW_RENDITION = 'preview'
+LARGE_RENDITION = 'large'
+# max width and height in pixels of every rendition
+RENDITION_SIZES = {GRID_RENDITION: 320, PREVIEW_RENDITION: 1280, LARGE_RENDITION: 2560}
+DEFAULT_RENDITIONS = [GRID_RENDITION, PREVIEW_RENDITION]
+# transpose that shows upright an image stored with the EXIF orientation, like PIL ImageOps.exif_transpose
+ORIENTATION_TRANSPOSES = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# a resize larger than this ratio first reduces the image by an integer factor, faster and with the same result
+_REDUCING_GAP = 3.0
+
+
+class RenditionOptions:
+    """
+    The renditions of a sync: names (see RENDITION_SIZES), format and quality. Plain data, it is sent to the
+    worker processes of the sync.
+    """
+
+    def __init__(
+            self,
+            names: list[str] = None,
+            format: str = DEFAULT_RENDITION_FORMAT,
+            quality: int = DEFAULT_RENDITION_QUALITY
+        ):
+        """
+        :param names: renditions to make, default DEFAULT_RENDITIONS
+        :param format: one of RENDITION_FORMATS
+        :param quality: 1 to 100
+        :raise ValueError: if a name or the format is unknown, or the format is not supported by PIL
+        """
+        self.names = list(names) if names is not None else list(DEFAULT_RENDITIONS)
+        for name in self.names:
+            if name not in RENDITION_SIZES:
+                raise ValueError(f"Unknown rendition {name}, expected one of {list(RENDITION_SIZES)}")
+        self.format = check_rendition_format(format)
+        self.quality = quality
+
+    def get_sizes(self) -> dict[str, int]:
+        """
+        :return: max width and height in pixels by rendition name, smallest first
+        """
+        return dict(sorted(((name, RENDITION_SIZES[name]) for name in self.names), key=lambda item: item[1]))
+
+    def get_max_size(self) -> int:
+        return max(RENDITION_SIZES[name] for name in self.names)
+
+
+def check_rendition_format(format: str) -> str:
+    """
+    :raise ValueError: if the format is unknown or the PIL build can't encode it (AVIF needs Pillow built with
+        libavif)
+    """
+    if format not in RENDITION_FORMATS:
+        raise ValueError(f"Unknown rendition format {format}, expected one of {RENDITION_FORMATS}")
+    if not features.check(format):
+        raise ValueError(f"The installed Pillow can't encode {format} images")
+    return format
+
+
+def _fit(size: tuple[int, int], pixel_size: int) -> tuple[int, int]:
+    """
+    :return: the size scaled down to fit in pixel_size x pixel_size, never scaled up
+    """
+    width, height = size
+    scale = min(pixel_size / max(width, height), 1)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _prepare(image: Image.Image, orientation: int = None) -> Image.Image:
+    """
+    The image rotated by its EXIF orientation (the renditions have no EXIF) in a mode WebP and AVIF can encode.
+    :param orientation: default the orientation in the EXIF of the image
+    """
+    if orientation is None:
+        orientation = image.getexif().get(ORIENTATION_TAG, 1)
+    if orientation in ORIENTATION_TRANSPOSES:
+        image = image.transpose(ORIENTATION_TRANSPOSES[orientation])
+    if image.mode in ("RGB", "RGBA"):
+        return image
+    if image.mode in ("LA", "PA") or "transparency" in image.info:
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+
+def encode_renditions(
+        image: Image.Image,
+        options: RenditionOptions,
+        orientation: int = None
+    ) -> list[tuple[str, int, bytes]]:
+    """
+    Encodes the renditions of a decoded image. The largest one is resized from the image and every smaller one
+    from the previous one. The image is never scaled up: a rendition that would have the same size of a smaller
+    one (the image is smaller than both) is not made.
+    :param image: the decoded image, at least as large as the largest rendition (or full size), not modified
+    :param orientation: EXIF orientation of the image, default the one in its EXIF (an embedded preview has none)
+    :return: (name, max of width and height, encoded image) of every rendition, smallest first
+    """
+    image = _prepare(image, orientation)
+    targets = []
+    for name, pixel_size in options.get_sizes().items():
+        size = _fit(image.size, pixel_size)
+        if targets and targets[-1][1] == size:
+            continue
+        targets.append((name, size))
+    renditions = []
+    current = image
+    for name, size in reversed(targets):
+        if current.size != size:
+            current = current.resize(size, Image.Resampling.LANCZOS, reducing_gap=_REDUCING_GAP)
+        buffer = io.BytesIO()
+        current.save(buffer, options.format.upper(), quality=options.quality)
+        renditions.append((name, max(size), buffer.getvalue()))
+    renditions.reverse()
+    return renditions
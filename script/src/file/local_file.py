@@ -1,31 +1,52 @@
+import os
+from datetime import datetime
+from src.database.photosphere_database import PhotosphereDatabase
 from src.file.path import PhotospherePath
 from src.gps.gps import encode_geohash
-from tinydb import TinyDB
 
-from src.local.utils import create_folder_if_not_exists, file_hash
+from src.local.utils import file_hash
 
 
 class PhotosphereFile:
 
     TYPE = "FILE"
     ALLOWED_EXTENSIONS: set[str] = {'.txt', '.pdf'}
-    LOCAL_TMP_FOLDER = '/tmp/photosphere/'
     THUMBNAIL_PIXEL_SIZE = 280
 
-    def __init__(self, local_file_path: PhotospherePath):
+    def __init__(self, local_file_path: PhotospherePath, hash: str = None):
+        """
+        :param local_file_path: the file path
+        :param hash: the hash of the file if already known, otherwise it is computed reading the file
+        """
         self.file_path = local_file_path
         if not local_file_path.exists():
             raise FileNotFoundError(f"The file {local_file_path} does not exist.")
-        self.hash = file_hash(self.file_path)
+        self.hash = hash if hash is not None else file_hash(self.file_path)
         self.average_hash = None
         self.created_at = None
         self.latitude = None
         self.longitude = None
         self.geohash = None
         self.source_bucket_uri = None
-        self.thumbnail_local_path = None
+        # the JPEG thumbnail made by generate_thumbnail, in memory
+        self.thumbnail_jpeg = None
         self.thumbnail_bucket_uri = None
-        create_folder_if_not_exists(PhotospherePath(self.LOCAL_TMP_FOLDER))
+        # name, size and uri of the renditions in the bucket, None if they were not made
+        self.renditions = None
+
+    @classmethod
+    def from_cache_entry(cls, local_file_path: PhotospherePath, entry: dict) -> 'PhotosphereFile':
+        """
+        Creates the object from a FileStatCache entry, without reading the file.
+        """
+        ps = cls.__new__(cls)
+        PhotosphereFile.__init__(ps, local_file_path, entry["hash"])
+        ps.average_hash = entry["average_hash"]
+        ps.created_at = datetime.fromisoformat(entry["created_at"]) if entry["created_at"] else None
+        ps.latitude = entry["latitude"]
+        ps.longitude = entry["longitude"]
+        ps._set_geohash()
+        return ps
 
     def _set_geohash(self):
         if self.latitude and self.longitude:
@@ -46,6 +67,18 @@ class PhotosphereFile:
     def get_thumbnail_bucket_uri(self) -> str:
         return self.thumbnail_bucket_uri
 
+    def set_renditions(self, renditions: list[dict] | None):
+        self.renditions = renditions
+
+    def get_renditions(self) -> list[dict] | None:
+        return self.renditions
+
+    def get_thumbnail_name(self) -> str:
+        """
+        :return: the file name of the thumbnail in the bucket, the file name and the hash of the file
+        """
+        return f"{os.path.basename(self.file_path.get_string())}.{self.hash}.thumbnail.jpg"
+
     def get_file_type(self) -> str:
         return self.TYPE
 
@@ -86,6 +119,12 @@ class PhotosphereFile:
             return self.average_hash
         return None
 
+    def is_average_hash_loaded(self) -> bool:
+        """
+        :return: False if the average hash is computed on first access and it was not accessed yet
+        """
+        return True
+
     def get_hash(self) -> str:
         return self.hash
 
@@ -97,6 +136,8 @@ class PhotosphereFile:
             local_file_path: The local path to the file.
             source_bucket_uri: The URI of the source bucket where the file is stored.
             thumbnail_bucket_uri: The URI of the thumbnail bucket where the thumbnail is stored.
+            renditions: The WebP or AVIF renditions of the image in the bucket, smallest first: name, size (max of
+                width and height in pixels) and uri (if available).
             file_type: The type of the file (e.g., "FILE").
             created_at: The creation date and time of the file.
             created_at_timestamp: The creation date and time of the file as a Unix timestamp.
@@ -110,6 +151,7 @@ class PhotosphereFile:
             "local_file_path",
             "source_bucket_uri",
             "thumbnail_bucket_uri",
+            "renditions",
             "file_type",
             "created_at",
             "created_at_timestamp",
@@ -136,8 +178,8 @@ class PhotosphereFile:
                 dic[field] = value
         return dic
 
-    def persist(self, db: TinyDB) -> None:
+    def persist(self, db: PhotosphereDatabase) -> None:
         """
-        Appends the current PhotosphereLocalFile instance to the TinyDB database passed as db.
+        Appends the current PhotosphereLocalFile instance to the database passed as db.
         """
         db.insert(self.get_dic())
\ No newline at end of file
@@ -3,8 +3,10 @@ from pathlib import Path
 
 class PhotospherePath:
 
-    def __init__(self, path: Path | str = None):
+    def __init__(self, path: Path | str = None, stat=None):
         self.path = Path(path) if isinstance(path, str) else path
+        # st_ino, st_size and st_mtime_ns read while listing the folder (a ScannedFile), None to read them when needed
+        self.stat = stat
 
     def get_string(self) -> str:
         return str(self.path)
@@ -18,6 +20,10 @@ class PhotospherePath:
         """Get the base name of the path."""
         return self.path.name
 
+    def get_stat(self):
+        """Get the stat of the file, the one read while listing its folder if any."""
+        return self.stat if self.stat is not None else self.path.stat()
+
     def exists(self):
         """Check if the path exists."""
         return self.path.exists()
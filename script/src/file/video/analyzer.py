@@ -0,0 +1,238 @@
+import os
+import re
+import subprocess
+import threading
+from math import ceil, floor, sqrt
+
+import imagehash
+import numpy as np
+from PIL import Image
+
+from src.file.path import PhotospherePath
+
+FFMPEG_BINARY = 'ffmpeg'
+# size of the frames used by the perceptual hash, like videohash
+HASH_FRAME_SIZE = 144
+HASH_COLLAGE_WIDTH = 1024
+# the frames kept in memory are decimated when there are more
+MAX_HASH_FRAMES = 256
+# version of the video average hashes, the hashes of two versions are not comparable:
+# 1 videohash2 (crop detection, one frame per second), 2 the frames of analyze_video
+VIDEO_HASH_VERSION = '2'
+_READ_SIZE = 1024 * 1024
+_FFMETADATA_LINE = re.compile(r'((?:[^\\=]|\\.)*)=(.*)', re.DOTALL)
+_FFMETADATA_ESCAPE = re.compile(r'\\(.)', re.DOTALL)
+
+
+class VideoAnalysis:
+    """
+    Result of analyze_video: the format tags, the first frame as JPEG and the sampled frames (in memory).
+    """
+
+    def __init__(self, tags: dict[str, str], thumbnail: bytes | None, frames: list[Image.Image]):
+        self.tags = tags
+        self.thumbnail = thumbnail
+        self.frames = frames
+
+    def get_average_hash(self) -> str | None:
+        """
+        :return: the perceptual hash of the sampled frames, see video_perceptual_hash
+        """
+        if not self.frames:
+            return None
+        return video_perceptual_hash(self.frames)
+
+
+def _build_command(
+        path: PhotospherePath,
+        thumbnail_size: int,
+        metadata_fd: int,
+        thumbnail_fd: int,
+        frame_interval: float,
+        keyframes_only: bool,
+        max_frames: int
+    ) -> list[str]:
+    """
+    One ffmpeg process with three outputs: the global tags (ffmetadata), the first frame (JPEG)
+    and the frames for the hash (raw RGB, HASH_FRAME_SIZE square) on stdout, if max_frames is not 0.
+    """
+    command = [FFMPEG_BINARY, '-v', 'error', '-nostdin']
+    if keyframes_only:
+        # the decoder skips all the frames but the keyframes: long clips are not decoded end to end
+        command += ['-skip_frame', 'nokey']
+    command += ['-i', path.get_string()]
+    command += ['-map_metadata', '0', '-f', 'ffmetadata', f'pipe:{metadata_fd}']
+    command += [
+        '-map', '0:v:0', '-frames:v', '1',
+        '-vf', f'scale=w={thumbnail_size}:h={thumbnail_size}:force_original_aspect_ratio=decrease',
+        '-f', 'image2pipe', '-c:v', 'mjpeg', f'pipe:{thumbnail_fd}'
+    ]
+    if max_frames == 0:
+        return command
+    frame_filter = f'scale={HASH_FRAME_SIZE}:{HASH_FRAME_SIZE}'
+    if not keyframes_only:
+        frame_filter = f'fps=1/{frame_interval},' + frame_filter
+    command += [
+        '-map', '0:v:0', '-vf', frame_filter, '-fps_mode', 'passthrough',
+        '-pix_fmt', 'rgb24', '-f', 'rawvideo', 'pipe:1'
+    ]
+    return command
+
+
+def _read_all(fd: int, result: list) -> None:
+    with os.fdopen(fd, 'rb') as f:
+        result.append(f.read())
+
+
+def _read_frames(stream, max_frames: int) -> list[Image.Image]:
+    """
+    Reads the raw frames, when there are more than max_frames one frame every two is dropped,
+    so the frames kept are evenly spaced and the memory used is bounded.
+    """
+    frame_bytes = HASH_FRAME_SIZE * HASH_FRAME_SIZE * 3
+    frames = []
+    stride = 1
+    index = 0
+    while True:
+        data = stream.read(frame_bytes)
+        if len(data) < frame_bytes:
+            break
+        if index % stride == 0:
+            frames.append(Image.frombytes('RGB', (HASH_FRAME_SIZE, HASH_FRAME_SIZE), data))
+            if len(frames) > max_frames:
+                frames = frames[::2]
+                stride *= 2
+        index += 1
+    return frames
+
+
+def parse_ffmetadata(content: str) -> dict[str, str]:
+    """
+    :param content: the output of the ffmetadata muxer, where '=', ';', '#', '\\' and new lines are escaped
+    :return: the global tags
+    """
+    tags = {}
+    # an escaped new line is part of the value
+    for line in re.split(r'(?<!\\)\n', content):
+        if line.startswith('['):
+            # stream and chapter sections
+            break
+        match = _FFMETADATA_LINE.match(line)
+        if match and not line.startswith((';', '#')):
+            tags[_FFMETADATA_ESCAPE.sub(r'\1', match.group(1))] = _FFMETADATA_ESCAPE.sub(r'\1', match.group(2))
+    return tags
+
+
+def analyze_video(
+        path: PhotospherePath,
+        thumbnail_size: int,
+        frame_interval: float = 1,
+        keyframes_only: bool = True,
+        max_frames: int = MAX_HASH_FRAMES
+    ) -> VideoAnalysis:
+    """
+    Runs a single ffmpeg process that returns the format tags, the first frame as thumbnail and the frames
+    for the perceptual hash. Nothing is written on disk.
+    :param path: the video
+    :param thumbnail_size: max width and height of the thumbnail
+    :param frame_interval: seconds between two frames of the hash, ignored with keyframes_only
+    :param keyframes_only: decode only the keyframes, every keyframe is a frame of the hash
+    :param max_frames: max number of frames kept in memory, 0 to skip the frames (only tags and thumbnail)
+    :return: the analysis, without thumbnail and frames if ffmpeg could not decode the video
+    """
+    metadata_read, metadata_write = os.pipe()
+    thumbnail_read, thumbnail_write = os.pipe()
+    command = _build_command(
+        path, thumbnail_size, metadata_write, thumbnail_write, frame_interval, keyframes_only, max_frames
+    )
+    try:
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            pass_fds=(metadata_write, thumbnail_write),
+            bufsize=_READ_SIZE
+        )
+    except Exception:
+        for fd in (metadata_read, metadata_write, thumbnail_read, thumbnail_write):
+            os.close(fd)
+        raise
+    os.close(metadata_write)
+    os.close(thumbnail_write)
+
+    metadata, thumbnail, errors = [], [], []
+    readers = [
+        threading.Thread(target=_read_all, args=(metadata_read, metadata)),
+        threading.Thread(target=_read_all, args=(thumbnail_read, thumbnail)),
+        threading.Thread(target=lambda: errors.append(process.stderr.read())),
+    ]
+    for reader in readers:
+        reader.start()
+    frames = _read_frames(process.stdout, max_frames) if max_frames else []
+    # the rest of the output, if any, is not needed
+    process.stdout.read()
+    for reader in readers:
+        reader.join()
+    process.wait()
+
+    tags = parse_ffmetadata(metadata[0].decode('utf-8', errors='replace'))
+    if process.returncode != 0:
+        print(f"ffmpeg could not analyze {path.get_string()}: {errors[0].decode('utf-8', errors='replace').strip()}")
+        return VideoAnalysis(tags, None, [])
+    return VideoAnalysis(tags, thumbnail[0] or None, frames)
+
+
+def _collage(frames: list[Image.Image]) -> Image.Image:
+    per_row = max(int(round(sqrt(len(frames)))), 1)
+    width, height = frames[0].size
+    scale = HASH_COLLAGE_WIDTH / (per_row * width)
+    frame_width, frame_height = ceil(width * scale), ceil(height * scale)
+    rows = ceil(len(frames) / per_row)
+    collage = Image.new('RGB', (HASH_COLLAGE_WIDTH, ceil(scale * height * rows)))
+    for index, frame in enumerate(frames):
+        resized = frame.copy()
+        resized.thumbnail((frame_width, frame_height), Image.Resampling.LANCZOS)
+        collage.paste(resized, ((index % per_row) * frame_width, (index // per_row) * frame_height))
+    return collage
+
+
+def _dominant_colour(tile: Image.Image) -> str:
+    pixels = np.asarray(tile.resize((16, 16), Image.Resampling.LANCZOS).convert('RGB'), dtype=np.int16)
+    r, g, b = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    counts = {
+        'r': int(np.sum((r > g) & (r > b))),
+        'g': int(np.sum((g > b) & (g > r))),
+        'b': int(np.sum((b > r) & (b > g))),
+    }
+    counts['l'] = pixels.shape[0] * pixels.shape[1] - sum(counts.values())
+    if counts['l'] >= max(counts['r'], counts['g'], counts['b']):
+        return 'l'
+    margin = int(pixels.shape[0] * pixels.shape[1] * 0.1)
+    for colour, others in (('r', 'gb'), ('g', 'br'), ('b', 'rg')):
+        if all(counts[colour] - margin > counts[other] for other in others):
+            return colour
+    return 'n'
+
+
+def video_perceptual_hash(frames: list[Image.Image]) -> str:
+    """
+    The videohash algorithm on frames in memory: the wavelet hash of a collage of the frames, xor
+    the dominant colours of 64 tiles of the frames side by side.
+    :return: 64 bits string prefixed with 0b
+    """
+    whash_bits = imagehash.whash(_collage(frames)).hash.flatten()
+    width, height = frames[0].size
+    strip = Image.new('RGB', (width * len(frames), height))
+    for index, frame in enumerate(frames):
+        strip.paste(frame, (index * width, 0))
+    tile_width, tile_height = floor(strip.width / 8), floor(strip.height / 8)
+    expected_colours = 'r' * 16 + 'g' * 16 + 'b' * 16 + 'l' * 16
+    bits = []
+    for column in range(8):
+        for row in range(8):
+            index = len(bits)
+            area = (column * tile_width, row * tile_height, (column + 1) * tile_width, (row + 1) * tile_height)
+            colour_bit = _dominant_colour(strip.crop(area)) == expected_colours[index]
+            bits.append('1' if colour_bit != bool(whash_bits[index]) else '0')
+    return '0b' + ''.join(bits)
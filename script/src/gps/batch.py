@@ -0,0 +1,201 @@
+import numpy as np
+
+from src.gps.gps import BASE32
+
+# 5 bits per character in a uint64
+MAX_PRECISION = 12
+NEIGHBOR_DIRECTIONS = ['n', 'ne', 'e', 'se', 's', 'sw', 'w', 'nw']
+_DIRECTION_STEPS = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+_BASE32_CHARS = np.frombuffer(BASE32.encode('ascii'), dtype=np.uint8).astype(np.uint32)
+_BASE32_VALUES = np.full(256, -1, dtype=np.int16)
+_BASE32_VALUES[_BASE32_CHARS] = np.arange(32)
+
+
+def _axis_bits(precision: int) -> tuple[int, int]:
+    """
+    :return: number of longitude and latitude bits of a geohash, the first bit is a longitude one
+    """
+    total = precision * 5
+    return (total + 1) // 2, total // 2
+
+
+def _check_precision(precision: int) -> None:
+    if not 1 <= precision <= MAX_PRECISION:
+        raise ValueError(f"The precision must be between 1 and {MAX_PRECISION}")
+
+
+def _cell_index(values: np.ndarray, low: float, high: float, bits: int) -> np.ndarray:
+    """
+    The index of the cell of the values in [low, high] split in 2 ** bits cells, with the same result of the
+    bisections of encode_geohash: a value on a boundary is in the lower cell, the values out of the range
+    are in the first or in the last cell, NaN in the first.
+    """
+    cells = 1 << bits
+    size = (high - low) / cells
+    with np.errstate(invalid='ignore'):
+        index = np.floor((values - low) / size)
+    index = np.clip(np.nan_to_num(index, nan=0.0), 0, cells - 1).astype(np.int64)
+    # the boundaries are exact floats, the division may be one cell off
+    index -= (index > 0) & (values <= low + index * size)
+    index += (index < cells - 1) & (values > low + (index + 1) * size)
+    return index.astype(np.uint64)
+
+
+def _spread_bits(x: np.ndarray) -> np.ndarray:
+    """
+    Moves bit i of x (up to 32 bits) to bit 2i.
+    """
+    x = x & np.uint64(0x00000000FFFFFFFF)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x3333333333333333)
+    x = (x | (x << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return x
+
+
+def _compact_bits(x: np.ndarray) -> np.ndarray:
+    """
+    Inverse of _spread_bits: moves bit 2i of x to bit i.
+    """
+    x = x & np.uint64(0x5555555555555555)
+    x = (x | (x >> np.uint64(1))) & np.uint64(0x3333333333333333)
+    x = (x | (x >> np.uint64(2))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    x = (x | (x >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    x = (x | (x >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    x = (x | (x >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    return x
+
+
+def _interleave(lon_index: np.ndarray, lat_index: np.ndarray, precision: int) -> np.ndarray:
+    """
+    :return: the geohash bits, the first longitude bit is the most significant one
+    """
+    # the last bit is a longitude one when the number of bits is odd
+    lon_shift = np.uint64(1 - precision * 5 % 2)
+    return (_spread_bits(lon_index) << lon_shift) | (_spread_bits(lat_index) << (np.uint64(1) - lon_shift))
+
+
+def _deinterleave(codes: np.ndarray, precision: int) -> tuple[np.ndarray, np.ndarray]:
+    lon_shift = np.uint64(1 - precision * 5 % 2)
+    return _compact_bits(codes >> lon_shift), _compact_bits(codes >> (np.uint64(1) - lon_shift))
+
+
+def _write_chars(codes: np.ndarray, precision: int, chars: np.ndarray) -> None:
+    """
+    Writes the base 32 characters of the codes in chars (len(codes), precision): numpy strings are UCS-4,
+    the characters are uint32.
+    """
+    for position in range(precision):
+        shift = np.uint64(5 * (precision - 1 - position))
+        chars[:, position] = _BASE32_CHARS[(codes >> shift) & np.uint64(31)]
+
+
+def _to_strings(codes: np.ndarray, precision: int) -> np.ndarray:
+    chars = np.empty((len(codes), precision), dtype=np.uint32)
+    _write_chars(codes, precision, chars)
+    return chars.view(f'U{precision}').ravel()
+
+
+def _to_codes(geohashes) -> tuple[np.ndarray, int]:
+    """
+    :param geohashes: geohashes of the same length
+    :return: the geohash bits and the precision
+    """
+    geohashes = np.ascontiguousarray(np.asarray(geohashes, dtype=str).ravel())
+    precision = geohashes.dtype.itemsize // 4
+    _check_precision(precision)
+    chars = geohashes.view(np.uint32).reshape(len(geohashes), precision)
+    # the shorter strings are padded with 0, invalid like the characters out of base 32
+    values = np.where(chars < 256, _BASE32_VALUES[np.minimum(chars, 255)], -1)
+    if np.any(values < 0):
+        raise ValueError("Invalid geohash, the geohashes must have the same length and only base 32 characters")
+    codes = np.zeros(len(geohashes), dtype=np.uint64)
+    for position in range(precision):
+        codes = (codes << np.uint64(5)) | values[:, position].astype(np.uint64)
+    return codes, precision
+
+
+def encode_geohash_codes(latitudes, longitudes, precision: int = 9) -> np.ndarray:
+    """
+    :return: the geohashes of encode_geohash_batch as integers (5 bits per character), sorting the codes
+        sorts the geohashes and a prefix of p characters is the code shifted right by 5 * (precision - p)
+    """
+    _check_precision(precision)
+    latitudes = np.asarray(latitudes, dtype=np.float64).ravel()
+    longitudes = np.asarray(longitudes, dtype=np.float64).ravel()
+    if latitudes.shape != longitudes.shape:
+        raise ValueError("latitudes and longitudes must have the same length")
+    lon_bits, lat_bits = _axis_bits(precision)
+    return _interleave(
+        _cell_index(longitudes, -180.0, 180.0, lon_bits),
+        _cell_index(latitudes, -90.0, 90.0, lat_bits),
+        precision
+    )
+
+
+def codes_to_geohashes(codes, precision: int) -> np.ndarray:
+    """
+    :param codes: geohashes as integers, see encode_geohash_codes
+    :return: array of the geohashes (str)
+    """
+    _check_precision(precision)
+    return _to_strings(np.asarray(codes, dtype=np.uint64).ravel(), precision)
+
+
+def encode_geohash_batch(latitudes, longitudes, precision: int = 9) -> np.ndarray:
+    """
+    Same result of encode_geohash for every position, computed on the whole arrays.
+    :param latitudes: array like of latitudes
+    :param longitudes: array like of longitudes, same length
+    :param precision: number of characters, at most MAX_PRECISION
+    :return: array of the geohashes (str)
+    """
+    return _to_strings(encode_geohash_codes(latitudes, longitudes, precision), precision)
+
+
+def decode_geohash_batch(geohashes) -> dict[str, np.ndarray]:
+    """
+    :param geohashes: array like of geohashes of the same length
+    :return: the cells of the geohashes: arrays "min_latitude", "max_latitude", "min_longitude", "max_longitude"
+        and the centroids "latitude", "longitude"
+    """
+    codes, precision = _to_codes(geohashes)
+    lon_bits, lat_bits = _axis_bits(precision)
+    lon_index, lat_index = _deinterleave(codes, precision)
+    lon_size = 360.0 / 2 ** lon_bits
+    lat_size = 180.0 / 2 ** lat_bits
+    min_longitude = -180.0 + lon_index.astype(np.float64) * lon_size
+    min_latitude = -90.0 + lat_index.astype(np.float64) * lat_size
+    return {
+        "min_latitude": min_latitude,
+        "max_latitude": min_latitude + lat_size,
+        "min_longitude": min_longitude,
+        "max_longitude": min_longitude + lon_size,
+        "latitude": min_latitude + lat_size / 2,
+        "longitude": min_longitude + lon_size / 2,
+    }
+
+
+def geohash_neighbors_batch(geohashes) -> np.ndarray:
+    """
+    :param geohashes: array like of geohashes of the same length
+    :return: array (len(geohashes), 8) of the adjacent cells in the order of NEIGHBOR_DIRECTIONS.
+        The longitude wraps around the antimeridian, the cells beyond the poles are empty strings.
+    """
+    codes, precision = _to_codes(geohashes)
+    lon_bits, lat_bits = _axis_bits(precision)
+    lon_index, lat_index = _deinterleave(codes, precision)
+    lat_index = lat_index.astype(np.int64)
+    lon_index = lon_index.astype(np.int64)
+    chars = np.empty((len(_DIRECTION_STEPS), len(codes), precision), dtype=np.uint32)
+    for direction, (lat_step, lon_step) in enumerate(_DIRECTION_STEPS):
+        lat = lat_index + lat_step
+        lon = (lon_index + lon_step) % (1 << lon_bits)
+        neighbor_codes = _interleave(
+            lon.astype(np.uint64), np.clip(lat, 0, (1 << lat_bits) - 1).astype(np.uint64), precision
+        )
+        _write_chars(neighbor_codes, precision, chars[direction])
+        # beyond the poles
+        chars[direction][(lat < 0) | (lat >= (1 << lat_bits))] = 0
+    return chars.view(f'U{precision}').reshape(len(_DIRECTION_STEPS), len(codes)).T
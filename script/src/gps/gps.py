@@ -1,4 +1,5 @@
-__base32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# geohash alphabet, the value of a character is its index
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
 
 
 def encode_geohash(latitude, longitude, precision=9):
@@ -31,7 +32,7 @@ def encode_geohash(latitude, longitude, precision=9):
         if bit < 4:
             bit += 1
         else:
-            geohash += __base32[ch]
+            geohash += BASE32[ch]
             bit = 0
             ch = 0
     return ''.join(geohash)
@@ -0,0 +1,181 @@
+import json
+from math import asin, cos, degrees, radians, sin
+from typing import Iterable
+
+import numpy as np
+
+from src.database.utils import open_database_file
+from src.file.path import PhotospherePath
+from src.gps.batch import MAX_PRECISION, _axis_bits, _cell_index, _interleave, codes_to_geohashes, \
+    encode_geohash_codes
+
+EARTH_RADIUS_METERS = 6371008.8
+# the records are sorted by their geohash at the max precision
+INDEX_PRECISION = MAX_PRECISION
+# max number of geohash cells searched for a box, the finest precision under it is used
+MAX_COVER_CELLS = 64
+DEFAULT_CELL_PRECISION = 5
+
+
+def geohash_cover(
+        min_latitude: float,
+        min_longitude: float,
+        max_latitude: float,
+        max_longitude: float,
+        max_cells: int = MAX_COVER_CELLS
+    ) -> tuple[np.ndarray, int]:
+    """
+    The geohash cells covering a box that doesn't cross the antimeridian, at the finest precision with at most
+    max_cells cells (the cells of precision 1 are 32).
+    :return: the cells as integers (see encode_geohash_codes) and their precision
+    """
+    cover = None
+    for precision in range(1, MAX_PRECISION + 1):
+        lon_bits, lat_bits = _axis_bits(precision)
+        lon_first, lon_last = _cell_index(np.array([min_longitude, max_longitude]), -180.0, 180.0, lon_bits)
+        lat_first, lat_last = _cell_index(np.array([min_latitude, max_latitude]), -90.0, 90.0, lat_bits)
+        if cover is not None and (int(lon_last - lon_first) + 1) * (int(lat_last - lat_first) + 1) > max_cells:
+            break
+        lon, lat = np.meshgrid(
+            np.arange(lon_first, lon_last + 1, dtype=np.uint64),
+            np.arange(lat_first, lat_last + 1, dtype=np.uint64)
+        )
+        cover = _interleave(lon.ravel(), lat.ravel(), precision), precision
+    return cover
+
+
+def haversine_meters(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """
+    :return: the great circle distances from (latitude, longitude) to the positions
+    """
+    lat1, lat2 = np.radians(latitude), np.radians(latitudes)
+    delta_lat = lat2 - lat1
+    delta_lon = np.radians(longitudes - longitude)
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class SpatialIndex:
+    """
+    The records with a position, sorted by geohash: the records in a geohash cell are a contiguous range
+    found with a binary search. A box is covered with at most MAX_COVER_CELLS cells, so a query is
+    O(cells * log n) binary searches plus the records in the cells, checked against the exact bounds.
+    """
+
+    def __init__(self, records: Iterable[dict]):
+        """
+        :param records: database records, the ones without latitude and longitude are ignored
+        """
+        located = [
+            record for record in records
+            if record.get("latitude") is not None and record.get("longitude") is not None
+        ]
+        latitudes = np.array([record["latitude"] for record in located], dtype=np.float64)
+        longitudes = np.array([record["longitude"] for record in located], dtype=np.float64)
+        codes = encode_geohash_codes(latitudes, longitudes, INDEX_PRECISION)
+        order = np.argsort(codes, kind='stable')
+        self.codes = codes[order]
+        self.latitudes = latitudes[order]
+        self.longitudes = longitudes[order]
+        self.records = [located[index] for index in order.tolist()]
+
+    def _candidates(self, min_latitude: float, min_longitude: float, max_latitude: float, max_longitude: float):
+        """
+        :return: positions (in the sorted order) of the records in the box, that doesn't cross the antimeridian
+        """
+        cells, precision = geohash_cover(min_latitude, min_longitude, max_latitude, max_longitude)
+        shift = np.uint64(5 * (INDEX_PRECISION - precision))
+        cells = np.sort(cells)
+        starts = np.searchsorted(self.codes, cells << shift, side='left')
+        ends = np.searchsorted(self.codes, (cells + np.uint64(1)) << shift, side='left')
+        positions = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] or [[]])
+        positions = positions.astype(np.int64)
+        latitudes, longitudes = self.latitudes[positions], self.longitudes[positions]
+        inside = (
+            (latitudes >= min_latitude) & (latitudes <= max_latitude)
+            & (longitudes >= min_longitude) & (longitudes <= max_longitude)
+        )
+        return positions[inside]
+
+    def _boxes_candidates(self, boxes: list[tuple[float, float, float, float]]) -> np.ndarray:
+        return np.unique(np.concatenate([self._candidates(*box) for box in boxes]))
+
+    def query_bbox(
+            self,
+            min_latitude: float,
+            min_longitude: float,
+            max_latitude: float,
+            max_longitude: float
+        ) -> list[dict]:
+        """
+        :param min_longitude: greater than max_longitude for a box crossing the antimeridian
+        :return: the records in the box (bounds included), in geohash order
+        """
+        if min_longitude <= max_longitude:
+            boxes = [(min_latitude, min_longitude, max_latitude, max_longitude)]
+        else:
+            boxes = [(min_latitude, min_longitude, max_latitude, 180.0), (min_latitude, -180.0, max_latitude, max_longitude)]
+        return [self.records[position] for position in self._boxes_candidates(boxes).tolist()]
+
+    def query_near(self, latitude: float, longitude: float, radius: float) -> list[tuple[dict, float]]:
+        """
+        :param radius: in meters
+        :return: the records within radius and their distance in meters, the nearest first
+        """
+        angle = radius / EARTH_RADIUS_METERS
+        delta_latitude = degrees(angle)
+        min_latitude = max(latitude - delta_latitude, -90.0)
+        max_latitude = min(latitude + delta_latitude, 90.0)
+        if min_latitude == -90.0 or max_latitude == 90.0 or sin(angle) >= cos(radians(latitude)):
+            # the circle contains a pole: all the longitudes
+            boxes = [(min_latitude, -180.0, max_latitude, 180.0)]
+        else:
+            delta_longitude = degrees(asin(sin(angle) / cos(radians(latitude))))
+            min_longitude, max_longitude = longitude - delta_longitude, longitude + delta_longitude
+            if min_longitude < -180.0:
+                boxes = [(min_latitude, min_longitude + 360, max_latitude, 180.0),
+                         (min_latitude, -180.0, max_latitude, max_longitude)]
+            elif max_longitude > 180.0:
+                boxes = [(min_latitude, min_longitude, max_latitude, 180.0),
+                         (min_latitude, -180.0, max_latitude, max_longitude - 360)]
+            else:
+                boxes = [(min_latitude, min_longitude, max_latitude, max_longitude)]
+        positions = self._boxes_candidates(boxes)
+        distances = haversine_meters(latitude, longitude, self.latitudes[positions], self.longitudes[positions])
+        inside = distances <= radius
+        positions, distances = positions[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return [(self.records[position], distance)
+                for position, distance in zip(positions[order].tolist(), distances[order].tolist())]
+
+    def cell_counts(self, precision: int = DEFAULT_CELL_PRECISION) -> dict[str, int]:
+        """
+        :return: number of records in every geohash cell of the precision that contains some, in geohash order
+        """
+        cells, counts = np.unique(self.codes >> np.uint64(5 * (INDEX_PRECISION - precision)), return_counts=True)
+        return dict(zip(codes_to_geohashes(cells, precision).tolist(), counts.tolist()))
+
+    def export_cell_counts(self, path: PhotospherePath, precision: int = DEFAULT_CELL_PRECISION) -> int:
+        """
+        Writes {"precision": int, "count": records, "cells": {geohash: records}} in a json file,
+        enough to draw the clusters of a map without the records.
+        :return: number of cells
+        """
+        cells = self.cell_counts(precision)
+        with open(path.get_string(), 'w', encoding='utf-8') as f:
+            json.dump({"precision": precision, "count": len(self), "cells": cells}, f, separators=(',', ':'))
+        return len(cells)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+
+def load_spatial_index(db_path: PhotospherePath) -> SpatialIndex:
+    """
+    :param db_path: a TinyDB json or .sqlite database
+    """
+    db = open_database_file(db_path)
+    try:
+        return SpatialIndex(db.iterate())
+    finally:
+        db.close()
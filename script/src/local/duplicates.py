@@ -0,0 +1,183 @@
+import json
+from collections import defaultdict
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from src.database.utils import open_database_file
+from src.file.path import PhotospherePath
+
+DEFAULT_MAX_DISTANCE = 10
+
+
+def parse_average_hash(value: str | None) -> tuple[int, int] | None:
+    """
+    :param value: an average hash of the database: hex for the images, '0b' binary for the videos
+    :return: (number of bits, hash as int), None if there is no hash
+    """
+    if not value:
+        return None
+    # a hex hash can start with 0b too
+    if value.startswith('0b') and not value[2:].strip('01'):
+        return len(value) - 2, int(value, 2)
+    return len(value) * 4, int(value, 16)
+
+
+def _segments(bits: int, count: int) -> list[tuple[int, int]]:
+    """
+    :return: (shift, width) of count contiguous substrings covering the bits, of widths differing by at most one
+    """
+    base, extra = divmod(bits, count)
+    segments = []
+    shift = 0
+    for index in range(count):
+        width = base + 1 if index < extra else base
+        segments.append((shift, width))
+        shift += width
+    return segments
+
+
+def _to_words(values: list[int], bits: int) -> np.ndarray:
+    """
+    :return: the hashes as rows of 64 bits words, the least significant first
+    """
+    size = -(-bits // 64) * 8
+    data = b''.join(value.to_bytes(size, 'little') for value in values)
+    return np.frombuffer(data, dtype='<u8').reshape(len(values), size // 8)
+
+
+def _segment_keys(words: np.ndarray, shift: int, width: int) -> np.ndarray:
+    """
+    :return: the bits [shift, shift + width) of each row, width is at most 64
+    """
+    word, offset = divmod(shift, 64)
+    keys = words[:, word] >> np.uint64(offset)
+    if offset + width > 64:
+        keys |= words[:, word + 1] << np.uint64(64 - offset)
+    if width < 64:
+        keys &= np.uint64((1 << width) - 1)
+    return keys
+
+
+def near_duplicate_pairs(values: list[int], bits: int, max_distance: int) -> Iterator[tuple[int, int, int]]:
+    """
+    Multi-index hashing: the hashes are split in at least max_distance + 1 substrings, two hashes within
+    max_distance differ in at most max_distance substrings, so at least one substring is equal. For each
+    substring the hashes are sorted by it and only the ones sharing it are compared, each pair is returned
+    once (for the first substring they share).
+    :param values: distinct hashes of `bits` bits
+    :param max_distance: max Hamming distance, lower than bits
+    :return: (index, index, distance) of the pairs within max_distance, the lower index first
+    """
+    if not 0 <= max_distance < bits:
+        raise ValueError(f"The distance must be between 0 and {bits - 1}")
+    words = _to_words(values, bits)
+    # more substrings keep the property, and make them fit in 64 bits
+    segments = _segments(bits, max(max_distance + 1, -(-bits // 64)))
+    for position, (shift, width) in enumerate(segments):
+        keys = _segment_keys(words, shift, width)
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        equal = keys[1:] == keys[:-1]
+        shared = np.zeros(len(keys), dtype=bool)
+        shared[1:] |= equal
+        shared[:-1] |= equal
+        order, keys = order[shared], keys[shared]
+        # the pairs of hashes `offset` apart in the sorted order, until no run of equal keys is that long
+        offset = 1
+        while offset < len(keys):
+            same = keys[offset:] == keys[:-offset]
+            if not same.any():
+                break
+            first, second = order[:-offset][same], order[offset:][same]
+            xor = words[first] ^ words[second]
+            distances = np.bitwise_count(xor).sum(axis=1)
+            found = distances <= max_distance
+            for previous_shift, previous_width in segments[:position]:
+                # already found with a previous substring
+                found &= _segment_keys(xor, previous_shift, previous_width) != 0
+            yield from zip(first[found].tolist(), second[found].tolist(), distances[found].tolist())
+            offset += 1
+
+
+class _DisjointSet:
+    """
+    Union-find of the items added with union, the others are not stored.
+    """
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item: int) -> int:
+        parent = self.parent.setdefault(item, item)
+        while parent != item:
+            grandparent = self.parent[parent]
+            self.parent[item] = grandparent
+            item, parent = parent, grandparent
+        return item
+
+    def union(self, first: int, second: int) -> None:
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+
+def cluster_near_duplicates(records: Iterable[dict], max_distance: int = DEFAULT_MAX_DISTANCE) -> list[list[dict]]:
+    """
+    Groups the records whose average hashes are within max_distance bits, transitively: A and C are in the
+    same cluster if both are near B. Image and video hashes (of different sizes) are never compared.
+    :param records: database records, the ones without average_hash are ignored
+    :param max_distance: max Hamming distance between two near duplicates
+    :return: the clusters with more than one record, the largest first
+    """
+    # the identical hashes are compared once
+    by_hash: dict[str, list[dict]] = defaultdict(list)
+    for record in records:
+        if record.get("average_hash"):
+            by_hash[record["average_hash"]].append(record)
+    by_size: dict[int, tuple[list[str], list[int]]] = defaultdict(lambda: ([], []))
+    for average_hash in by_hash:
+        bits, value = parse_average_hash(average_hash)
+        by_size[bits][0].append(average_hash)
+        by_size[bits][1].append(value)
+
+    clusters = []
+    for bits, (hashes, values) in by_size.items():
+        disjoint_set = _DisjointSet()
+        for first, second, _ in near_duplicate_pairs(values, bits, min(max_distance, bits - 1)):
+            disjoint_set.union(first, second)
+        groups = defaultdict(list)
+        for index in disjoint_set.parent:
+            groups[disjoint_set.find(index)].extend(by_hash[hashes[index]])
+        clusters.extend(groups.values())
+        # identical hashes without other near duplicates
+        clusters.extend(
+            by_hash[average_hash] for index, average_hash in enumerate(hashes)
+            if len(by_hash[average_hash]) > 1 and index not in disjoint_set.parent
+        )
+    for cluster in clusters:
+        cluster.sort(key=lambda record: record.get("local_file_path") or "")
+    clusters.sort(key=lambda cluster: (-len(cluster), cluster[0].get("local_file_path") or ""))
+    return clusters
+
+
+def find_duplicates(
+        db_path: PhotospherePath,
+        max_distance: int = DEFAULT_MAX_DISTANCE,
+        out_path: PhotospherePath = None
+    ) -> list[list[dict]]:
+    """
+    :param db_path: a TinyDB json or .sqlite database
+    :param max_distance: max Hamming distance between two near duplicates
+    :param out_path: json file where the clusters are written, None to not write them
+    :return: the clusters, see cluster_near_duplicates
+    """
+    db = open_database_file(db_path)
+    try:
+        clusters = cluster_near_duplicates(db.iterate(), max_distance)
+    finally:
+        db.close()
+    if out_path is not None:
+        with open(out_path.get_string(), 'w', encoding='utf-8') as f:
+            json.dump({"max_distance": max_distance, "clusters": clusters}, f, indent=2)
+    return clusters
@@ -0,0 +1,187 @@
+import os
+import sqlite3
+
+from src.file.image.image import PhotosphereImage
+from src.file.local_file import PhotosphereFile
+from src.file.path import PhotospherePath
+from src.file.video.analyzer import VIDEO_HASH_VERSION
+from src.file.video.video import PhotosphereVideo
+from src.local.hashing import DEFAULT_HASH_ALGORITHM
+from src.local.utils import file_hash
+
+FILE_CACHE_FILE = 'photosphere_file_cache.sqlite'
+# extensions of the files load_photosphere_file can load, the other files can be skipped while listing a folder
+SUPPORTED_EXTENSIONS: set[str] = (
+    PhotosphereImage.ALLOWED_EXTENSIONS | PhotosphereVideo.ALLOWED_EXTENSIONS | PhotosphereFile.ALLOWED_EXTENSIONS
+)
+
+
+class FileStatCache:
+    """
+    On disk cache (SQLite) of the values that need to read a whole file: hash, average hash and metadata.
+    An entry is valid only while path, inode, size and mtime of the file are unchanged,
+    so an unchanged tree is only stat()ed (once, while listed, see PhotospherePath.get_stat).
+    The hash is reused only with the algorithm it was computed with, and the video average hashes
+    of another VIDEO_HASH_VERSION are dropped when the cache is opened.
+    """
+
+    def __init__(self, cache_path: PhotospherePath):
+        """
+        :param cache_path: the SQLite file, see get_file_cache_path
+        """
+        self.connection = sqlite3.connect(cache_path.get_string(), timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(f"""
+            CREATE TABLE IF NOT EXISTS file_cache (
+                path TEXT PRIMARY KEY,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                hash TEXT NOT NULL,
+                file_type TEXT,
+                average_hash TEXT,
+                created_at TEXT,
+                latitude REAL,
+                longitude REAL,
+                hash_algorithm TEXT NOT NULL DEFAULT '{DEFAULT_HASH_ALGORITHM}'
+            )
+        """)
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(file_cache)")}
+        if "hash_algorithm" not in columns:
+            # cache written before the hash algorithm could be chosen: sha1 hashes
+            self.connection.execute(
+                f"ALTER TABLE file_cache ADD COLUMN hash_algorithm TEXT NOT NULL DEFAULT '{DEFAULT_HASH_ALGORITHM}'"
+            )
+        # the user_version of the cache is the version of its video average hashes
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != int(VIDEO_HASH_VERSION):
+            # computed again on the next use of the entries
+            self.connection.execute(
+                f"UPDATE file_cache SET average_hash = NULL WHERE file_type = '{PhotosphereVideo.TYPE}'"
+            )
+            self.connection.execute(f"PRAGMA user_version = {int(VIDEO_HASH_VERSION)}")
+        self.connection.commit()
+
+    def get(self, file_path: PhotospherePath, hash_algorithm: str = DEFAULT_HASH_ALGORITHM) -> dict | None:
+        """
+        :param file_path: the file path
+        :param hash_algorithm: the algorithm of the hash
+        :return: the cached entry, None if missing, if the file changed since it was cached or if it was hashed
+            with another algorithm. "file_type" is None when only the hash was cached.
+        """
+        stat = file_path.get_stat()
+        row = self.connection.execute(
+            "SELECT hash, file_type, average_hash, created_at, latitude, longitude FROM file_cache "
+            "WHERE path = ? AND inode = ? AND size = ? AND mtime_ns = ? AND hash_algorithm = ?",
+            (file_path.get_string(), stat.st_ino, stat.st_size, stat.st_mtime_ns, hash_algorithm)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "hash": row[0],
+            "file_type": row[1],
+            "average_hash": row[2],
+            "created_at": row[3],
+            "latitude": row[4],
+            "longitude": row[5],
+        }
+
+    def put_hash(self, file_path: PhotospherePath, hash: str, hash_algorithm: str = DEFAULT_HASH_ALGORITHM) -> None:
+        """
+        Caches only the hash of a file, its metadata will be extracted the first time it is needed.
+        """
+        self._put(file_path, hash_algorithm, hash, None, None, None, None, None)
+
+    def put(self, ps: PhotosphereFile, hash_algorithm: str = DEFAULT_HASH_ALGORITHM) -> None:
+        """
+        Caches hash, average hash and metadata of an analyzed file.
+        The average hash is cached only if already computed, it is computed on the next use of the entry.
+        """
+        self._put(
+            ps.get_local_file_path(),
+            hash_algorithm,
+            ps.get_hash(),
+            ps.get_file_type(),
+            ps.get_average_hash() if ps.is_average_hash_loaded() else None,
+            ps.get_created_at(),
+            ps.get_latitude(),
+            ps.get_longitude()
+        )
+
+    def _put(self, file_path: PhotospherePath, hash_algorithm: str, *values) -> None:
+        stat = file_path.get_stat()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO file_cache (path, inode, size, mtime_ns, hash, file_type, average_hash, "
+            "created_at, latitude, longitude, hash_algorithm) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (file_path.get_string(), stat.st_ino, stat.st_size, stat.st_mtime_ns, *values, hash_algorithm)
+        )
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def get_file_cache_path(database_path: PhotospherePath) -> PhotospherePath:
+    """
+    :param database_path: the database of the files, or any file of the folder where the cache is kept
+    :return: the FILE_CACHE_FILE in the folder of the database
+    """
+    return PhotospherePath(os.path.join(os.path.dirname(os.path.abspath(database_path.get_string())), FILE_CACHE_FILE))
+
+
+def cached_file_hash(
+        file_path: PhotospherePath,
+        cache: FileStatCache | None,
+        hash_algorithm: str = DEFAULT_HASH_ALGORITHM
+    ) -> str:
+    """
+    :param file_path: the file path
+    :param cache: the cache to use, None to always read the file
+    :param hash_algorithm: one of HASH_ALGORITHMS
+    :return: the hash of the file
+    """
+    if cache is None:
+        return file_hash(file_path, hash_algorithm)
+    entry = cache.get(file_path, hash_algorithm)
+    if entry is not None:
+        return entry["hash"]
+    hash = file_hash(file_path, hash_algorithm)
+    cache.put_hash(file_path, hash, hash_algorithm)
+    return hash
+
+
+def load_photosphere_file(
+        file_path: PhotospherePath,
+        cache: FileStatCache | None,
+        classes: tuple[type[PhotosphereFile], ...] = (PhotosphereImage, PhotosphereVideo, PhotosphereFile),
+        with_average_hash: bool = True,
+        hash_algorithm: str = DEFAULT_HASH_ALGORITHM
+    ) -> PhotosphereFile | None:
+    """
+    Creates the PhotosphereFile (or subclass) of a file, from the cache when the file didn't change.
+    :param file_path: the file path
+    :param cache: the cache to use, None to always analyze the file
+    :param classes: the classes to try, in order, by allowed extension
+    :param with_average_hash: compute the average hash now (and cache it), when False it is computed on first access
+        if the class allows it, so only the metadata are read
+    :param hash_algorithm: one of HASH_ALGORITHMS
+    :return: the PhotosphereFile, None if the extension is not allowed by any class
+    """
+    for ps_class in classes:
+        if file_path.is_allowed_extension(ps_class.ALLOWED_EXTENSIONS):
+            break
+    else:
+        return None
+    if cache is None:
+        return ps_class(file_path, file_hash(file_path, hash_algorithm))
+    entry = cache.get(file_path, hash_algorithm)
+    if entry is not None and entry["file_type"] == ps_class.TYPE:
+        ps = ps_class.from_cache_entry(file_path, entry)
+        if ps.is_average_hash_loaded() or not with_average_hash:
+            return ps
+    else:
+        ps = ps_class(file_path, entry["hash"] if entry is not None else file_hash(file_path, hash_algorithm))
+    if with_average_hash:
+        ps.get_average_hash()
+    cache.put(ps, hash_algorithm)
+    return ps
@@ -0,0 +1,140 @@
+import errno
+import os
+import shutil
+import sys
+
+from src.file.path import PhotospherePath
+from src.local.hashing import is_same_content
+from src.local.utils import create_folder_if_not_exists
+
+COPY_MODE = 'copy'
+MOVE_MODE = 'move'
+HARDLINK_MODE = 'hardlink'
+REFLINK_MODE = 'reflink'
+TRANSFER_MODES = [COPY_MODE, MOVE_MODE, HARDLINK_MODE, REFLINK_MODE]
+# the file was already in the destination folder, nothing was written
+EXISTING = 'existing'
+# linux ioctl cloning a whole file (btrfs, xfs, bcachefs...)
+_FICLONE = 0x40049409
+# the link or clone is not possible for this file: another filesystem, or not supported by the filesystem
+_FALLBACK_ERRORS = {
+    errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOTTY,
+    errno.ENOSYS
+}
+
+
+def _clone(source: str, destination: str) -> None:
+    """
+    Copy on write clone of source in destination, that must not exist.
+    :raise OSError: if the filesystem can't clone the file
+    """
+    if sys.platform == 'darwin':
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(source), os.fsencode(destination), 0) != 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), destination)
+        return
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.ENOTSUP, "Reflink is not supported on this platform", destination)
+    import fcntl
+    with open(source, 'rb') as source_file, open(destination, 'xb') as destination_file:
+        try:
+            fcntl.ioctl(destination_file.fileno(), _FICLONE, source_file.fileno())
+        except OSError:
+            os.unlink(destination)
+            raise
+    shutil.copystat(source, destination)
+
+
+def _copy(source: str, destination: str) -> None:
+    """
+    Copies source with its metadata in destination, that must not exist; a partial copy is removed.
+    """
+    # the name is taken before copying, so a file created in the meantime is never overwritten
+    open(destination, 'xb').close()
+    try:
+        shutil.copy2(source, destination)
+    except BaseException:
+        os.unlink(destination)
+        raise
+
+
+def _move(source: str, destination: str) -> None:
+    """
+    Moves source in destination, that must not exist: a new link and the removal of the old one on the same
+    filesystem, a copy and the removal of the source on another one.
+    """
+    try:
+        os.link(source, destination)
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            _copy(source, destination)
+        elif e.errno in _FALLBACK_ERRORS:
+            # no hard links on the filesystem (FAT, exFAT...)
+            if os.path.lexists(destination):
+                raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), destination)
+            os.rename(source, destination)
+            return
+        else:
+            raise
+    os.unlink(source)
+
+
+def _transfer(source: str, destination: str, mode: str) -> str:
+    """
+    :return: the mode used, COPY_MODE if the link or clone of mode is not possible for this file
+    """
+    if mode == MOVE_MODE:
+        _move(source, destination)
+        return MOVE_MODE
+    if mode in (HARDLINK_MODE, REFLINK_MODE):
+        try:
+            if mode == HARDLINK_MODE:
+                os.link(source, destination)
+            else:
+                _clone(source, destination)
+            return mode
+        except OSError as e:
+            if e.errno not in _FALLBACK_ERRORS:
+                raise
+    _copy(source, destination)
+    return COPY_MODE
+
+
+def transfer_file(
+        file_path: PhotospherePath,
+        destination_folder: PhotospherePath,
+        mode: str = COPY_MODE
+    ) -> tuple[PhotospherePath, str]:
+    """
+    Puts the file in the destination folder, without overwriting: when the name is taken by another file the
+    file gets the first free name among name_1.ext, name_2.ext... A file with the same content already in the
+    folder (under the name or a suffixed one) is reused, so running again on the same files writes nothing.
+    :param file_path: the file
+    :param destination_folder: the folder, created if needed
+    :param mode: COPY_MODE, MOVE_MODE (the source is removed), HARDLINK_MODE or REFLINK_MODE (copy on write clone),
+        the last two fall back to a copy for a file on another filesystem or on a filesystem without support
+    :return: the new file path and the mode used, EXISTING if the file was already in the folder
+    """
+    if mode not in TRANSFER_MODES:
+        raise ValueError(f"Unknown transfer mode {mode}, expected one of {TRANSFER_MODES}")
+    create_folder_if_not_exists(destination_folder)
+    source = file_path.get_string()
+    stem, suffix = os.path.splitext(file_path.get_basename())
+    index = 0
+    while True:
+        new_file_path = destination_folder.join(f"{stem}_{index}{suffix}" if index else file_path.get_basename())
+        destination = new_file_path.get_string()
+        if os.path.lexists(destination):
+            if os.path.isfile(destination) and is_same_content(file_path, new_file_path):
+                if mode == MOVE_MODE and os.path.abspath(source) != os.path.abspath(destination):
+                    os.unlink(source)
+                return new_file_path, EXISTING
+        else:
+            try:
+                return new_file_path, _transfer(source, destination, mode)
+            except FileExistsError:
+                # taken in the meantime, checked again
+                continue
+        index += 1
@@ -1,31 +1,73 @@
-from src.file.image.image import PhotosphereImage
-from src.file.local_file import PhotosphereFile
+from src.database.photosphere_database import PhotosphereDatabase, HASH_ALGORITHM_KEY, check_video_hash_version
+from src.database.utils import open_database, TINYDB_BACKEND
 from src.file.path import PhotospherePath
-from src.file.video.video import PhotosphereVideo
+from src.file.video.analyzer import VIDEO_HASH_VERSION
+from src.local.file_cache import FileStatCache, SUPPORTED_EXTENSIONS, get_file_cache_path, load_photosphere_file
+from src.local.hashing import DEFAULT_HASH_ALGORITHM, check_hash_algorithm
 from src.local.utils import loop_on_files_in_folder_decorator
-from tinydb import TinyDB, Query
 
 
 LOCAL_DATABASE_FILE = "local_database.json"
 
-def generate_local_database(folder_path: PhotospherePath, out_path: PhotospherePath):
-    db = TinyDB(LOCAL_DATABASE_FILE)
-    loop_on_files(folder_path, db)
+def generate_local_database(
+        folder_path: PhotospherePath,
+        out_path: PhotospherePath,
+        db_backend: str = TINYDB_BACKEND,
+        hash_algorithm: str = None
+    ):
+    db_path = PhotospherePath(LOCAL_DATABASE_FILE)
+    db = open_database(db_path, db_backend)
+    try:
+        hash_algorithm = resolve_hash_algorithm(db, hash_algorithm)
+        check_video_hash_version(db, VIDEO_HASH_VERSION, f"The database {LOCAL_DATABASE_FILE}")
+    except ValueError:
+        db.close()
+        raise
+    print(f"Hashing the files with {hash_algorithm}")
+    cache = FileStatCache(get_file_cache_path(db_path))
+    try:
+        loop_on_files(folder_path, db, cache, hash_algorithm)
+    finally:
+        cache.close()
     db.insert_multiple(buffer_list)
+    buffer_list.clear()
+    db.close()
+
+
+def resolve_hash_algorithm(db: PhotosphereDatabase, hash_algorithm: str = None) -> str:
+    """
+    The hashes of a database are all of one algorithm, otherwise the same file would be recorded twice:
+    a new database records the algorithm chosen, the others keep theirs.
+    :param hash_algorithm: the algorithm chosen, None for the one of the database (sha1 for a new one)
+    :return: the algorithm of the records
+    :raise ValueError: if the database has another algorithm or the algorithm is not installed
+    """
+    db_algorithm = db.get_metadata(HASH_ALGORITHM_KEY)
+    if db_algorithm is None and len(db) > 0:
+        # generated before the algorithm could be chosen
+        db_algorithm = DEFAULT_HASH_ALGORITHM
+    if db_algorithm is None:
+        db_algorithm = check_hash_algorithm(hash_algorithm or DEFAULT_HASH_ALGORITHM)
+    elif hash_algorithm is not None and hash_algorithm != db_algorithm:
+        raise ValueError(
+            f"The database {LOCAL_DATABASE_FILE} has {db_algorithm} hashes, it can't be generated with {hash_algorithm}"
+        )
+    db.set_metadata(HASH_ALGORITHM_KEY, db_algorithm)
+    return check_hash_algorithm(db_algorithm)
 
 buffer_list = []
 
-@loop_on_files_in_folder_decorator
-def loop_on_files(file_path: PhotospherePath, db: TinyDB):
-    if file_path.is_allowed_extension(PhotosphereImage.ALLOWED_EXTENSIONS):
-        ps = PhotosphereImage(file_path)
-    elif file_path.is_allowed_extension(PhotosphereVideo.ALLOWED_EXTENSIONS):
-        ps = PhotosphereVideo(file_path)
-    elif file_path.is_allowed_extension(PhotosphereFile.ALLOWED_EXTENSIONS):
-        ps = PhotosphereFile(file_path)
-    else:
+@loop_on_files_in_folder_decorator(extensions=SUPPORTED_EXTENSIONS)
+def loop_on_files(
+        file_path: PhotospherePath,
+        db: PhotosphereDatabase,
+        cache: FileStatCache = None,
+        hash_algorithm: str = DEFAULT_HASH_ALGORITHM
+    ):
+    ps = load_photosphere_file(file_path, cache, hash_algorithm=hash_algorithm)
+    if ps is None:
         return
-    if not db.contains(Query().hash == ps.get_hash()):
+    if not db.contains_hash(ps.get_hash()):
         buffer_list.append(ps.get_dic())
         if len(buffer_list) >= 100:
             db.insert_multiple(buffer_list)
@@ -34,4 +76,3 @@ def loop_on_files(file_path: PhotospherePath, db: TinyDB):
         return
 
 
-
@@ -0,0 +1,125 @@
+import hashlib
+import mmap
+import os
+
+from src.file.path import PhotospherePath
+from src.util.profiling import span
+
+SHA1_ALGORITHM = 'sha1'
+BLAKE3_ALGORITHM = 'blake3'
+XXH3_ALGORITHM = 'xxh3_128'
+HASH_ALGORITHMS = [SHA1_ALGORITHM, BLAKE3_ALGORITHM, XXH3_ALGORITHM]
+# the hashes of the existing catalogues and caches are sha1
+DEFAULT_HASH_ALGORITHM = SHA1_ALGORITHM
+# python package of the algorithms that are not in hashlib
+_ALGORITHM_PACKAGES = {BLAKE3_ALGORITHM: 'blake3', XXH3_ALGORITHM: 'xxhash'}
+# larger buffers fall out of the CPU caches and are slower
+READ_BUFFER_SIZE = 256 << 10
+# larger files are memory mapped and hashed in one call, without copying them in a buffer
+MMAP_MIN_SIZE = 8 << 20
+QUICK_HASH_SAMPLE_SIZE = 64 << 10
+
+
+def new_hash(algorithm: str = DEFAULT_HASH_ALGORITHM, large_input: bool = False):
+    """
+    :param algorithm: one of HASH_ALGORITHMS, blake3 and xxh3_128 need their package (the fast-hash extra)
+    :param large_input: blake3 hashes a large input on all the cores
+    :return: a hash object with update and hexdigest
+    """
+    if algorithm == SHA1_ALGORITHM:
+        return hashlib.sha1()
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unknown hash algorithm {algorithm}, expected one of {HASH_ALGORITHMS}")
+    try:
+        if algorithm == BLAKE3_ALGORITHM:
+            from blake3 import blake3
+            return blake3(max_threads=blake3.AUTO) if large_input else blake3()
+        from xxhash import xxh3_128
+        return xxh3_128()
+    except ImportError:
+        raise ValueError(
+            f"The hash algorithm {algorithm} needs the package {_ALGORITHM_PACKAGES[algorithm]}: "
+            f"pip install \"photosphere[fast-hash]\" (or pip install {_ALGORITHM_PACKAGES[algorithm]})"
+        ) from None
+
+
+def check_hash_algorithm(algorithm: str) -> str:
+    """
+    :raise ValueError: if the algorithm is unknown or its package is not installed
+    """
+    new_hash(algorithm)
+    return algorithm
+
+
+def hash_file(
+        file_path: PhotospherePath,
+        algorithm: str = DEFAULT_HASH_ALGORITHM,
+        buffer_size: int = READ_BUFFER_SIZE
+    ) -> str:
+    """
+    Hash of the content of a file. Files of at least MMAP_MIN_SIZE are memory mapped, the smaller ones (and the
+    files that can't be mapped) are read in buffer_size chunks in a reused buffer. hashlib releases the GIL while
+    hashing, so files can be hashed on threads.
+    :return: the hex digest
+    """
+    with open(file_path.get_string(), 'rb', buffering=0) as f, span("file.hash") as hash_span:
+        size = os.fstat(f.fileno()).st_size
+        hash_span.add_bytes(size)
+        if size >= MMAP_MIN_SIZE:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                mapped = None
+            if mapped is not None:
+                with mapped:
+                    if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                        mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    hash = new_hash(algorithm, large_input=True)
+                    hash.update(mapped)
+                    return hash.hexdigest()
+        hash = new_hash(algorithm)
+        buffer = bytearray(min(buffer_size, max(size, 1)))
+        view = memoryview(buffer)
+        while True:
+            read = f.readinto(buffer)
+            if not read:
+                break
+            hash.update(view[:read])
+        return hash.hexdigest()
+
+
+def quick_hash(
+        file_path: PhotospherePath,
+        algorithm: str = DEFAULT_HASH_ALGORITHM,
+        sample_size: int = QUICK_HASH_SAMPLE_SIZE
+    ) -> str:
+    """
+    Hash of the size, the first and the last sample_size bytes of a file (the whole file if it is smaller than
+    two samples): files with different quick hashes are different, files with the same one are probably the same
+    and need a full hash to be sure. Reads at most 2 * sample_size bytes.
+    """
+    with open(file_path.get_string(), 'rb', buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        hash = new_hash(algorithm)
+        hash.update(size.to_bytes(8, 'little'))
+        if size <= 2 * sample_size:
+            hash.update(f.read())
+        else:
+            hash.update(f.read(sample_size))
+            f.seek(size - sample_size)
+            hash.update(f.read(sample_size))
+        return hash.hexdigest()
+
+
+def is_same_content(first: PhotospherePath, second: PhotospherePath, algorithm: str = DEFAULT_HASH_ALGORITHM) -> bool:
+    """
+    Compares two files by size, then quick hash, then full hash: the full hash is computed only when the quick
+    hashes are the same.
+    """
+    if os.path.samefile(first.get_string(), second.get_string()):
+        return True
+    if os.path.getsize(first.get_string()) != os.path.getsize(second.get_string()):
+        return False
+    if quick_hash(first, algorithm) != quick_hash(second, algorithm):
+        return False
+    return hash_file(first, algorithm) == hash_file(second, algorithm)
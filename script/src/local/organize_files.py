@@ -1,30 +1,48 @@
+from collections import Counter
+
 from src.file.image.image import PhotosphereImage
 from src.file.path import PhotospherePath
 from src.file.video.video import PhotosphereVideo
+from src.local.file_cache import FileStatCache, FILE_CACHE_FILE, load_photosphere_file
+from src.local.file_transfer import COPY_MODE, transfer_file
 from src.local.local_folders_name import RESULT_FOLDER, SKIPPED_FOLDER, NO_DATETIME_FOLDER
-from src.local.utils import create_folder_if_not_exists, loop_on_files_in_folder_decorator, copy_file_to_new_folder
+from src.local.utils import create_folder_if_not_exists, loop_on_files_in_folder_decorator
 
 
-def organize_all_files(source: PhotospherePath, destination: PhotospherePath):
+def organize_all_files(source: PhotospherePath, destination: PhotospherePath, mode: str = COPY_MODE) -> Counter:
+    """
+    :param mode: how the files are put in the destination, see transfer_file
+    :return: number of files by mode used (a mode falls back to a copy when it isn't possible for a file)
+    """
     create_folder_if_not_exists(destination)
     create_folder_if_not_exists(destination.join(RESULT_FOLDER))
     create_folder_if_not_exists(destination.join(SKIPPED_FOLDER))
     create_folder_if_not_exists(destination.join(NO_DATETIME_FOLDER))
-    run_on_folder(source, destination)
+    # organize has no database, the cache is kept in the destination
+    cache = FileStatCache(destination.join(FILE_CACHE_FILE))
+    counts = Counter()
+    try:
+        run_on_folder(source, destination, cache, mode, counts)
+    finally:
+        cache.close()
+    print("Organized files: " + ", ".join(f"{used_mode} {count}" for used_mode, count in sorted(counts.items())))
+    return counts
 
 
 @loop_on_files_in_folder_decorator
-def run_on_folder(file_path: PhotospherePath, destination: PhotospherePath):
-
-    if file_path.is_allowed_extension(PhotosphereImage.ALLOWED_EXTENSIONS):
-        ps = PhotosphereImage(file_path)
-    elif file_path.is_allowed_extension(PhotosphereVideo.ALLOWED_EXTENSIONS):
-        ps = PhotosphereVideo(file_path)
-    else:
-        copy_file_to_new_folder(file_path, destination.join(SKIPPED_FOLDER))
-        return
+def run_on_folder(
+        file_path: PhotospherePath,
+        destination: PhotospherePath,
+        cache: FileStatCache = None,
+        mode: str = COPY_MODE,
+        counts: Counter = None
+    ):
 
-    if ps.created_at is not None:
+    # only the date is needed: the images are not decoded
+    ps = load_photosphere_file(file_path, cache, (PhotosphereImage, PhotosphereVideo), with_average_hash=False)
+    if ps is None:
+        destination_folder = destination.join(SKIPPED_FOLDER)
+    elif ps.created_at is not None:
         destination_folder = file_path.join(
             destination.get_string(),
             RESULT_FOLDER,
@@ -32,6 +50,8 @@ def run_on_folder(file_path: PhotospherePath, destination: PhotospherePath):
             str(ps.get_created_at_month()),
             str(ps.get_created_at_day())
         )
-        copy_file_to_new_folder(file_path, destination_folder)
     else:
-        copy_file_to_new_folder(file_path, destination.join(NO_DATETIME_FOLDER))
\ No newline at end of file
+        destination_folder = destination.join(NO_DATETIME_FOLDER)
+    _, used_mode = transfer_file(file_path, destination_folder, mode)
+    if counts is not None:
+        counts[used_mode] += 1
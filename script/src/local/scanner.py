@@ -0,0 +1,137 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterator, NamedTuple
+
+from src.file.path import PhotospherePath
+
+# listing directories waits on the disk (or the network share), not on the CPU
+DEFAULT_SCAN_WORKERS = 8
+# directories listed ahead of the iteration, their files are kept in memory until yielded
+DEFAULT_SCAN_READ_AHEAD = 64
+
+
+class ScannedFile(NamedTuple):
+    """
+    A file found by FileScanner, with the stat values read once while scanning.
+    """
+    path: str
+    name: str
+    st_size: int
+    st_mtime_ns: int
+    st_ino: int
+
+    def get_path(self) -> PhotospherePath:
+        """
+        :return: the path, with the stat values so they are not read again
+        """
+        return PhotospherePath(self.path, self)
+
+
+def get_extension(name: str) -> str:
+    """
+    :return: the lower case extension of the file name, like PhotospherePath.is_allowed_extension
+    """
+    return os.path.splitext(name)[1].lower()
+
+
+class FileScanner:
+    """
+    Lists the files of a folder tree, with the directories listed by os.scandir on a pool of threads.
+    The next `read_ahead` directories to yield are listed concurrently, ahead of the iteration, while the files
+    are yielded in the order of os.walk: the files of a directory, then the ones of every subdirectory.
+    Like os.walk, the symbolic links to directories are not followed and the directories that can't be listed
+    are skipped.
+    """
+
+    def __init__(
+            self,
+            folder: PhotospherePath,
+            extensions: set[str] = None,
+            workers: int = DEFAULT_SCAN_WORKERS,
+            read_ahead: int = DEFAULT_SCAN_READ_AHEAD
+        ):
+        """
+        :param folder: the root of the tree
+        :param extensions: lower case extensions ('.jpg') of the files to yield, the others are discarded
+            before reading their stat; None for every file
+        :param workers: number of directories listed at the same time
+        :param read_ahead: max directories listed (or being listed) and not yielded yet
+        """
+        self.folder = folder
+        self.extensions = extensions
+        self.workers = workers
+        self.read_ahead = max(read_ahead, 1)
+        self.lock = threading.Lock()
+        # files accepted by the extensions, found so far: a total for the progress bars
+        self.found = 0
+        self.executor = None
+
+    def _scan_directory(self, directory: str) -> tuple[list[ScannedFile], list[str]]:
+        files = []
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if is_dir:
+                        if not entry.is_symlink():
+                            subdirectories.append(entry.path)
+                        continue
+                    if self.extensions is not None and get_extension(entry.name) not in self.extensions:
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        # broken symbolic link
+                        continue
+                    files.append(ScannedFile(entry.path, entry.name, stat.st_size, stat.st_mtime_ns, stat.st_ino))
+        except OSError:
+            return [], []
+        with self.lock:
+            self.found += len(files)
+        return files, subdirectories
+
+    def _submit_ahead(self, stack: list[str | Future], listing: int) -> int:
+        """
+        Submits the listing of the directories at the top of the stack (the next ones to yield),
+        the next one always, the others while less than read_ahead are listing.
+        :param stack: the directories to yield, the last one first: their path, or their listing once submitted
+        :param listing: number of listings in the stack
+        :return: the number of listings in the stack
+        """
+        for position in range(len(stack) - 1, -1, -1):
+            if listing >= self.read_ahead and position < len(stack) - 1:
+                break
+            if not isinstance(stack[position], Future):
+                stack[position] = self.executor.submit(self._scan_directory, stack[position])
+                listing += 1
+        return listing
+
+    def __iter__(self) -> Iterator[ScannedFile]:
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="photosphere-scan")
+        try:
+            stack: list[str | Future] = [self.folder.get_string()]
+            listing = 0
+            while stack:
+                listing = self._submit_ahead(stack, listing) - 1
+                files, subdirectories = stack.pop().result()
+                yield from files
+                stack.extend(reversed(subdirectories))
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def scan_files(
+        folder: PhotospherePath,
+        extensions: set[str] = None,
+        workers: int = DEFAULT_SCAN_WORKERS,
+        read_ahead: int = DEFAULT_SCAN_READ_AHEAD
+    ) -> Iterator[ScannedFile]:
+    """
+    :return: the files of the tree, see FileScanner
+    """
+    return iter(FileScanner(folder, extensions, workers, read_ahead))
@@ -2,8 +2,9 @@ import os
 import shutil
 from tqdm import tqdm
 from src.file.path import PhotospherePath
+from src.local.hashing import DEFAULT_HASH_ALGORITHM, hash_file
+from src.local.scanner import FileScanner, scan_files
 import sys
-import hashlib
 
 def create_folder_if_not_exists(path: PhotospherePath) -> PhotospherePath:
     if not os.path.exists(path.get_string()):
@@ -11,16 +12,34 @@ def create_folder_if_not_exists(path: PhotospherePath) -> PhotospherePath:
     return path
 
 
-def loop_on_files_in_folder_decorator(func):
+def loop_on_files_in_folder_decorator(func=None, *, extensions: set[str] = None):
     """
-    Decorator to loop on files in a folder, using tqdm to show progress
+    Decorator to loop on files in a folder, with one tqdm progress bar for the whole folder,
     and return the file path as argument to the function
+    :param extensions: lower case extensions of the files to loop on, the others are discarded while listing
+        the folder, None for every file
     """
-    def wrapper(folder: PhotospherePath, *args, **kwargs):
-        for root, dirs, files in tqdm(os.walk(folder.get_string())):
-            for file in tqdm(files, leave=False, desc=f"Processing {root}"):
-                func(PhotospherePath(root).join(file), *args, **kwargs)
-    return wrapper
+    def decorator(func):
+        def wrapper(folder: PhotospherePath, *args, **kwargs):
+            scanner = FileScanner(folder, extensions)
+            with tqdm(desc=f"Processing {folder.get_string()}", unit="file") as progress:
+                for scanned_file in scanner:
+                    # the total grows while the folder is listed
+                    progress.total = scanner.found
+                    func(scanned_file.get_path(), *args, **kwargs)
+                    progress.update(1)
+        return wrapper
+    return decorator(func) if func is not None else decorator
+
+def list_files_in_folder(folder: PhotospherePath, extensions: set[str] = None):
+    """
+    Generator over all the files in a folder (recursive), in the same order of loop_on_files_in_folder_decorator
+    :param folder: the folder to walk
+    :param extensions: lower case extensions of the files to return, None for every file
+    :return: the file paths
+    """
+    for scanned_file in scan_files(folder, extensions):
+        yield scanned_file.get_path()
 
 def copy_file_to_new_folder(file_path: PhotospherePath, destination_folder: PhotospherePath) -> PhotospherePath:
     """
@@ -46,17 +65,10 @@ def from_source_directory_to_nested_file_path(source_dir: str, file_path: str, s
     else:
         return result
 
-def file_hash(file_path: PhotospherePath, buffer_size=65536) -> str:
+def file_hash(file_path: PhotospherePath, hash_algorithm: str = DEFAULT_HASH_ALGORITHM) -> str:
     """
     :param file_path: the file path
-    :param hash_func: the hash function to use
+    :param hash_algorithm: one of HASH_ALGORITHMS
     :return: the hash of the file
     """
-    sha1 = hashlib.sha1()
-    with open(file_path.get_string(), 'rb') as f:
-        while True:
-            data = f.read(buffer_size)
-            if not data:
-                break
-            sha1.update(data)
-    return sha1.hexdigest()
\ No newline at end of file
+    return hash_file(file_path, hash_algorithm)
@@ -1,131 +1,59 @@
+import importlib
 from pathlib import Path
 import click
-from src.cloud.sync_in_cloud import copy_in_cloud
-from src.file.path import PhotospherePath
-from src.local.generate_local_database import generate_local_database
-from src.local.organize_files import organize_all_files
-from importlib.metadata import version as pkg_version
-
-
-
-@click.group()
-@click.version_option(version=pkg_version("photosphere"), prog_name="photosphere")
-def cli() -> click.Group:
-    """Photosphere Project"""
-    pass
-
-
-@cli.command("organize")
-@click.option('--source', required=True,
-              type=click.Path(
-                  exists=True,
-                  dir_okay=True,
-                  readable=True,
-                  resolve_path=True
-              ),
-              help='Source directory from where the photos will be taken.')
-@click.option('--out', required=True,
-              type=click.Path(
-                  resolve_path=True,
-                  writable=True
-              ),
-              help='Destination directory where the photos will be moved.')
-def organize(source: Path, out: Path):
-
-    """Organize the photos in the directory according to the date and time of the photo taken."""
-
-    print('Organizing photos in {}'.format(source))
-    print('Moving photos to {}'.format(out))
-
-    organize_all_files(PhotospherePath(source), PhotospherePath(out))
-
-@cli.command('generate')
-@click.option('--source', required=True,
-              type=click.Path(
-                  exists=True,
-                  dir_okay=True,
-                  readable=True,
-                  resolve_path=True
-              ),
-              help='Source directory from where the photos will be taken.'
-              )
-@click.option('--out', required=True,
-              type=click.Path(
-                  exists=False,
-                  dir_okay=True,
-                  readable=True,
-                  resolve_path=True
-              ),
-              help='Generate CSV file of all files in the direcory'
-              )
-def generate(source: Path, out: Path):
-    """ Create CSV database of files in this directory """
-
-    print('Generating database from {}'.format(source))
-    print('Outputting database to {}'.format(out))
-
-    generate_local_database(PhotospherePath(source), PhotospherePath(out))
-
-
-# create a command called "sync-in-cloud" that will copy files in the cloud and save all references in a CSV file
-@cli.command('sync-in-cloud')
-@click.option('--source', required=True,
+from src.util import profiling
+
+# command name: module and function of the command, imported only when the command is used (or listed by --help),
+# so a command doesn't pay for the imports of the others (Firebase, PIL, ffmpeg...)
+LAZY_COMMANDS = {
+    'organize': 'src.commands.local:organize',
+    'generate': 'src.commands.local:generate',
+    'sync-in-cloud': 'src.commands.cloud:sync_in_cloud',
+    'find-duplicates': 'src.commands.database:find_duplicates',
+    'query': 'src.commands.database:query',
+    'convert-db-to-protobuf': 'src.commands.database:convert_db_to_protobuf',
+    'import-tinydb': 'src.commands.database:import_tinydb',
+    'export-tinydb': 'src.commands.database:export_tinydb',
+}
+
+
+class LazyGroup(click.Group):
+    """
+    Group of the commands of LAZY_COMMANDS, a command module is imported on first use.
+    """
+
+    def __init__(self, *args, lazy_commands: dict[str, str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name not in self.commands and cmd_name in self.lazy_commands:
+            module_name, function_name = self.lazy_commands[cmd_name].split(':')
+            self.add_command(getattr(importlib.import_module(module_name), function_name), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group(cls=LazyGroup, lazy_commands=LAZY_COMMANDS)
+@click.version_option(package_name="photosphere", prog_name="photosphere")
+@click.option('--profile', is_flag=True, default=False,
+              help='Print at exit the count, p50/p95/p99, total time and bytes of every stage (hash, decode, '
+                   'thumbnail, ffmpeg, bucket requests, database writes).')
+@click.option('--profile-trace', required=False,
               type=click.Path(
-                  exists=True,
-                  dir_okay=True,
-                  readable=True,
+                  dir_okay=False,
                   resolve_path=True
               ),
-              help='Source directory from where the photos will be taken.'
-              )
-@click.option('--bucket', required=True,
-              type=str,
-              help='Name of the bucket where the files will be uploaded.'
-              )
-@click.option(
-    '--subfolder',
-    required=False,
-    type=str,
-    help='Subfolder in the bucket where the files will be uploaded (if source is "result" will be ignored)'
-)
-def sync_in_cloud(source: Path, bucket: str, subfolder: str = None):
-
-    print('Syncing files in the cloud from {}'.format(source))
-    print('Uploading files to bucket {}'.format(bucket))
-    if subfolder is not None: print('Uploading files in subfolder {}'.format(subfolder))
-
-    copy_in_cloud(PhotospherePath(source), bucket, subfolder)
-
-
-@cli.command('convert-db-to-protobuf')
-@click.option('--source', required=True,
-                type=click.Path(
-                    exists=True,
-                    dir_okay=False,
-                    readable=True,
-                    resolve_path=True
-                ),
-                help='Source database file in TinyDB (jdon) format.'
-                )
-@click.option('--out', required=True,
-                type=click.Path(
-                    exists=False,
-                    dir_okay=False,
-                    readable=True,
-                    resolve_path=True
-                ),
-                help='Output protobuf file.'
-                )
-def convert_db_to_protobuf(source: Path, out: Path):
-    """ Convert TinyDB database to Protobuf file format """
-
-    from src.protobuf.converter import create_protobuf_file_list
-    from tinydb import TinyDB
-
-    print('Loading database from {}'.format(source))
-    db = TinyDB(PhotospherePath(source).get_string())
-    print('Creating protobuf file at {}'.format(out))
-    create_protobuf_file_list(db.all(), PhotospherePath(out))
+              help='Json file where the stages are written in the Chrome trace format (chrome://tracing, Perfetto), '
+                   'implies --profile.')
+@click.pass_context
+def cli(ctx: click.Context, profile: bool = False, profile_trace: Path = None) -> click.Group:
+    """Photosphere Project"""
+    if profile or profile_trace:
+        profiling.enable(trace=profile_trace is not None)
+        ctx.call_on_close(lambda: profiling.report(profile_trace))
 
 
 if __name__ == "__main__":
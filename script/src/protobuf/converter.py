@@ -1,26 +1,287 @@
+import heapq
+import os
+import shutil
+import struct
+import tempfile
+from operator import itemgetter
+from typing import Iterable, Iterator
+from google.protobuf.internal.decoder import _DecodeVarint32
 from src.file.path import PhotospherePath
-from tinydb.table import Document
-from google.protobuf.internal import encoder
-import io
+from src.gps.gps import BASE32
 from src.protobuf.dist import photosphere_file_pb2
 
+SORT_CHUNK_SIZE = 50000
+WRITE_BUFFER_SIZE = 1024 * 1024
+CATALOGUE_V1 = 'v1'
+CATALOGUE_V2 = 'v2'
+CATALOGUE_FORMATS = [CATALOGUE_V1, CATALOGUE_V2]
+# first bytes of a v2 catalogue, a v1 file starts with the length of its first message
+CATALOGUE_V2_MAGIC = b'PSC\x02'
+_GEOHASH_VALUES = {char: value for value, char in enumerate(BASE32)}
+# header of every message in the temporary sorted runs: created_at_timestamp and message length
+_RUN_HEADER = struct.Struct('<qI')
 
-def _VarintBytes(value):
-    buf = io.BytesIO()
-    encoder._EncodeVarint(buf.write, value)
-    return buf.getvalue()
 
-def create_protobuf_file_list(files: list[Document], out: PhotospherePath) -> None:
-    files = sorted(files, key=lambda x: x.get('created_at_timestamp') or 0, reverse=True)
-    with open(out.get_string(), 'wb') as f:
+def _varint_bytes(value: int) -> bytes:
+    result = bytearray()
+    while value > 0x7F:
+        result.append((value & 0x7F) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def _serialize(file: dict, proto_file: photosphere_file_pb2.PhotosphereFile) -> tuple[int, bytes]:
+    """
+    :return: the sort key (created_at_timestamp, 0 if missing) and the serialized message
+    """
+    proto_file.Clear()
+    if file["source_bucket_uri"] is not None:
+        proto_file.source_bucket_uri = file["source_bucket_uri"]
+    if file["file_type"] is not None:
+        proto_file.file_type = photosphere_file_pb2.FileType.Value(file["file_type"])
+    if file["created_at_timestamp"] is not None:
+        proto_file.created_at_timestamp = file["created_at_timestamp"]
+    if file["geohash"] is not None:
+        proto_file.geohash = file["geohash"]
+    if file["hash"] is not None:
+        proto_file.hash = file["hash"]
+    # the records made before the renditions don't have the field
+    for rendition in file.get("renditions") or ():
+        proto_file.renditions.add(size=rendition["size"], uri=rendition["uri"])
+    return file.get("created_at_timestamp") or 0, proto_file.SerializeToString()
+
+
+def _write_run(entries: list[tuple[int, bytes]], folder: str, index: int) -> str:
+    path = os.path.join(folder, f"run_{index}.bin")
+    with open(path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        for timestamp, message in entries:
+            f.write(_RUN_HEADER.pack(timestamp, len(message)))
+            f.write(message)
+    return path
+
+
+def _read_run(path: str) -> Iterator[tuple[int, bytes]]:
+    with open(path, 'rb', buffering=WRITE_BUFFER_SIZE) as f:
+        while header := f.read(_RUN_HEADER.size):
+            timestamp, length = _RUN_HEADER.unpack(header)
+            yield timestamp, f.read(length)
+
+
+def iterate_sorted_messages(
+        files: Iterable[dict],
+        chunk_size: int = SORT_CHUNK_SIZE
+    ) -> Iterator[tuple[int, bytes]]:
+    """
+    Serializes the files as PhotosphereFile messages, sorted by created_at_timestamp (newest first).
+    Files are serialized and sorted in chunks of chunk_size, the sorted chunks are spilled to temporary files
+    and merged, so the memory used doesn't depend on the number of files.
+    The order is stable: files with the same timestamp keep the order of `files`.
+    :param files: the database records, any iterable
+    :param chunk_size: max number of messages kept in memory
+    :return: generator of (created_at_timestamp or 0, serialized message)
+    """
+    proto_file = photosphere_file_pb2.PhotosphereFile()
+    sort_key = itemgetter(0)
+    with tempfile.TemporaryDirectory(prefix='photosphere_protobuf_') as tmp_folder:
+        runs = []
+        chunk = []
         for file in files:
-            proto_file = photosphere_file_pb2.PhotosphereFile(
-                source_bucket_uri=file["source_bucket_uri"],
-                file_type=file["file_type"],
-                created_at_timestamp=file["created_at_timestamp"],
-                geohash=file["geohash"],
-                hash=file["hash"]
-            )
-            serialized_data = proto_file.SerializeToString()
-            f.write(_VarintBytes(len(serialized_data)))
-            f.write(serialized_data)
\ No newline at end of file
+            chunk.append(_serialize(file, proto_file))
+            if len(chunk) >= chunk_size:
+                chunk.sort(key=sort_key, reverse=True)
+                runs.append(_write_run(chunk, tmp_folder, len(runs)))
+                chunk = []
+        chunk.sort(key=sort_key, reverse=True)
+        if not runs:
+            yield from chunk
+            return
+        if chunk:
+            runs.append(_write_run(chunk, tmp_folder, len(runs)))
+        yield from heapq.merge(*(_read_run(run) for run in runs), key=sort_key, reverse=True)
+
+
+def create_protobuf_file_list(
+        files: Iterable[dict],
+        out: PhotospherePath,
+        chunk_size: int = SORT_CHUNK_SIZE
+    ) -> int:
+    """
+    Writes the files as length-delimited PhotosphereFile messages, sorted by created_at_timestamp (newest first),
+    see iterate_sorted_messages.
+    :param files: the database records, any iterable
+    :param out: the protobuf file
+    :param chunk_size: max number of messages kept in memory
+    :return: the number of written messages
+    """
+    count = 0
+    with open(out.get_string(), 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        for _, message in iterate_sorted_messages(files, chunk_size):
+            f.write(_varint_bytes(len(message)))
+            f.write(message)
+            count += 1
+    return count
+
+
+def read_protobuf_file_list(path: PhotospherePath) -> Iterator[photosphere_file_pb2.PhotosphereFile]:
+    """
+    :param path: a file of length-delimited PhotosphereFile messages
+    :return: generator of the messages, in file order
+    """
+    with open(path.get_string(), 'rb') as f:
+        data = f.read()
+    position = 0
+    while position < len(data):
+        length, position = _DecodeVarint32(data, position)
+        message = photosphere_file_pb2.PhotosphereFile()
+        message.ParseFromString(data[position:position + length])
+        position += length
+        yield message
+
+
+def pack_geohash(geohash: str) -> int:
+    """
+    :return: the geohash as an integer, 5 bits per character after a leading 1 bit (the length of the geohash),
+        0 for an empty geohash
+    :raise KeyError: if the geohash has a character out of base 32
+    """
+    if not geohash:
+        return 0
+    value = 1
+    for char in geohash:
+        value = (value << 5) | _GEOHASH_VALUES[char]
+    return value
+
+
+def unpack_geohash(value: int) -> str:
+    """
+    :param value: see pack_geohash
+    """
+    chars = []
+    while value > 1:
+        chars.append(BASE32[value & 0x1F])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+class _UriPrefixes:
+    """
+    The dictionary of the uri prefixes of a v2 catalogue: the part of the uri up to its last /, in order of first use.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+
+    def split(self, uri: str) -> tuple[int, str]:
+        """
+        :return: the index of the prefix of the uri and the rest of the uri
+        """
+        position = uri.rfind('/') + 1
+        prefix = uri[:position]
+        index = self.indexes.get(prefix)
+        if index is None:
+            index = self.indexes[prefix] = len(self.indexes)
+        return index, uri[position:]
+
+    def get_list(self) -> list[str]:
+        return list(self.indexes)
+
+
+def _compact(
+        proto_file: photosphere_file_pb2.PhotosphereFile,
+        compact_file: photosphere_file_pb2.CompactPhotosphereFile,
+        previous_timestamp: int,
+        prefixes: _UriPrefixes
+    ) -> bytes:
+    """
+    :return: the serialized CompactPhotosphereFile of the message
+    """
+    compact_file.Clear()
+    compact_file.source_bucket_uri_prefix, compact_file.source_bucket_uri_suffix = prefixes.split(
+        proto_file.source_bucket_uri
+    )
+    compact_file.file_type = proto_file.file_type
+    compact_file.created_at_delta = proto_file.created_at_timestamp - previous_timestamp
+    compact_file.geohash = pack_geohash(proto_file.geohash)
+    compact_file.hash = bytes.fromhex(proto_file.hash)
+    for rendition in proto_file.renditions:
+        uri_prefix, uri_suffix = prefixes.split(rendition.uri)
+        compact_file.renditions.add(size=rendition.size, uri_prefix=uri_prefix, uri_suffix=uri_suffix)
+    return compact_file.SerializeToString()
+
+
+def create_compact_file_list(
+        files: Iterable[dict],
+        out: PhotospherePath,
+        chunk_size: int = SORT_CHUNK_SIZE
+    ) -> int:
+    """
+    Writes the files as a v2 catalogue, smaller than the v1 one of create_protobuf_file_list with the same records
+    in the same order: CATALOGUE_V2_MAGIC, a length-delimited CatalogueHeader with the uri prefixes, then the
+    length-delimited CompactPhotosphereFile records. Hashes are bytes, geohashes integers (see pack_geohash),
+    timestamps the difference with the previous record and uris an index in the prefixes plus a suffix.
+    The records are written in a temporary file while the prefixes are collected, then copied after the header.
+    :param files: the database records, any iterable, with hex hashes
+    :param out: the catalogue file
+    :param chunk_size: max number of messages kept in memory
+    :return: the number of written records
+    """
+    proto_file = photosphere_file_pb2.PhotosphereFile()
+    compact_file = photosphere_file_pb2.CompactPhotosphereFile()
+    prefixes = _UriPrefixes()
+    count = 0
+    previous_timestamp = 0
+    with tempfile.TemporaryFile(prefix='photosphere_catalogue_') as body:
+        for _, message in iterate_sorted_messages(files, chunk_size):
+            proto_file.ParseFromString(message)
+            compact = _compact(proto_file, compact_file, previous_timestamp, prefixes)
+            previous_timestamp = proto_file.created_at_timestamp
+            body.write(_varint_bytes(len(compact)))
+            body.write(compact)
+            count += 1
+        header = photosphere_file_pb2.CatalogueHeader(
+            version=2, count=count, uri_prefixes=prefixes.get_list()
+        ).SerializeToString()
+        body.seek(0)
+        with open(out.get_string(), 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            f.write(CATALOGUE_V2_MAGIC)
+            f.write(_varint_bytes(len(header)))
+            f.write(header)
+            shutil.copyfileobj(body, f, WRITE_BUFFER_SIZE)
+    return count
+
+
+def read_compact_file_list(path: PhotospherePath) -> Iterator[photosphere_file_pb2.PhotosphereFile]:
+    """
+    :param path: a v2 catalogue, see create_compact_file_list
+    :return: generator of the records as PhotosphereFile messages, the same of read_protobuf_file_list on the v1
+        catalogue of the same records
+    :raise ValueError: if the file is not a v2 catalogue
+    """
+    with open(path.get_string(), 'rb') as f:
+        data = f.read()
+    if not data.startswith(CATALOGUE_V2_MAGIC):
+        raise ValueError(f"{path.get_string()} is not a v2 catalogue")
+    position = len(CATALOGUE_V2_MAGIC)
+    length, position = _DecodeVarint32(data, position)
+    header = photosphere_file_pb2.CatalogueHeader()
+    header.ParseFromString(data[position:position + length])
+    position += length
+    prefixes = list(header.uri_prefixes)
+    compact_file = photosphere_file_pb2.CompactPhotosphereFile()
+    timestamp = 0
+    while position < len(data):
+        length, position = _DecodeVarint32(data, position)
+        compact_file.ParseFromString(data[position:position + length])
+        position += length
+        timestamp += compact_file.created_at_delta
+        message = photosphere_file_pb2.PhotosphereFile(
+            source_bucket_uri=prefixes[compact_file.source_bucket_uri_prefix] + compact_file.source_bucket_uri_suffix,
+            file_type=compact_file.file_type,
+            created_at_timestamp=timestamp,
+            geohash=unpack_geohash(compact_file.geohash),
+            hash=compact_file.hash.hex()
+        )
+        for rendition in compact_file.renditions:
+            message.renditions.add(size=rendition.size, uri=prefixes[rendition.uri_prefix] + rendition.uri_suffix)
+        yield message
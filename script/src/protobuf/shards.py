@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Iterable
+
+from src.file.path import PhotospherePath
+from src.local.utils import create_folder_if_not_exists
+from src.protobuf.converter import iterate_sorted_messages, SORT_CHUNK_SIZE, WRITE_BUFFER_SIZE, _varint_bytes
+
+SHARD_INDEX_FILE = 'index.json'
+UNDATED_SHARD = 'undated'
+
+
+def get_shard_name(created_at_timestamp: int) -> str:
+    """
+    :param created_at_timestamp: unix timestamp, 0 when the file has no date
+    :return: the month of the timestamp (UTC) as YYYY-MM, or UNDATED_SHARD
+    """
+    if not created_at_timestamp:
+        return UNDATED_SHARD
+    return datetime.fromtimestamp(created_at_timestamp, tz=timezone.utc).strftime('%Y-%m')
+
+
+class _ShardWriter:
+
+    def __init__(self, name: str, tmp_path: PhotospherePath):
+        self.name = name
+        self.tmp_path = tmp_path
+        self.file = open(tmp_path.get_string(), 'wb', buffering=WRITE_BUFFER_SIZE)
+        self.sha1 = hashlib.sha1()
+        self.count = 0
+        self.size = 0
+        self.min_created_at_timestamp = None
+        self.max_created_at_timestamp = None
+
+    def write(self, created_at_timestamp: int, message: bytes):
+        data = _varint_bytes(len(message)) + message
+        self.file.write(data)
+        self.sha1.update(data)
+        self.count += 1
+        self.size += len(data)
+        # messages arrive newest first
+        if self.max_created_at_timestamp is None:
+            self.max_created_at_timestamp = created_at_timestamp
+        self.min_created_at_timestamp = created_at_timestamp
+
+    def close(self, folder: PhotospherePath) -> dict:
+        """
+        Renames the shard with its content hash, so the file of an unchanged month keeps the same name.
+        :return: the index entry of the shard
+        """
+        self.file.close()
+        sha1 = self.sha1.hexdigest()
+        file_name = f"{self.name}-{sha1[:16]}.pb"
+        os.replace(self.tmp_path.get_string(), folder.join(file_name).get_string())
+        return {
+            "name": self.name,
+            "file": file_name,
+            "min_created_at_timestamp": self.min_created_at_timestamp,
+            "max_created_at_timestamp": self.max_created_at_timestamp,
+            "count": self.count,
+            "size": self.size,
+            "sha1": sha1,
+        }
+
+
+def create_protobuf_shards(
+        files: Iterable[dict],
+        out_folder: PhotospherePath,
+        chunk_size: int = SORT_CHUNK_SIZE
+    ) -> dict:
+    """
+    Writes the files as one protobuf file (length-delimited PhotosphereFile messages) per month,
+    each sorted by created_at_timestamp (newest first), plus an index (SHARD_INDEX_FILE) listing for every shard:
+    time range, number of records, size in bytes and sha1 of the content.
+    Shards are listed newest first, files without date have timestamp 0 and are in the UNDATED_SHARD shard.
+    Shard files are named with their content hash, the files of the previous shards not in the index are removed.
+    A client can download the index and only the shards of the months it shows.
+    :param files: the database records, any iterable
+    :param out_folder: folder of the shards and of the index
+    :param chunk_size: max number of messages kept in memory while sorting
+    :return: the index
+    """
+    create_folder_if_not_exists(out_folder)
+    shards = []
+    writer = None
+    tmp_path = out_folder.join('.shard.tmp')
+    for created_at_timestamp, message in iterate_sorted_messages(files, chunk_size):
+        name = get_shard_name(created_at_timestamp)
+        if writer is None or writer.name != name:
+            if writer is not None:
+                shards.append(writer.close(out_folder))
+            writer = _ShardWriter(name, tmp_path)
+        writer.write(created_at_timestamp, message)
+    if writer is not None:
+        shards.append(writer.close(out_folder))
+
+    index = {
+        "version": 1,
+        "order": "created_at_timestamp_desc",
+        "count": sum(shard["count"] for shard in shards),
+        "shards": shards,
+    }
+    with open(out_folder.join(SHARD_INDEX_FILE).get_string(), 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    shard_files = {shard["file"] for shard in shards}
+    for file_name in os.listdir(out_folder.get_string()):
+        if file_name.endswith('.pb') and file_name not in shard_files:
+            out_folder.join(file_name).remove()
+    return index
+
+
+def read_shard_index(folder: PhotospherePath) -> dict:
+    with open(folder.join(SHARD_INDEX_FILE).get_string(), 'r', encoding='utf-8') as f:
+        return json.load(f)
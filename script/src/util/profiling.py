@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+# percentiles of the report
+PERCENTILES = (50, 95, 99)
+
+
+class Profiler:
+    """
+    Durations and bytes of the spans by stage name, and the spans themselves when a trace is written.
+    """
+
+    def __init__(self, trace: bool = False):
+        self.trace = trace
+        self.durations: dict[str, list[int]] = defaultdict(list)
+        self.bytes: dict[str, int] = defaultdict(int)
+        # (name, start, duration, bytes, pid, thread id), nanoseconds of perf_counter_ns
+        self.events: list[tuple] = []
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: int, end: int, size: int) -> None:
+        with self._lock:
+            self.durations[name].append(end - start)
+            self.bytes[name] += size
+            if self.trace:
+                self.events.append((name, start, end - start, size, os.getpid(), threading.get_ident()))
+
+    def drain(self) -> dict:
+        """
+        :return: the spans recorded since the last drain, picklable, see merge
+        """
+        with self._lock:
+            spans = {"durations": dict(self.durations), "bytes": dict(self.bytes), "events": self.events}
+            self.durations, self.bytes, self.events = defaultdict(list), defaultdict(int), []
+        return spans
+
+    def merge(self, spans: dict) -> None:
+        """
+        Adds the spans drained by the profiler of another process.
+        """
+        with self._lock:
+            for name, durations in spans["durations"].items():
+                self.durations[name].extend(durations)
+            for name, size in spans["bytes"].items():
+                self.bytes[name] += size
+            if self.trace:
+                self.events.extend(spans["events"])
+
+    def get_stats(self) -> list[dict]:
+        """
+        :return: count, percentiles and total in milliseconds and bytes of every stage, by name
+        """
+        stats = []
+        for name in sorted(self.durations):
+            durations = sorted(self.durations[name])
+            stage = {"name": name, "count": len(durations)}
+            for percentile in PERCENTILES:
+                # nearest rank
+                rank = max(0, -(-len(durations) * percentile // 100) - 1)
+                stage[f"p{percentile}_ms"] = durations[rank] / 1e6
+            stage["total_ms"] = sum(durations) / 1e6
+            stage["bytes"] = self.bytes[name]
+            stats.append(stage)
+        return stats
+
+    def write_trace(self, path: str) -> int:
+        """
+        Writes the spans as complete events of the Chrome trace format (chrome://tracing, Perfetto).
+        :return: the number of events
+        """
+        origin = min((event[1] for event in self.events), default=0)
+        events = [
+            {
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - origin) / 1000,
+                "dur": duration / 1000,
+                "pid": pid,
+                "tid": tid,
+                "args": {"bytes": size} if size else {}
+            }
+            for name, start, duration, size, pid, tid in self.events
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+class Span:
+    """
+    A timed stage, recorded when it exits (also on exceptions).
+    """
+    __slots__ = ("profiler", "name", "size", "start")
+
+    def __init__(self, profiler: Profiler, name: str, size: int):
+        self.profiler = profiler
+        self.name = name
+        self.size = size
+        self.start = 0
+
+    def add_bytes(self, size: int) -> None:
+        self.size += size
+
+    def __enter__(self) -> 'Span':
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.profiler.record(self.name, self.start, time.perf_counter_ns(), self.size)
+
+
+class _DisabledSpan:
+    __slots__ = ()
+
+    def add_bytes(self, size: int) -> None:
+        pass
+
+    def __enter__(self) -> '_DisabledSpan':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+
+_DISABLED_SPAN = _DisabledSpan()
+_profiler: Profiler | None = None
+
+
+def span(name: str, size: int = 0) -> Span | _DisabledSpan:
+    """
+    Times a stage: with span("image.decode", size): ...
+    When profiling is disabled it returns a shared object that does nothing, the cost is a function call.
+    :param name: stage name, the part before the first dot is the trace category
+    :param size: bytes processed by the stage, more can be added with add_bytes
+    """
+    if _profiler is None:
+        return _DISABLED_SPAN
+    return Span(_profiler, name, size)
+
+
+def enable(trace: bool = False) -> Profiler:
+    """
+    :param trace: keep every span for write_trace, otherwise only the durations by stage
+    :return: the profiler recording the spans of this process
+    """
+    global _profiler
+    _profiler = Profiler(trace)
+    return _profiler
+
+
+def disable() -> None:
+    global _profiler
+    _profiler = None
+
+
+def get_profiler() -> Profiler | None:
+    return _profiler
+
+
+def get_options() -> dict | None:
+    """
+    :return: the arguments of enable to profile a worker process like this one, None if profiling is disabled
+    """
+    return {"trace": _profiler.trace} if _profiler is not None else None
+
+
+def drain() -> dict | None:
+    """
+    :return: the spans of this process since the last drain (for the parent process, see merge), None if disabled
+    """
+    return _profiler.drain() if _profiler is not None else None
+
+
+def merge(spans: dict | None) -> None:
+    if _profiler is not None and spans is not None:
+        _profiler.merge(spans)
+
+
+def _format_bytes(size: int) -> str:
+    if not size:
+        return "-"
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def report(trace_path: str = None) -> None:
+    """
+    Prints the count, percentiles, total and bytes of every stage and writes the trace if trace_path is given.
+    """
+    if _profiler is None:
+        return
+    print(f"{'stage':<24}{'count':>9}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'total s':>11}{'bytes':>13}")
+    for stage in _profiler.get_stats():
+        print(
+            f"{stage['name']:<24}{stage['count']:>9}{stage['p50_ms']:>11.3f}{stage['p95_ms']:>11.3f}"
+            f"{stage['p99_ms']:>11.3f}{stage['total_ms'] / 1000:>11.3f}{_format_bytes(stage['bytes']):>13}"
+        )
+    if trace_path:
+        count = _profiler.write_trace(trace_path)
+        print(f"Written {count} spans in {trace_path}")
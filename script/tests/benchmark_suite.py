@@ -0,0 +1,428 @@
+"""
+Benchmarks of the hot paths on a synthetic library (see tests.synthetic_library) of every scale:
+ - library: creation of the synthetic library
+ - scan: FileScanner of the library with SUPPORTED_EXTENSIONS, the stat of every file
+ - file_hash: hash of every file, in the page cache, file_hash_<algorithm> with the other installed algorithms
+ - quick_hash: quick_hash (size, head and tail) of every file
+ - image_load: PhotosphereImage of every image with its date and GPS position
+ - thumbnail: generate_thumbnail (and the average hash) of a sample of the images
+ - thumbnail_full_decode: the same thumbnails and average hashes from the image decoded at full size
+ - geohash: encode_geohash of as many random positions as files
+ - geohash_batch, geohash_decode_batch and geohash_neighbors_batch: the same positions with src.gps.batch
+ - organize: organize_all_files of the library, end to end, with a cold file cache, in --organize-mode
+ - generate_<backend>_cold and _warm: generate_local_database, with a cold and a warm file cache
+ - lookup_<backend>: contains_hash of a sample of hashes in the generated database, half of them missing
+ - catalogue_<v1|v2>_write and _decode: the v1 (PhotosphereFile messages) and v2 (compact) catalogues of the generated
+   database records, uploaded in a bucket, with the size of the catalogue in bytes
+and once, whatever the scale (the "fixed" benchmarks):
+ - hash_buffer_<algorithm> and hash_mmap_<algorithm>: hash_file of a file of --hash-mib MiB in the page cache, read
+   in READ_BUFFER_SIZE chunks and memory mapped, the count is the MiB
+ - startup_<command>: a new interpreter running --help of the command (--help of the cli for startup_cli),
+   --startup-repeat times, with the import time measured by python -X importtime (import_ms)
+The results are written in a json file with the version, commit and machine, to compare releases on the same
+machine: --compare prints the change of the files per second (and of the bytes) of every benchmark.
+The library takes about 120 KiB per file (and as much for the organized copy), 100000 files take 25 GB.
+Every scale runs in a temporary folder used as working directory (file cache and local database).
+
+Run from the script folder:
+    python -m tests.benchmark_suite [--scales 1000,10000,100000] [--out results.json] [--compare previous.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tomllib
+from datetime import datetime, timezone
+from unittest import mock
+
+import imagehash
+import numpy as np
+from PIL import Image
+
+from src.database.utils import DATABASE_BACKENDS, SQLITE_BACKEND, open_database_file
+from src.file.image.image import PhotosphereImage
+from src.file.path import PhotospherePath
+from src.gps.batch import decode_geohash_batch, encode_geohash_batch, geohash_neighbors_batch
+from src.gps.gps import encode_geohash
+from src.local.file_cache import FILE_CACHE_FILE, SUPPORTED_EXTENSIONS
+from src.local.file_transfer import COPY_MODE, TRANSFER_MODES
+from src.local.generate_local_database import generate_local_database, LOCAL_DATABASE_FILE
+from src.local.hashing import DEFAULT_HASH_ALGORITHM, HASH_ALGORITHMS, hash_file, new_hash, quick_hash
+from src.local.organize_files import organize_all_files
+from src.local.scanner import FileScanner
+from src.local.utils import file_hash
+from src.protobuf.converter import create_protobuf_file_list, read_protobuf_file_list, create_compact_file_list, \
+    read_compact_file_list
+from tests.synthetic_library import create_library
+
+SCRIPT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SCALES = [1000, 10000, 100000]
+DEFAULT_SAMPLE = 200
+DEFAULT_HASH_MIB = 256
+DEFAULT_STARTUP_REPEAT = 5
+RESULTS_FORMAT = 1
+# startup benchmarks: --help of a command imports the command module but doesn't run it
+STARTUP_COMMANDS = {
+    "cli": ["--help"],
+    "organize": ["organize", "--help"],
+    "generate": ["generate", "--help"],
+    "sync_in_cloud": ["sync-in-cloud", "--help"],
+    "query": ["query", "--help"],
+}
+# import time: self [us] | cumulative | imported package
+IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def _stats(count: int, seconds: float, durations: list[float] = None) -> dict:
+    """
+    :param durations: seconds of every operation, for the percentiles
+    """
+    result = {"count": count, "seconds": round(seconds, 4), "per_second": round(count / seconds, 2) if seconds else None}
+    if durations and len(durations) > 1:
+        percentiles = statistics.quantiles(durations, n=100, method="inclusive")
+        result["p50_ms"] = round(percentiles[49] * 1000, 4)
+        result["p95_ms"] = round(percentiles[94] * 1000, 4)
+    return result
+
+
+def _each(function, items: list) -> dict:
+    """
+    Calls function on every item, timing every call
+    """
+    durations = []
+    for item in items:
+        start = time.perf_counter()
+        function(item)
+        durations.append(time.perf_counter() - start)
+    return _stats(len(items), sum(durations), durations)
+
+
+def _once(function, count: int) -> dict:
+    """
+    Calls function once, it processes count items
+    """
+    start = time.perf_counter()
+    function()
+    return _stats(count, time.perf_counter() - start)
+
+
+def _quiet(function):
+    """
+    function without the progress bars and the prints
+    """
+    def run():
+        with contextlib.redirect_stderr(io.StringIO()), contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return run
+
+
+def _scan(folder: PhotospherePath) -> None:
+    for scanned_file in FileScanner(folder, SUPPORTED_EXTENSIONS):
+        scanned_file.get_path()
+
+
+def _load_image(path: PhotospherePath) -> None:
+    image = PhotosphereImage(path)
+    image.created_at, image.latitude, image.longitude
+
+
+def _thumbnail(path: PhotospherePath) -> None:
+    image = PhotosphereImage(path)
+    image.generate_thumbnail()
+    del image
+
+
+def _thumbnail_full_decode(path: PhotospherePath) -> None:
+    """
+    The thumbnail and the average hash of _thumbnail, without the draft decode and the embedded previews
+    """
+    image = Image.open(path.get_string())
+    imagehash.average_hash(image, PhotosphereImage.HASH_SIZE)
+    image.thumbnail((PhotosphereImage.THUMBNAIL_PIXEL_SIZE, PhotosphereImage.THUMBNAIL_PIXEL_SIZE))
+    if image.mode == "RGBA":
+        image = image.convert("RGB")
+    image.save(io.BytesIO(), "JPEG")
+    image.close()
+
+
+def _hash_algorithms() -> list[str]:
+    """
+    :return: the HASH_ALGORITHMS with their package installed
+    """
+    algorithms = []
+    for algorithm in HASH_ALGORITHMS:
+        try:
+            new_hash(algorithm)
+        except ValueError:
+            continue
+        algorithms.append(algorithm)
+    return algorithms
+
+
+def _read_all(read, path: PhotospherePath) -> None:
+    for _ in read(path):
+        pass
+
+
+def _remove(*paths: str) -> None:
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _database_path(backend: str) -> str:
+    """
+    :return: the file written by generate_local_database with the backend
+    """
+    if backend == SQLITE_BACKEND:
+        return PhotospherePath(LOCAL_DATABASE_FILE).path.with_suffix(".sqlite").as_posix()
+    return LOCAL_DATABASE_FILE
+
+
+def _remove_database() -> None:
+    _remove(*(_database_path(backend) for backend in DATABASE_BACKENDS))
+
+
+def run_scale(count: int, backends: list[str], sample: int, organize_mode: str, folder: str = None) -> dict:
+    """
+    :return: the stats by benchmark name
+    """
+    results = {}
+    rng = random.Random(count)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(dir=folder) as tmp_folder:
+        os.chdir(tmp_folder)
+        try:
+            library = os.path.join(tmp_folder, "library")
+            results["library"] = _once(lambda: create_library(library, count), count)
+            paths = [
+                PhotospherePath(os.path.join(root, file))
+                for root, dirs, files in os.walk(library)
+                for file in sorted(files)
+            ]
+            images = [path for path in paths if path.is_allowed_extension(PhotosphereImage.ALLOWED_EXTENSIONS)]
+            results["scan"] = _once(lambda: _scan(PhotospherePath(library)), count)
+            results["file_hash"] = _each(file_hash, paths)
+            for algorithm in _hash_algorithms():
+                if algorithm != DEFAULT_HASH_ALGORITHM:
+                    results[f"file_hash_{algorithm}"] = _each(lambda path: hash_file(path, algorithm), paths)
+            results["quick_hash"] = _each(quick_hash, paths)
+            results["image_load"] = _each(_load_image, images)
+            thumbnails = rng.sample(images, min(sample, len(images)))
+            results["thumbnail"] = _each(_thumbnail, thumbnails)
+            results["thumbnail_full_decode"] = _each(_thumbnail_full_decode, thumbnails)
+            positions = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(count)]
+            results["geohash"] = _each(lambda position: encode_geohash(*position), positions)
+            latitudes = np.array([latitude for latitude, _ in positions])
+            longitudes = np.array([longitude for _, longitude in positions])
+            results["geohash_batch"] = _once(lambda: encode_geohash_batch(latitudes, longitudes), count)
+            geohashes = encode_geohash_batch(latitudes, longitudes)
+            results["geohash_decode_batch"] = _once(lambda: decode_geohash_batch(geohashes), count)
+            results["geohash_neighbors_batch"] = _once(lambda: geohash_neighbors_batch(geohashes), count)
+            results["organize"] = _once(
+                _quiet(lambda: organize_all_files(
+                    PhotospherePath(library), PhotospherePath(os.path.join(tmp_folder, "organized")), organize_mode
+                )),
+                count
+            )
+            records = []
+            for backend in backends:
+                for cache in ("cold", "warm"):
+                    if cache == "cold":
+                        _remove(FILE_CACHE_FILE)
+                    _remove_database()
+                    results[f"generate_{backend}_{cache}"] = _once(
+                        _quiet(lambda: generate_local_database(PhotospherePath(library), None, backend)),
+                        count
+                    )
+                db = open_database_file(PhotospherePath(_database_path(backend)))
+                try:
+                    records = db.all()
+                    hashes = [record["hash"] for record in rng.sample(records, min(sample // 2, len(records)))]
+                    hashes += [f"{rng.getrandbits(160):040x}" for _ in range(len(hashes))]
+                    results[f"lookup_{backend}"] = _each(db.contains_hash, hashes)
+                finally:
+                    db.close()
+            catalogue = [
+                dict(record, source_bucket_uri=f"gs://bucket/{os.path.relpath(record['local_file_path'], library)}")
+                for record in records
+            ]
+            for version, create, read in (
+                    ("v1", create_protobuf_file_list, read_protobuf_file_list),
+                    ("v2", create_compact_file_list, read_compact_file_list)
+                ):
+                out = PhotospherePath(os.path.join(tmp_folder, f"catalogue_{version}.pb"))
+                results[f"catalogue_{version}_write"] = _once(lambda: create(catalogue, out), len(catalogue))
+                results[f"catalogue_{version}_write"]["bytes"] = os.path.getsize(out.get_string())
+                results[f"catalogue_{version}_decode"] = _once(lambda: _read_all(read, out), len(catalogue))
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def _import_ms(stderr: str) -> float:
+    """
+    :return: the sum of the cumulative import times of the top level imports, in the output of -X importtime
+    """
+    microseconds = 0
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match and len(match.group(3)) == 1:
+            microseconds += int(match.group(2))
+    return round(microseconds / 1000, 2)
+
+
+def _startup(args: list[str], repeat: int) -> dict:
+    """
+    Runs the cli with args in a new interpreter repeat times
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-m", "src.main", *args],
+            cwd=SCRIPT_FOLDER, capture_output=True, text=True, env=dict(os.environ, PYTHONPATH=SCRIPT_FOLDER)
+        )
+        durations.append(time.perf_counter() - start)
+    stats = _stats(repeat, sum(durations), durations)
+    stats["import_ms"] = _import_ms(result.stderr)
+    return stats
+
+
+def run_fixed(hash_mib: int, startup_repeat: int, folder: str = None) -> dict:
+    """
+    :param hash_mib: size of the hashed file, 0 to skip the hash benchmarks
+    :param startup_repeat: runs of every startup command, 0 to skip the startup benchmarks
+    :return: the stats by benchmark name
+    """
+    results = {}
+    if hash_mib:
+        size = hash_mib << 20
+        with tempfile.TemporaryDirectory(dir=folder) as tmp_folder:
+            path = PhotospherePath(os.path.join(tmp_folder, "file.bin"))
+            with open(path.get_string(), "wb") as f:
+                for _ in range(hash_mib):
+                    f.write(os.urandom(1 << 20))
+            # in the page cache
+            hash_file(path)
+            for algorithm in _hash_algorithms():
+                with mock.patch("src.local.hashing.MMAP_MIN_SIZE", size + 1):
+                    results[f"hash_buffer_{algorithm}"] = _once(lambda: hash_file(path, algorithm), hash_mib)
+                with mock.patch("src.local.hashing.MMAP_MIN_SIZE", 1):
+                    results[f"hash_mmap_{algorithm}"] = _once(lambda: hash_file(path, algorithm), hash_mib)
+    if startup_repeat:
+        for name, args in STARTUP_COMMANDS.items():
+            results[f"startup_{name}"] = _startup(args, startup_repeat)
+    return results
+
+
+def _version() -> str | None:
+    with open(os.path.join(SCRIPT_FOLDER, "pyproject.toml"), "rb") as f:
+        return tomllib.load(f).get("project", {}).get("version")
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=SCRIPT_FOLDER, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: dict, current: dict) -> None:
+    """
+    Prints the files per second of the benchmarks in both results, and the ratio current / previous
+    """
+    print(f"{previous['version']} ({(previous['commit'] or '')[:8]}) -> {current['version']} ({(current['commit'] or '')[:8]})")
+    previous_groups = {"fixed": previous.get("fixed", {}), **previous["scales"]}
+    for scale, benchmarks in {"fixed": current.get("fixed", {}), **current["scales"]}.items():
+        for name, stats in benchmarks.items():
+            before = previous_groups.get(scale, {}).get(name)
+            if not before or not before["per_second"] or not stats["per_second"]:
+                continue
+            ratio = stats["per_second"] / before["per_second"]
+            print(f"{scale:>7} {name:>24}: {before['per_second']:12.1f} -> {stats['per_second']:12.1f}/s  x{ratio:.2f}")
+            if before.get("bytes") and stats.get("bytes"):
+                print(f"{'':>32} {before['bytes']:12d} -> {stats['bytes']:12d} B  x{stats['bytes'] / before['bytes']:.2f}")
+
+
+def _print(benchmarks: dict) -> None:
+    for name, stats in benchmarks.items():
+        percentiles = f", p50 {stats['p50_ms']:.3f} ms, p95 {stats['p95_ms']:.3f} ms" if "p50_ms" in stats else ""
+        size = f", {stats['bytes'] / stats['count']:.1f} B/file" if stats.get("bytes") and stats["count"] else ""
+        imports = f", imports {stats['import_ms']:.0f} ms" if "import_ms" in stats else ""
+        print(f"{name:>24}: {stats['seconds']:9.3f}s, {stats['per_second']:12.1f}/s{percentiles}{size}{imports}")
+
+
+def run(
+        scales: list[int],
+        out: str,
+        backends: list[str] = DATABASE_BACKENDS,
+        sample: int = DEFAULT_SAMPLE,
+        organize_mode: str = COPY_MODE,
+        folder: str = None,
+        previous: str = None,
+        hash_mib: int = DEFAULT_HASH_MIB,
+        startup_repeat: int = DEFAULT_STARTUP_REPEAT
+    ) -> dict:
+    results = {
+        "format": RESULTS_FORMAT,
+        "version": _version(),
+        "commit": _commit(),
+        "date": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "fixed": {},
+        "scales": {},
+    }
+    print("fixed")
+    results["fixed"] = run_fixed(hash_mib, startup_repeat, folder)
+    _print(results["fixed"])
+    for count in scales:
+        print(f"{count} files")
+        benchmarks = run_scale(count, backends, sample, organize_mode, folder)
+        results["scales"][str(count)] = benchmarks
+        _print(benchmarks)
+        # partial results are kept if a larger scale is interrupted
+        with open(out, "w") as f:
+            json.dump(results, f, indent=2)
+    if previous:
+        with open(previous) as f:
+            compare(json.load(f), results)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Photosphere benchmark suite")
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)), help="numbers of files")
+    parser.add_argument("--backends", default=",".join(DATABASE_BACKENDS), help="database backends of generate")
+    parser.add_argument("--sample", type=int, default=DEFAULT_SAMPLE, help="thumbnails and lookups per scale")
+    parser.add_argument("--organize-mode", choices=TRANSFER_MODES, default=COPY_MODE)
+    parser.add_argument("--folder", help="where the libraries are created, a temporary folder by default")
+    parser.add_argument("--out", default="benchmark_results.json", help="json results")
+    parser.add_argument("--compare", help="json results of a previous run")
+    parser.add_argument("--hash-mib", type=int, default=DEFAULT_HASH_MIB, help="size of the hashed file, 0 to skip")
+    parser.add_argument("--startup-repeat", type=int, default=DEFAULT_STARTUP_REPEAT, help="0 to skip the startup")
+    arguments = parser.parse_args()
+    run(
+        [int(scale) for scale in arguments.scales.split(",")],
+        os.path.abspath(arguments.out),
+        arguments.backends.split(","),
+        arguments.sample,
+        arguments.organize_mode,
+        arguments.folder,
+        arguments.compare,
+        arguments.hash_mib,
+        arguments.startup_repeat
+    )
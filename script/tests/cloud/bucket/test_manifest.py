@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from src.cloud.bucket.manifest import BucketManifest
+from src.cloud.bucket.storage_firebase import upload_blob_if_not_exist
+from src.file.path import PhotospherePath
+
+
+class FakeBlob:
+
+    def __init__(self, bucket: 'FakeBucket', name: str):
+        self.bucket = bucket
+        self.name = name
+
+    def exists(self) -> bool:
+        self.bucket.requests.append(("exists", self.name))
+        return self.name in self.bucket.files
+
+    def upload_from_filename(self, filename: str):
+        with open(filename, 'rb') as f:
+            self.upload_from_string(f.read())
+
+    def upload_from_string(self, data: bytes, content_type: str = None):
+        self.bucket.requests.append(("upload", self.name))
+        self.bucket.files[self.name] = data
+        self.content_type = content_type
+
+
+class FakeBucket:
+    """
+    The part of google.cloud.storage.Bucket used by storage_firebase, with paginated listing.
+    """
+
+    def __init__(self, files: dict[str, bytes], page_size: int = 2):
+        self.files = files
+        self.page_size = page_size
+        self.requests = []
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def list_blobs(self, prefix=None, delimiter=None, fields=None, page_size=None, max_results=None):
+        names = sorted(
+            name for name in self.files
+            if name.startswith(prefix or '') and not (delimiter and delimiter in name[len(prefix or ''):])
+        )
+        for start in range(0, len(names), self.page_size):
+            self.requests.append(("list", prefix))
+            for name in names[start:start + self.page_size]:
+                yield FakeBlob(self, name)
+
+
+class TestBucketManifest(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.bucket = FakeBucket({
+            "thumbnails/a.jpg.thumbnail.jpg": b"a",
+            "thumbnails/b.jpg.thumbnail.jpg": b"b",
+            "2020/a.jpg": b"a",
+            "2020/05/b.jpg": b"b",
+            "c.jpg": b"c",
+            "other/d.jpg": b"d",
+        })
+        patch = mock.patch('src.cloud.bucket.storage_firebase.storage.bucket', return_value=self.bucket)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.file = os.path.join(self.folder, "file.jpg")
+        with open(self.file, 'wb') as f:
+            f.write(b"new")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_existence_checks_without_requests(self):
+        manifest = BucketManifest("bucket", ["thumbnails/", "2020/", ""]).load()
+        assert len(manifest) == 5
+        self.bucket.requests.clear()
+        assert manifest.exists("2020/05/b.jpg")
+        assert manifest.exists("c.jpg")
+        assert not manifest.exists("2020/new.jpg")
+        assert self.bucket.requests == []
+        # outside the listed prefixes
+        assert manifest.exists("other/d.jpg")
+        assert self.bucket.requests == [("exists", "other/d.jpg")]
+
+    def test_upload_updates_the_manifest(self):
+        manifest = BucketManifest("bucket", ["2020/"]).load()
+        self.bucket.requests.clear()
+        assert upload_blob_if_not_exist(self.file, "2020/a.jpg", "bucket", manifest) == "gs://bucket/2020/a.jpg"
+        assert upload_blob_if_not_exist(self.file, "2020/new.jpg", "bucket", manifest) == "gs://bucket/2020/new.jpg"
+        assert upload_blob_if_not_exist(self.file, "2020/new.jpg", "bucket", manifest) == "gs://bucket/2020/new.jpg"
+        assert self.bucket.requests == [("upload", "2020/new.jpg")]
+
+    def test_disk_cache_with_ttl(self):
+        cache_path = PhotospherePath(os.path.join(self.folder, "manifest.json"))
+        manifest = BucketManifest("bucket", ["2020/"], cache_path, ttl=3600).load()
+        manifest.add("2020/new.jpg")
+        manifest.save()
+        self.bucket.requests.clear()
+
+        cached = BucketManifest("bucket", ["2020/", "thumbnails/"], cache_path, ttl=3600).load()
+        assert cached.exists("2020/new.jpg")
+        # only the prefix missing in the cache is listed
+        assert {request for request in self.bucket.requests} == {("list", "thumbnails/")}
+
+        self.bucket.requests.clear()
+        with mock.patch('src.cloud.bucket.manifest.time.time', return_value=manifest.listed_at + 3601):
+            expired = BucketManifest("bucket", ["2020/"], cache_path, ttl=3600).load()
+        assert not expired.exists("2020/new.jpg")
+        assert ("list", "2020/") in self.bucket.requests
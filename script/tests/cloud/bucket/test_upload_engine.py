@@ -0,0 +1,256 @@
+import asyncio
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import TestCase, mock
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from src.cloud.bucket.upload_engine import AsyncUploadEngine, CHUNK_ALIGNMENT, UploadError
+
+# not patched, the tests patch the backoff to not wait
+_backoff = AsyncUploadEngine._backoff
+_CONTENT_RANGE = re.compile(r'bytes (?:(\d+)-(\d+)|\*)/(\d+)')
+
+
+class FakeGcsServer(ThreadingHTTPServer):
+    """
+    The simple and resumable uploads of the GCS JSON API, with fault injection:
+     - fail_puts: number of chunk PUTs answered 503, after storing half of the chunk
+     - fail_posts: number of simple uploads answered 503
+    It records the requests, the content type of the files and the max bytes received at the same time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeGcsHandler)
+        self.lock = threading.Lock()
+        self.files = {}
+        self.sessions = {}
+        self.requests = []
+        self.content_types = {}
+        self.fail_puts = 0
+        self.fail_posts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeGcsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, headers: dict = None, body: bytes = b''):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        with self.server.lock:
+            self.server.in_flight += length
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            body = self.rfile.read(length)
+            if self.server.delay:
+                threading.Event().wait(self.server.delay)
+            return body
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= length
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        body = self._read_body()
+        bucket = url.path.split('/')[5]
+        name = params['name'][0]
+        with self.server.lock:
+            self.server.requests.append(('POST', params['uploadType'][0], name))
+            content_type = 'Content-Type' if params['uploadType'][0] == 'media' else 'X-Upload-Content-Type'
+            self.server.content_types[name] = self.headers[content_type]
+        if params['uploadType'][0] == 'media':
+            with self.server.lock:
+                if self.server.fail_posts:
+                    self.server.fail_posts -= 1
+                    return self._reply(503)
+                self.server.files[(bucket, name)] = body
+            return self._reply(200, body=b'{}')
+        session_id = str(len(self.server.sessions))
+        with self.server.lock:
+            self.server.sessions[session_id] = {
+                'bucket': bucket,
+                'name': name,
+                'size': int(self.headers['X-Upload-Content-Length']),
+                'data': b''
+            }
+        self._reply(200, {'Location': f"{self.server.url}/session/{session_id}"})
+
+    def do_PUT(self):
+        session = self.server.sessions[self.path.split('/')[-1]]
+        start, end, size = _CONTENT_RANGE.match(self.headers['Content-Range']).groups()
+        body = self._read_body()
+        with self.server.lock:
+            self.server.requests.append(('PUT', self.headers['Content-Range']))
+            if start is not None:
+                if int(start) != len(session['data']):
+                    return self._reply(400)
+                if self.server.fail_puts:
+                    self.server.fail_puts -= 1
+                    session['data'] += body[:len(body) // 2]
+                    return self._reply(503)
+                session['data'] += body
+            if len(session['data']) == int(size):
+                self.server.files[(session['bucket'], session['name'])] = session['data']
+                return self._reply(200, body=b'{}')
+            headers = {'Range': f"bytes=0-{len(session['data']) - 1}"} if session['data'] else {}
+        self._reply(308, headers)
+
+
+class TestUploadEngine(TestCase):
+
+    def setUp(self):
+        self.server = FakeGcsServer()
+        self.server_thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.server_thread.start()
+        self.tmp = tempfile.mkdtemp()
+        # no waits between the retries
+        patcher = mock.patch.object(AsyncUploadEngine, '_backoff', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def _file(self, name: str, size: int) -> str:
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    def _engine(self, **kwargs) -> AsyncUploadEngine:
+        return AsyncUploadEngine(requests.Session(), api_url=self.server.url, **kwargs)
+
+    def _content(self, path: str) -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_small_file_single_request(self):
+        path = self._file('small.jpg', 1000)
+        engine = self._engine()
+        gs_path = asyncio.run(engine.upload(path, 'folder/small.jpg', 'bucket'))
+        self.assertEqual(gs_path, 'gs://bucket/folder/small.jpg')
+        self.assertEqual(self.server.files[('bucket', 'folder/small.jpg')], self._content(path))
+        self.assertEqual(self.server.requests, [('POST', 'media', 'folder/small.jpg')])
+
+    def test_large_file_uploaded_in_chunks(self):
+        path = self._file('video.mp4', CHUNK_ALIGNMENT * 2 + 100)
+        engine = self._engine(chunk_size=CHUNK_ALIGNMENT)
+        asyncio.run(engine.upload(path, 'video.mp4', 'bucket'))
+        self.assertEqual(self.server.files[('bucket', 'video.mp4')], self._content(path))
+        puts = [request for request in self.server.requests if request[0] == 'PUT']
+        self.assertEqual(len(puts), 3)
+        self.assertEqual(self.server.requests[0], ('POST', 'resumable', 'video.mp4'))
+
+    def test_failed_chunk_resumed_from_received_bytes(self):
+        size = CHUNK_ALIGNMENT * 2
+        path = self._file('video.mp4', size)
+        self.server.fail_puts = 1
+        engine = self._engine(chunk_size=CHUNK_ALIGNMENT)
+        asyncio.run(engine.upload(path, 'video.mp4', 'bucket'))
+        self.assertEqual(self.server.files[('bucket', 'video.mp4')], self._content(path))
+        puts = [request[1] for request in self.server.requests if request[0] == 'PUT']
+        half = CHUNK_ALIGNMENT // 2
+        # the first chunk is half received, the status query returns the offset to resume from
+        self.assertEqual(puts, [
+            f'bytes 0-{CHUNK_ALIGNMENT - 1}/{size}',
+            f'bytes */{size}',
+            f'bytes {half}-{half + CHUNK_ALIGNMENT - 1}/{size}',
+            f'bytes {half + CHUNK_ALIGNMENT}-{size - 1}/{size}',
+        ])
+
+    def test_upload_from_memory(self):
+        small = os.urandom(1000)
+        large = os.urandom(CHUNK_ALIGNMENT + 100)
+        engine = self._engine(chunk_size=CHUNK_ALIGNMENT)
+        asyncio.run(engine.upload_many([(small, 'small.jpg', 'bucket'), (large, 'large.mp4', 'bucket')]))
+        self.assertEqual(self.server.files[('bucket', 'small.jpg')], small)
+        self.assertEqual(self.server.files[('bucket', 'large.mp4')], large)
+
+    def test_content_type_from_the_name(self):
+        engine = self._engine(chunk_size=CHUNK_ALIGNMENT)
+        asyncio.run(engine.upload_many([
+            (os.urandom(1000), 'small.jpg', 'bucket'),
+            (os.urandom(CHUNK_ALIGNMENT + 100), 'large.jpg', 'bucket'),
+            (os.urandom(1000), 'unknown.photosphere', 'bucket')
+        ]))
+        self.assertEqual(self.server.content_types, {
+            'small.jpg': 'image/jpeg',
+            'large.jpg': 'image/jpeg',
+            'unknown.photosphere': 'application/octet-stream'
+        })
+
+    def test_retry_with_backoff(self):
+        path = self._file('small.jpg', 1000)
+        self.server.fail_posts = 2
+        engine = self._engine()
+        asyncio.run(engine.upload(path, 'small.jpg', 'bucket'))
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(AsyncUploadEngine._backoff.call_args_list, [mock.call(0), mock.call(1)])
+        self.assertIn(('bucket', 'small.jpg'), self.server.files)
+
+    def test_retries_exhausted(self):
+        path = self._file('small.jpg', 1000)
+        self.server.fail_posts = 10
+        engine = self._engine(max_retries=2)
+        with self.assertRaises(UploadError):
+            asyncio.run(engine.upload(path, 'small.jpg', 'bucket'))
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_backoff_is_jittered_and_capped(self):
+        engine = AsyncUploadEngine(requests.Session(), backoff_base=1, backoff_max=4)
+        with mock.patch('src.cloud.bucket.upload_engine.random.uniform', side_effect=lambda a, b: (a, b)):
+            delays = [_backoff(engine, attempt) for attempt in range(5)]
+        self.assertEqual(delays, [(0, 1), (0, 2), (0, 4), (0, 4), (0, 4)])
+
+    def test_max_in_flight_bytes(self):
+        size = 100 * 1024
+        paths = [self._file(f'{i}.jpg', size) for i in range(8)]
+        self.server.delay = 0.05
+        engine = self._engine(max_in_flight_bytes=size * 2, concurrency=8)
+        asyncio.run(engine.upload_many([(path, os.path.basename(path), 'bucket') for path in paths]))
+        self.assertEqual(len(self.server.files), 8)
+        self.assertLessEqual(self.server.max_in_flight, size * 2)
+        self.assertGreater(self.server.max_in_flight, size)
+
+    def test_upload_blob_from_threads(self):
+        paths = [self._file(f'{i}.jpg', 5000) for i in range(12)]
+        engine = self._engine(concurrency=3).start()
+        try:
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                gs_paths = list(pool.map(lambda path: engine.upload_blob(path, os.path.basename(path), 'bucket'), paths))
+        finally:
+            engine.close()
+        self.assertEqual(gs_paths, [f'gs://bucket/{os.path.basename(path)}' for path in paths])
+        for path in paths:
+            self.assertEqual(self.server.files[('bucket', os.path.basename(path))], self._content(path))
+
+    def test_chunk_size_must_be_aligned(self):
+        with self.assertRaises(ValueError):
+            AsyncUploadEngine(requests.Session(), chunk_size=1000)
@@ -0,0 +1,113 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from src.cloud.catalogue import SegmentedCatalogue, publish_protobuf_shards, CATALOGUE_MANIFEST_FILE, CATALOGUE_SHARDS_FOLDER
+from src.cloud.sync_in_cloud import resolve_hash_algorithm
+from src.file.path import PhotospherePath
+from src.local.hashing import SHA1_ALGORITHM, XXH3_ALGORITHM
+from src.protobuf.shards import SHARD_INDEX_FILE
+from tests.synthetic_library import photo_record
+
+
+class TestSegmentedCatalogue(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.bucket = {}
+        self.uploaded = []
+
+        def upload_blob(source_file: str, storage_path: str, bucket_name: str):
+            with open(source_file, 'rb') as f:
+                self.bucket[storage_path] = f.read()
+            self.uploaded.append(storage_path)
+            return f"gs://{bucket_name}/{storage_path}"
+
+        def download_file_to_local(storage_path: str, bucket_name: str, local_path: PhotospherePath):
+            with open(local_path.get_string(), 'wb') as f:
+                f.write(self.bucket[storage_path])
+            return True
+
+        patches = [
+            mock.patch('src.cloud.catalogue.upload_blob', side_effect=upload_blob),
+            mock.patch('src.cloud.catalogue.download_file_to_local', side_effect=download_file_to_local),
+            mock.patch('src.cloud.catalogue.delete_file', side_effect=lambda path, bucket_name: self.bucket.pop(path)),
+            mock.patch('src.cloud.catalogue.exists_file_on_bucket', side_effect=lambda path, bucket_name: path in self.bucket),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _catalogue(self, local_folder: str = "local", compaction_threshold: int = 4) -> SegmentedCatalogue:
+        return SegmentedCatalogue(
+            "bucket",
+            PhotospherePath(os.path.join(self.folder, local_folder)),
+            compaction_threshold
+        )
+
+    def test_empty_bucket_has_no_catalogue(self):
+        assert self._catalogue().load() is None
+
+    def test_append_uploads_only_the_batch(self):
+        catalogue = self._catalogue()
+        catalogue.append([photo_record(i) for i in range(100)])
+        self.uploaded.clear()
+        catalogue.append([photo_record(i) for i in range(100, 110)])
+        assert len(self.uploaded) == 3
+        assert self.uploaded[-1] == CATALOGUE_MANIFEST_FILE
+        segment = json.loads(self.bucket[self.uploaded[0]])
+        assert segment == [photo_record(i) for i in range(100, 110)]
+
+    def test_load_from_another_local_folder(self):
+        catalogue = self._catalogue()
+        for batch in range(3):
+            catalogue.append([photo_record(batch * 10 + i) for i in range(10)])
+        records = self._catalogue("other").load()
+        assert records == [photo_record(i) for i in range(30)]
+
+    def test_compaction_keeps_order_and_deletes_segments(self):
+        catalogue = self._catalogue(compaction_threshold=3)
+        for batch in range(10):
+            catalogue.append([photo_record(batch * 5 + i) for i in range(5)])
+        assert len(catalogue.get_segments()) == 3
+        assert sum(segment["count"] for segment in catalogue.get_segments()) == 50
+        segment_files = [path for path in self.bucket if path != CATALOGUE_MANIFEST_FILE]
+        assert len(segment_files) == 6
+        assert self._catalogue("other").load() == [photo_record(i) for i in range(50)]
+
+    def test_hash_algorithm(self):
+        catalogue = self._catalogue()
+        assert catalogue.get_hash_algorithm() is None
+        assert resolve_hash_algorithm(catalogue) == SHA1_ALGORITHM
+        catalogue.append([photo_record(0)])
+        assert json.loads(self.bucket[CATALOGUE_MANIFEST_FILE])["hash_algorithm"] == SHA1_ALGORITHM
+        loaded = self._catalogue("other")
+        loaded.load()
+        assert loaded.get_hash_algorithm() == SHA1_ALGORITHM
+        assert resolve_hash_algorithm(loaded, SHA1_ALGORITHM) == SHA1_ALGORITHM
+        with self.assertRaisesRegex(ValueError, "has sha1 hashes"):
+            resolve_hash_algorithm(loaded, XXH3_ALGORITHM)
+
+    def test_catalogue_without_hash_algorithm_is_sha1(self):
+        self._catalogue().append([photo_record(0)])
+        assert "hash_algorithm" not in json.loads(self.bucket[CATALOGUE_MANIFEST_FILE])
+        loaded = self._catalogue("other")
+        loaded.load()
+        assert loaded.get_hash_algorithm() == SHA1_ALGORITHM
+
+    def test_publish_shards_uploads_only_changed_months(self):
+        local_folder = PhotospherePath(os.path.join(self.folder, "local"))
+        files = [photo_record(i * 86400 * 40) for i in range(10)]
+        index = publish_protobuf_shards(files, "bucket", local_folder)
+        assert len(self.uploaded) == len(index["shards"]) + 1
+        self.uploaded.clear()
+        files[-1]["geohash"] = "u0nd9hdfq"
+        index = publish_protobuf_shards(files, "bucket", PhotospherePath(os.path.join(self.folder, "other")))
+        assert self.uploaded == [CATALOGUE_SHARDS_FOLDER + index["shards"][0]["file"], CATALOGUE_SHARDS_FOLDER + SHARD_INDEX_FILE]
+        shard_files = {path for path in self.bucket if path.startswith(CATALOGUE_SHARDS_FOLDER)}
+        assert shard_files == {CATALOGUE_SHARDS_FOLDER + shard["file"] for shard in index["shards"]} | {CATALOGUE_SHARDS_FOLDER + SHARD_INDEX_FILE}
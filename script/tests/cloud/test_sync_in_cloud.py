@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from tinydb import TinyDB
+
+from src.cloud.catalogue import SegmentedCatalogue, LOCAL_CATALOGUE_FOLDER
+from src.cloud.sync_in_cloud import copy_in_cloud, RENDITIONS_FOLDER, CLOUD_DB_JSON_FILE
+from src.file.image.rendition import RenditionOptions, GRID_RENDITION, PREVIEW_RENDITION
+from src.file.path import PhotospherePath
+from tests.cloud.test_sync_journal import DiskBucket, IMAGES_FOLDER, CLOUD_DB_PATH
+
+
+class TestSyncRenditions(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.previous_cwd = os.getcwd()
+        os.chdir(self.folder)
+        self.source = os.path.join(self.folder, "source")
+        os.makedirs(os.path.join(self.source, "2020"))
+        shutil.copy(os.path.join(IMAGES_FOLDER, "Car_moving.jpg"), os.path.join(self.source, "2020"))
+        with open(os.path.join(self.source, "notes.txt"), "w") as f:
+            f.write("notes")
+        self.bucket = DiskBucket(os.path.join(self.folder, "bucket"))
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.folder)
+
+    def _sync(self, workers: int):
+        with mock.patch('src.cloud.bucket.storage_firebase.storage.bucket', return_value=self.bucket):
+            copy_in_cloud(
+                PhotospherePath(self.source),
+                "bucket",
+                workers=workers,
+                rendition_options=RenditionOptions([PREVIEW_RENDITION, GRID_RENDITION])
+            )
+        db = TinyDB(CLOUD_DB_PATH)
+        records = {os.path.basename(record["local_file_path"]): record for record in db.all()}
+        db.close()
+        return records
+
+    def _check(self, records: dict):
+        assert records["notes.txt"]["renditions"] is None
+        renditions = records["Car_moving.jpg"]["renditions"]
+        assert [(rendition["name"], rendition["size"]) for rendition in renditions] == [
+            (GRID_RENDITION, 320), (PREVIEW_RENDITION, 1280)
+        ]
+        for rendition in renditions:
+            name = rendition["uri"].removeprefix("gs://bucket/")
+            assert name.startswith(RENDITIONS_FOLDER) and name.endswith(".webp")
+            assert os.path.exists(os.path.join(self.bucket.root, name))
+
+    def test_sequential_sync(self):
+        self._check(self._sync(1))
+
+    def test_parallel_sync(self):
+        self._check(self._sync(2))
+
+    def test_buckets_have_their_own_database(self):
+        self._sync(1)
+        other_source = os.path.join(self.folder, "other_source")
+        os.makedirs(other_source)
+        with open(os.path.join(other_source, "other.txt"), "w") as f:
+            f.write("other")
+        other_bucket = DiskBucket(os.path.join(self.folder, "other_bucket"))
+        with mock.patch('src.cloud.bucket.storage_firebase.storage.bucket', return_value=other_bucket):
+            copy_in_cloud(PhotospherePath(other_source), "other")
+            records = SegmentedCatalogue("other", PhotospherePath(os.path.join(self.folder, "check"))).load()
+        db = TinyDB(os.path.join(LOCAL_CATALOGUE_FOLDER, "other", CLOUD_DB_JSON_FILE))
+        assert [os.path.basename(record["local_file_path"]) for record in db.all()] == ["other.txt"]
+        db.close()
+        assert [os.path.basename(record["local_file_path"]) for record in records] == ["other.txt"]
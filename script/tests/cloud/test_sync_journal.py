@@ -0,0 +1,291 @@
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from unittest import TestCase, mock, skipUnless
+
+from tinydb import TinyDB
+
+from src.cloud.bucket.manifest import BUCKET_MANIFEST_FILE
+from src.cloud.catalogue import SegmentedCatalogue, LOCAL_CATALOGUE_FOLDER
+from src.cloud.sync_in_cloud import copy_in_cloud, CLOUD_DB_JSON_FILE
+from src.cloud.sync_journal import SyncJournal, SYNC_JOURNAL_FILE, HASHED, THUMBNAIL_UPLOADED, SOURCE_UPLOADED, \
+    COMMITTED
+from src.file.path import PhotospherePath
+from src.local.utils import file_hash
+
+IMAGES_FOLDER = os.path.join(os.path.dirname(__file__), '../../resources/original_images')
+# the local database of the bucket, see get_cloud_database_path
+CLOUD_DB_PATH = os.path.join(LOCAL_CATALOGUE_FOLDER, "bucket", CLOUD_DB_JSON_FILE)
+
+
+class DiskBlob:
+
+    def __init__(self, bucket: 'DiskBucket', name: str):
+        self.bucket = bucket
+        self.name = name
+        self.path = os.path.join(bucket.root, name)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def upload_from_filename(self, filename: str):
+        with open(filename, 'rb') as f:
+            self.upload_from_string(f.read())
+
+    def upload_from_string(self, data: bytes, content_type: str = None):
+        self.bucket.event()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'wb') as f:
+            f.write(data)
+        with open(self.bucket.log, 'a') as f:
+            f.write(self.name + '\n')
+        self.bucket.event()
+
+    def download_to_filename(self, filename: str):
+        shutil.copyfile(self.path, filename)
+
+    def download_as_bytes(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def delete(self):
+        os.remove(self.path)
+
+
+class DiskBucket:
+    """
+    A bucket in a local folder, shared by the killed sync process and the resumed one.
+    Every upload is appended to the log file.
+    """
+
+    def __init__(self, root: str, event=lambda: None):
+        self.root = root
+        self.log = root + '.log'
+        self.event = event
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, name: str) -> DiskBlob:
+        return DiskBlob(self, name)
+
+    def list_blobs(self, prefix=None, delimiter=None, fields=None, page_size=None, max_results=None):
+        names = []
+        for folder, _, files in os.walk(self.root):
+            for file in files:
+                names.append(os.path.relpath(os.path.join(folder, file), self.root))
+        for name in sorted(names):
+            if name.startswith(prefix or '') and not (delimiter and delimiter in name[len(prefix or ''):]):
+                yield DiskBlob(self, name)
+
+    def uploads(self) -> list[str]:
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log) as f:
+            return f.read().split()
+
+
+class TestSyncJournal(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = PhotospherePath(os.path.join(self.folder, SYNC_JOURNAL_FILE))
+        self.file = os.path.join(self.folder, "a.txt")
+        with open(self.file, "w") as f:
+            f.write("a")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_resume_steps(self):
+        journal = SyncJournal(self.path, "bucket")
+        journal.record(self.file, HASHED, hash="h")
+        journal.record(self.file, THUMBNAIL_UPLOADED, thumbnail_bucket_uri="gs://bucket/t")
+        journal.close()
+
+        resumed = SyncJournal(self.path, "bucket", resume=True)
+        steps = resumed.get(PhotospherePath(self.file))
+        assert steps["state"] == THUMBNAIL_UPLOADED
+        assert steps["hash"] == "h" and steps["thumbnail_bucket_uri"] == "gs://bucket/t"
+        assert not resumed.is_done(PhotospherePath(self.file))
+
+        record = {"local_file_path": self.file, "hash": "h"}
+        resumed.record(self.file, SOURCE_UPLOADED, record=record)
+        assert resumed.is_done(PhotospherePath(self.file))
+        assert resumed.get_pending_records() == [record]
+        resumed.commit([record])
+        assert resumed.get(PhotospherePath(self.file))["state"] == COMMITTED
+        assert resumed.get_pending_records() == []
+        resumed.close(remove=True)
+        assert not self.path.exists()
+
+    def test_only_uploads_and_commits_are_fsynced(self):
+        with mock.patch('src.cloud.sync_journal.os.fsync') as fsync:
+            journal = SyncJournal(self.path, "bucket")
+            journal.record(self.file, HASHED, hash="h")
+            journal.record(self.file, THUMBNAIL_UPLOADED, thumbnail_bucket_uri="gs://bucket/t")
+            assert fsync.call_count == 0
+            record = {"local_file_path": self.file, "hash": "h"}
+            journal.record(self.file, SOURCE_UPLOADED, record=record)
+            journal.commit([record])
+            assert fsync.call_count == 2
+        journal.close()
+
+    def test_torn_line_is_dropped(self):
+        journal = SyncJournal(self.path, "bucket")
+        journal.record(self.file, HASHED, hash="h")
+        journal.file.write(b'{"path": "a.txt", "state": "thumb')
+        journal.file.flush()
+        journal.close()
+        resumed = SyncJournal(self.path, "bucket", resume=True)
+        assert resumed.get(PhotospherePath(self.file))["state"] == HASHED
+        resumed.record(self.file, THUMBNAIL_UPLOADED, thumbnail_bucket_uri="gs://bucket/t")
+        resumed.close()
+        with open(self.path.get_string()) as f:
+            assert [json.loads(line)["state"] for line in f] == ["started", HASHED, THUMBNAIL_UPLOADED]
+
+    def test_changed_file_is_not_resumed(self):
+        journal = SyncJournal(self.path, "bucket")
+        journal.record(self.file, HASHED, hash="h")
+        journal.close()
+        with open(self.file, "w") as f:
+            f.write("changed")
+        assert SyncJournal(self.path, "bucket", resume=True).get(PhotospherePath(self.file)) is None
+
+    def test_without_resume_or_other_bucket_starts_again(self):
+        journal = SyncJournal(self.path, "bucket")
+        journal.record(self.file, HASHED, hash="h")
+        journal.close()
+        assert SyncJournal(self.path, "other", resume=True).get(PhotospherePath(self.file)) is None
+        journal = SyncJournal(self.path, "bucket")
+        journal.record(self.file, HASHED, hash="h")
+        journal.close()
+        assert SyncJournal(self.path, "bucket").get(PhotospherePath(self.file)) is None
+
+
+@skipUnless(hasattr(os, 'fork'), 'needs fork')
+class TestResumeAfterKill(TestCase):
+    """
+    A sync is killed at a random point (an upload, or a journal append, possibly in the middle of the line)
+    in a forked process, then resumed: every file must be uploaded and committed exactly once.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.previous_cwd = os.getcwd()
+        os.chdir(self.folder)
+        self.source = os.path.join(self.folder, "source")
+        os.makedirs(os.path.join(self.source, "2020"))
+        for i in range(8):
+            with open(os.path.join(self.source, "2020" if i % 2 else "", f"file_{i}.txt"), "w") as f:
+                f.write(f"content {i}")
+        for name in ("Hurricane.r4118.arp.jpg", "Agate_de_l'Esterel.jpg"):
+            shutil.copy(os.path.join(IMAGES_FOLDER, name), os.path.join(self.source, "2020", name))
+        self.bucket_root = os.path.join(self.folder, "bucket")
+
+    def tearDown(self):
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.folder)
+
+    def _sync(self, bucket: DiskBucket, resume: bool = False):
+        with mock.patch('src.cloud.bucket.storage_firebase.storage.bucket', return_value=bucket):
+            copy_in_cloud(PhotospherePath(self.source), "bucket", resume=resume)
+
+    def _killed_sync(self, kill_at: int) -> bool:
+        """
+        Runs the sync in a child process that exits without any cleanup at the kill_at-th event.
+        :return: True if the sync was killed before the end
+        """
+        pid = os.fork()
+        if pid == 0:
+            events = 0
+
+            def event():
+                nonlocal events
+                events += 1
+                if events == kill_at:
+                    os._exit(17)
+
+            original_append = SyncJournal._append
+
+            def append(journal: SyncJournal, step: dict):
+                event()
+                if events + 1 == kill_at:
+                    # cut in the middle of the line
+                    line = json.dumps(step).encode('utf-8')
+                    journal.file.write(line[:len(line) // 2])
+                    journal.file.flush()
+                    os._exit(17)
+                original_append(journal, step)
+
+            try:
+                with mock.patch.object(SyncJournal, '_append', append):
+                    sys.stdout = open(os.devnull, 'w')
+                    self._sync(DiskBucket(self.bucket_root, event))
+            finally:
+                os._exit(0)
+        _, status = os.waitpid(pid, 0)
+        return os.waitstatus_to_exitcode(status) == 17
+
+    def _journal_states(self) -> dict[str, str]:
+        states = {}
+        if not os.path.exists(SYNC_JOURNAL_FILE):
+            return states
+        with open(SYNC_JOURNAL_FILE, 'rb') as f:
+            for line in f:
+                try:
+                    step = json.loads(line)
+                except ValueError:
+                    break
+                if step["state"] == COMMITTED:
+                    states.update({path: COMMITTED for path in step["paths"]})
+                elif "path" in step:
+                    states[step["path"]] = step["state"]
+        return states
+
+    def test_resume_after_kill_at_random_points(self):
+        expected_hashes = sorted(
+            file_hash(PhotospherePath(os.path.join(folder, file)))
+            for folder, _, files in os.walk(self.source) for file in files
+        )
+        rng = random.Random(1234)
+        for kill_at in sorted(rng.sample(range(1, 60), 6)):
+            with self.subTest(kill_at=kill_at):
+                for path in (self.bucket_root, self.bucket_root + '.log', SYNC_JOURNAL_FILE, BUCKET_MANIFEST_FILE,
+                             LOCAL_CATALOGUE_FOLDER):
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    elif os.path.exists(path):
+                        os.remove(path)
+
+                killed = self._killed_sync(kill_at)
+                done_before = {
+                    path for path, state in self._journal_states().items() if state in (SOURCE_UPLOADED, COMMITTED)
+                }
+                bucket = DiskBucket(self.bucket_root)
+                uploads_before = len(bucket.uploads())
+
+                hashed = []
+                with mock.patch('src.local.file_cache.file_hash', side_effect=lambda path, *args: (
+                        hashed.append(path.get_string()) or file_hash(path))):
+                    self._sync(bucket, resume=True)
+
+                assert killed
+                assert not os.path.exists(SYNC_JOURNAL_FILE)
+                # the finished files are neither hashed nor uploaded again
+                assert not done_before & set(hashed)
+                resumed_uploads = bucket.uploads()[uploads_before:]
+                assert not {os.path.relpath(path, self.source) for path in done_before} & set(resumed_uploads)
+                # every source file is uploaded once
+                sources = [name for name in bucket.uploads() if name.startswith(("2020/", "file_"))]
+                assert sorted(sources) == sorted(set(sources)) and len(sources) == 10
+                # and committed once, in the database and in the catalogue
+                db = TinyDB(CLOUD_DB_PATH)
+                assert sorted(record["hash"] for record in db.all()) == expected_hashes
+                db.close()
+                with mock.patch('src.cloud.bucket.storage_firebase.storage.bucket', return_value=bucket):
+                    catalogue = SegmentedCatalogue("bucket", PhotospherePath(os.path.join(self.folder, "check")))
+                    records = catalogue.load()
+                shutil.rmtree(os.path.join(self.folder, "check"))
+                assert sorted(record["hash"] for record in records) == expected_hashes
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase, mock
+
+from src.cloud.sync_pipeline import run_pipeline, analyze_file
+from src.file.path import PhotospherePath
+from src.local.utils import list_files_in_folder, file_hash
+from src.util import profiling
+
+
+class TestSyncPipeline(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for i in range(12):
+            with open(os.path.join(self.folder, f"file_{i:02d}.txt"), "w") as f:
+                f.write(f"content {i % 10}")
+        with open(os.path.join(self.folder, "skipped.bin"), "w") as f:
+            f.write("not supported")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _run(self, known_hashes: set[str], workers: int = 2, upload_concurrency: int = 3) -> list[dict]:
+        committed = []
+
+        def upload(analysis: dict, file_path: PhotospherePath) -> dict:
+            dic = analysis["dic"]
+            dic["source_bucket_uri"] = "gs://bucket/" + os.path.basename(dic["local_file_path"])
+            return dic
+
+        run_pipeline(
+            list_files_in_folder(PhotospherePath(self.folder)),
+            known_hashes,
+            upload,
+            committed.append,
+            workers,
+            upload_concurrency
+        )
+        return committed
+
+    def test_commit_follows_walk_order_and_skips_duplicates(self):
+        committed = self._run(set())
+        expected = []
+        seen = set()
+        for file_path in list_files_in_folder(PhotospherePath(self.folder)):
+            if not file_path.get_string().endswith(".txt"):
+                continue
+            hash = file_hash(file_path)
+            if hash not in seen:
+                seen.add(hash)
+                expected.append(file_path.get_string())
+        assert [dic["local_file_path"] for dic in committed] == expected
+        assert len(committed) == 10
+        assert all(dic["source_bucket_uri"].startswith("gs://bucket/") for dic in committed)
+
+    def test_known_hashes_are_skipped(self):
+        known = file_hash(PhotospherePath(os.path.join(self.folder, "file_03.txt")))
+        committed = self._run({known})
+        assert known not in [dic["hash"] for dic in committed]
+        assert len(committed) == 9
+
+    def test_later_duplicate_analyzed_first(self):
+        # file_00.txt and file_10.txt have the same content
+        first, later = [
+            file_path.get_string() for file_path in list_files_in_folder(PhotospherePath(self.folder))
+            if os.path.basename(file_path.get_string()) in ("file_00.txt", "file_10.txt")
+        ]
+
+        def slow_first(file_path: str, stat=None):
+            if file_path == first:
+                time.sleep(0.5)
+            return analyze_file(file_path, stat)
+
+        # threads instead of processes, so the analysis of the first copy can be delayed
+        with mock.patch('src.cloud.sync_pipeline.ProcessPoolExecutor', ThreadPoolExecutor), \
+                mock.patch('src.cloud.sync_pipeline.analyze_file', slow_first):
+            committed = self._run(set(), workers=4)
+        paths = [dic["local_file_path"] for dic in committed]
+        # the later copy is analyzed first, the first one in walk order is still the one committed
+        assert first in paths and later not in paths
+        assert len(committed) == 10
+
+    def test_analyze_unsupported_file(self):
+        assert analyze_file(os.path.join(self.folder, "skipped.bin")) is None
+
+    def test_spans_of_the_workers(self):
+        profiler = profiling.enable(trace=True)
+        try:
+            committed = self._run(set())
+        finally:
+            profiling.disable()
+        assert len(committed) == 10
+        hashes = [event for event in profiler.events if event[0] == "file.hash"]
+        # every file is hashed in a worker process
+        assert len(hashes) >= 13
+        assert os.getpid() not in {event[4] for event in hashes}
@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from tinydb import TinyDB
+
+from src.database.photosphere_database import PhotosphereDatabase, import_tinydb_json, export_tinydb_json, \
+    check_video_hash_version, HASH_ALGORITHM_KEY, VIDEO_HASH_VERSION_KEY
+from src.database.sqlite_database import SQLitePhotosphereDatabase
+from src.database.tinydb_database import TinyDBPhotosphereDatabase
+from src.database.utils import open_database, SQLITE_BACKEND
+from src.file.path import PhotospherePath
+from tests.synthetic_library import photo_record
+
+
+class TestSQLitePhotosphereDatabase(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.db = SQLitePhotosphereDatabase(PhotospherePath(os.path.join(self.folder, "db.sqlite")))
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.folder)
+
+    def test_insert_and_contains(self):
+        self.db.insert_multiple([photo_record(i) for i in range(10)])
+        assert len(self.db) == 10
+        assert self.db.contains_hash(photo_record(3)["hash"])
+        assert not self.db.contains_hash(photo_record(11)["hash"])
+        assert self.db.all_hashes() == {photo_record(i)["hash"] for i in range(10)}
+
+    def test_duplicated_hash_is_ignored(self):
+        self.db.insert(photo_record(1))
+        duplicated = photo_record(1)
+        duplicated["local_file_path"] = "/tmp/copy.jpg"
+        self.db.insert_multiple([duplicated, photo_record(2)])
+        assert len(self.db) == 2
+        assert self.db.all()[0]["local_file_path"] == "/tmp/photo_1.jpg"
+
+    def test_all_keeps_insertion_order(self):
+        records = [photo_record(i) for i in (5, 1, 3)]
+        self.db.insert_multiple(records)
+        assert self.db.all() == records
+
+    def test_tinydb_round_trip(self):
+        json_path = PhotospherePath(os.path.join(self.folder, "db.json"))
+        tinydb = TinyDB(json_path.get_string())
+        tinydb.insert_multiple([photo_record(i) for i in range(20)])
+        tinydb.close()
+
+        assert import_tinydb_json(json_path, self.db) == 20
+        export_path = PhotospherePath(os.path.join(self.folder, "export.json"))
+        assert export_tinydb_json(self.db, export_path) == 20
+
+        exported = TinyDB(export_path.get_string())
+        assert exported.all() == [photo_record(i) for i in range(20)]
+        exported.close()
+
+    def test_backend_without_every_method(self):
+        class IncompleteDatabase(PhotosphereDatabase):
+            def all(self) -> list[dict]:
+                return []
+
+        with self.assertRaises(TypeError):
+            IncompleteDatabase()
+
+    def test_hash_algorithm_round_trip(self):
+        json_path = PhotospherePath(os.path.join(self.folder, "db.json"))
+        tinydb = TinyDBPhotosphereDatabase(json_path)
+        assert tinydb.get_metadata(HASH_ALGORITHM_KEY) is None
+        tinydb.insert_multiple([photo_record(i) for i in range(3)])
+        tinydb.set_metadata(HASH_ALGORITHM_KEY, "xxh3_128")
+        tinydb.set_metadata(HASH_ALGORITHM_KEY, "blake3")
+        assert tinydb.get_metadata(HASH_ALGORITHM_KEY) == "blake3"
+        # the metadata are not records
+        assert len(tinydb) == 3
+        tinydb.close()
+
+        assert import_tinydb_json(json_path, self.db) == 3
+        assert self.db.get_metadata(HASH_ALGORITHM_KEY) == "blake3"
+        export_path = PhotospherePath(os.path.join(self.folder, "export.json"))
+        export_tinydb_json(self.db, export_path)
+        exported = TinyDBPhotosphereDatabase(export_path)
+        assert exported.get_metadata(HASH_ALGORITHM_KEY) == "blake3"
+        assert exported.all() == [photo_record(i) for i in range(3)]
+        exported.close()
+
+    def test_video_hash_version(self):
+        check_video_hash_version(self.db, "2", "db")
+        assert self.db.get_metadata(VIDEO_HASH_VERSION_KEY) == "2"
+        self.db.insert(photo_record(0, file_type="VIDEO", average_hash="0b" + "1" * 64))
+        check_video_hash_version(self.db, "2", "db")
+        with self.assertRaisesRegex(ValueError, "version 2"):
+            check_video_hash_version(self.db, "3", "db")
+
+    def test_video_hashes_without_version(self):
+        # only image hashes, made before the version was recorded
+        self.db.insert(photo_record(0))
+        check_video_hash_version(self.db, "2", "db")
+        assert self.db.get_metadata(VIDEO_HASH_VERSION_KEY) == "2"
+
+        legacy = SQLitePhotosphereDatabase(PhotospherePath(os.path.join(self.folder, "legacy.sqlite")))
+        legacy.insert_multiple([photo_record(0), photo_record(1, file_type="VIDEO", average_hash="0b" + "1" * 64)])
+        with self.assertRaisesRegex(ValueError, "older version"):
+            check_video_hash_version(legacy, "2", "db")
+        assert legacy.get_metadata(VIDEO_HASH_VERSION_KEY) is None
+        legacy.close()
+
+    def test_open_sqlite_backend_imports_json(self):
+        json_path = PhotospherePath(os.path.join(self.folder, "cloud.json"))
+        tinydb = TinyDB(json_path.get_string())
+        tinydb.insert_multiple([photo_record(i) for i in range(3)])
+        tinydb.close()
+
+        db = open_database(json_path, SQLITE_BACKEND)
+        db.insert(photo_record(3))
+        assert len(db) == 4
+        assert db.to_json().get_string() == json_path.get_string()
+        db.close()
+        assert len(TinyDB(json_path.get_string()).all()) == 4
+        assert os.path.exists(os.path.join(self.folder, "cloud.sqlite"))
+
+    def test_open_sqlite_backend_imports_json_once(self):
+        json_path = PhotospherePath(os.path.join(self.folder, "cloud.json"))
+        tinydb = TinyDB(json_path.get_string())
+        tinydb.insert_multiple([photo_record(i) for i in range(3)])
+        tinydb.close()
+        open_database(json_path, SQLITE_BACKEND).close()
+
+        with mock.patch('src.database.utils.import_tinydb_json') as import_json:
+            open_database(json_path, SQLITE_BACKEND).close()
+            db = open_database(json_path, SQLITE_BACKEND)
+            db.insert(photo_record(3))
+            # the export is the content of the database
+            db.to_json()
+            db.close()
+            open_database(json_path, SQLITE_BACKEND).close()
+        import_json.assert_not_called()
+
+        # the json file changed, by an older version or a download
+        tinydb = TinyDB(json_path.get_string())
+        tinydb.insert(photo_record(4))
+        tinydb.close()
+        os.utime(json_path.get_string(), ns=(0, os.stat(json_path.get_string()).st_mtime_ns + 1))
+        db = open_database(json_path, SQLITE_BACKEND)
+        assert len(db) == 5
+        db.close()
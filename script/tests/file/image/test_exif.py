@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from PIL import Image
+
+from src.file.image.exif import read_exif_metadata, read_jpeg_exif_segment, GPS_IFD_TAG, EXIF_IFD_TAG
+from src.file.image.image import PhotosphereImage
+from src.file.path import PhotospherePath
+
+
+def _jpeg_with_exif(path: str, date_time: str = None, date_time_original: str = None, gps: dict = None) -> None:
+    exif = Image.Exif()
+    if date_time:
+        exif[0x0132] = date_time
+    if date_time_original:
+        exif.get_ifd(EXIF_IFD_TAG)[0x9003] = date_time_original
+    if gps:
+        exif.get_ifd(GPS_IFD_TAG).update(gps)
+    Image.new("RGB", (64, 48), "red").save(path, "JPEG", exif=exif)
+
+
+class TestExif(TestCase):
+
+    current_dir = os.path.dirname(__file__)
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_date_time_original_and_gps(self):
+        path = os.path.join(self.folder, "photo.jpg")
+        _jpeg_with_exif(
+            path,
+            "2020:01:01 10:00:00",
+            "2019:07:14 08:30:15",
+            {1: "S", 2: (33.0, 51.0, 36.0), 3: "E", 4: (151.0, 12.0, 54.0)}
+        )
+        metadata = read_exif_metadata(PhotospherePath(path))
+        assert metadata["date_time"] == "2020:01:01 10:00:00"
+        assert metadata["date_time_original"] == "2019:07:14 08:30:15"
+        assert metadata["gps_info"][1] == "S"
+        assert metadata["gps_info"][2] == (33.0, 51.0, 36.0)
+
+        image = PhotosphereImage(PhotospherePath(path))
+        assert image.created_at.isoformat() == "2019-07-14T08:30:15"
+        assert round(image.latitude, 3) == -33.86
+        assert round(image.longitude, 3) == 151.215
+
+    def test_jpeg_without_exif(self):
+        path = os.path.join(self.folder, "photo.jpg")
+        Image.new("RGB", (64, 48), "red").save(path, "JPEG")
+        assert read_jpeg_exif_segment(PhotospherePath(path)) == b''
+        image = PhotosphereImage(PhotospherePath(path))
+        assert image.created_at is None
+        assert image.geohash is None
+
+    def test_compressed_data_is_not_read(self):
+        # the image data after the start of scan is corrupted, the metadata are still read
+        path = os.path.join(self.folder, "photo.jpg")
+        _jpeg_with_exif(path, "2020:01:01 10:00:00")
+        with open(path, 'rb') as f:
+            content = f.read()
+        start_of_scan = content.index(b'\xff\xda')
+        with open(path, 'wb') as f:
+            f.write(content[:start_of_scan + 2] + b'\x00' * 16)
+        image = PhotosphereImage(PhotospherePath(path))
+        assert image.created_at.isoformat() == "2020-01-01T10:00:00"
+
+    def test_metadata_do_not_decode_the_image(self):
+        path = PhotospherePath(os.path.abspath(
+            os.path.join(
+                self.current_dir, '../../../resources/original_images/Car_moving.jpg'
+            )
+        ))
+        with mock.patch.object(Image, "open", wraps=Image.open) as image_open:
+            image = PhotosphereImage(path)
+            assert image.created_at.isoformat() == '2014-10-20T17:18:53'
+            image_open.assert_not_called()
+            assert image.average_hash is not None
+            image_open.assert_called_once()
+
+    def test_png_metadata(self):
+        path = os.path.join(self.folder, "photo.png")
+        exif = Image.Exif()
+        exif[0x0132] = "2021:03:04 05:06:07"
+        Image.new("RGB", (64, 48), "red").save(path, "PNG", exif=exif)
+        assert read_exif_metadata(PhotospherePath(path))["date_time"] == "2021:03:04 05:06:07"
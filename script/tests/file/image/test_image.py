@@ -1,5 +1,8 @@
+import io
 import os
 from unittest import TestCase
+from PIL import Image
+
 from src.file.image.image import PhotosphereImage
 from src.file.path import PhotospherePath
 
@@ -83,13 +86,13 @@ class TestPhotosphereImage(TestCase):
             )
         )
         psImage = PhotosphereImage(PhotospherePath(path))
-        psImage.generate_thumbnail()
-        thumbnail = psImage.thumbnail_local_path.get_string()
-        assert thumbnail is not None
-        assert thumbnail.endswith('.thumbnail.jpg')
-        assert os.path.exists(thumbnail)
+        thumbnail = psImage.generate_thumbnail()
+        assert thumbnail.startswith(b'\xff\xd8')
+        assert psImage.thumbnail_jpeg == thumbnail
+        assert psImage.get_thumbnail_name() == f"Car_moving.jpg.{psImage.hash}.thumbnail.jpg"
+        with Image.open(io.BytesIO(thumbnail)) as decoded:
+            assert max(decoded.size) <= psImage.THUMBNAIL_PIXEL_SIZE
         psImage.__del__()
-        assert not os.path.exists(thumbnail)
 
     def test_image_thumbnail_with_conversion_error(self):
 
@@ -99,9 +102,8 @@ class TestPhotosphereImage(TestCase):
             )
         )
         psImage = PhotosphereImage(PhotospherePath(path))
-        psImage.generate_thumbnail()
-        thumbnail = psImage.thumbnail_local_path.get_string()
-        assert thumbnail is not None
+        thumbnail = psImage.generate_thumbnail()
+        assert thumbnail.startswith(b'\xff\xd8')
         psImage.__del__()
 
     def test_image_heic_format(self):
@@ -114,4 +116,20 @@ class TestPhotosphereImage(TestCase):
         assert psImage.file_path.get_string() == path
         assert psImage.get_file_type() == 'IMAGE'
         assert psImage.created_at.isoformat() == '2020-07-11T10:17:23'
-        assert psImage.average_hash == "fff8cffc0ff807f907f803f803f003f803f803f90fb99f089fc0c1e000fc03fe"
\ No newline at end of file
+        assert psImage.average_hash == "fff8cffc0ff807f907f803f803f003f803f803f90fb99f089fc0c1e000fc03fe"
+
+    def test_image_decoded_once_at_thumbnail_scale(self):
+        path = os.path.abspath(
+            os.path.join(
+                self.current_dir, '../../../resources/original_images/Car_moving.jpg'
+            )
+        )
+        psImage = PhotosphereImage(PhotospherePath(path))
+        assert psImage.average_hash == "fe90fa90f991fc80f800f820f820f800f802f800fc00fe00ff00fc00fc00fc00"
+        # 5312x2988 decoded at 1/8
+        assert psImage.pilImage.size == (664, 374)
+        decoded = psImage.pilImage
+        psImage.generate_thumbnail()
+        assert psImage.pilImage is decoded
+        assert max(psImage.pilImage.size) == PhotosphereImage.THUMBNAIL_PIXEL_SIZE
+        psImage.__del__()
@@ -0,0 +1,100 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from PIL import Image
+
+from src.file.image.exif import read_exif_metadata
+from src.file.image.image import PhotosphereImage
+from src.file.image.preview import find_embedded_previews, read_embedded_preview
+from src.file.image.rendition import RenditionOptions, GRID_RENDITION
+from src.file.path import PhotospherePath
+from tests.synthetic_library import raw_with_previews, jpeg_with_mpf_preview
+
+
+def _jpeg(size: tuple[int, int], color: str = "red", **params) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "JPEG", **params)
+    return buffer.getvalue()
+
+
+class TestPreview(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, name: str, data: bytes) -> PhotospherePath:
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return PhotospherePath(path)
+
+    def test_raw_previews(self):
+        data = raw_with_previews([_jpeg((160, 120)), _jpeg((1600, 1200)), _jpeg((800, 600))], (6000, 4500), 6)
+        previews, size, orientation = find_embedded_previews(data)
+        assert [preview[2] for preview in previews] == [160, 1600, 800]
+        assert size == (6000, 4500)
+        assert orientation == 6
+
+    def test_smallest_preview_large_enough(self):
+        path = self._write("image.dng", raw_with_previews(
+            [_jpeg((160, 120)), _jpeg((1600, 1200)), _jpeg((800, 600))], (6000, 4500)
+        ))
+        image, _ = read_embedded_preview(path, 280)
+        assert image.size == (800, 600)
+        image, _ = read_embedded_preview(path, 1000)
+        assert image.size == (1600, 1200)
+        assert read_embedded_preview(path, 2000) is None
+        image, _ = read_embedded_preview(path, 2000, allow_smaller=True)
+        assert image.size == (1600, 1200)
+
+    def test_other_aspect_ratio_is_not_a_preview(self):
+        # letterboxed 16:9 preview of a 3:2 image
+        data = raw_with_previews([_jpeg((1600, 900)), _jpeg((900, 600))], (6000, 4000))
+        assert [preview[2] for preview in find_embedded_previews(data)[0]] == [900]
+
+    def test_lossless_jpeg_is_not_a_preview(self):
+        lossless = bytearray(_jpeg((800, 600)))
+        # the baseline start of frame marked as lossless, like the RAW data of a DNG
+        lossless[lossless.index(b'\xff\xc0') + 1] = 0xC3
+        data = raw_with_previews([bytes(lossless), _jpeg((400, 300))], (6000, 4500))
+        assert [preview[2] for preview in find_embedded_previews(data)[0]] == [400]
+
+    def test_mpf_preview(self):
+        data = jpeg_with_mpf_preview(_jpeg((3000, 2000)), _jpeg((1500, 1000), "blue"))
+        path = self._write("image.jpg", data)
+        image, orientation = read_embedded_preview(path, 280)
+        assert image.size == (1500, 1000)
+        assert orientation == 1
+        image.load()
+        assert image.getpixel((0, 0))[2] > 200
+        # the image itself is still decodable
+        assert Image.open(io.BytesIO(data)).size == (3000, 2000)
+
+    def test_corrupted_file(self):
+        data = raw_with_previews([_jpeg((800, 600))], (6000, 4500))
+        previews, _, _ = find_embedded_previews(data[:len(data) // 2])
+        assert previews == []
+        assert find_embedded_previews(b'not an image') == ([], None, 1)
+
+    def test_raw_image_is_never_decoded(self):
+        path = self._write("image.dng", raw_with_previews(
+            [_jpeg((160, 120)), _jpeg((600, 400))], (6000, 4000), orientation=6, date="2021:06:01 10:00:00"
+        ))
+        assert read_exif_metadata(path)["date_time"] == "2021:06:01 10:00:00"
+        psImage = PhotosphereImage(path)
+        with mock.patch('src.file.image.image.Image.open', wraps=Image.open) as image_open:
+            renditions = psImage.generate_renditions(RenditionOptions([GRID_RENDITION]))
+            thumbnail = psImage.generate_thumbnail()
+        # only the preview is opened, from memory
+        assert [type(call.args[0]) for call in image_open.call_args_list] == [io.BytesIO]
+        assert psImage.created_at.year == 2021
+        # rotated by the orientation of the RAW file, the preview has no EXIF
+        assert Image.open(io.BytesIO(renditions[0]["data"])).size == (213, 320)
+        assert Image.open(io.BytesIO(thumbnail)).size == (280, 187)
+        psImage.__del__()
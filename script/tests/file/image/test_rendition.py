@@ -0,0 +1,91 @@
+import io
+import os
+from unittest import TestCase, mock
+
+from PIL import Image
+
+from src.file.image.image import PhotosphereImage
+from src.file.image.exif import ORIENTATION_TAG
+from src.file.image.rendition import RenditionOptions, encode_renditions, check_rendition_format, GRID_RENDITION, \
+    PREVIEW_RENDITION, LARGE_RENDITION, WEBP_FORMAT
+from src.file.path import PhotospherePath
+
+
+class TestRendition(TestCase):
+
+    current_dir = os.path.dirname(__file__)
+
+    def _decode(self, data: bytes) -> Image.Image:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+        return image
+
+    def test_sizes_smallest_first(self):
+        image = Image.new("RGB", (3000, 2000), "red")
+        options = RenditionOptions([LARGE_RENDITION, GRID_RENDITION, PREVIEW_RENDITION])
+        renditions = encode_renditions(image, options)
+        assert [(name, size) for name, size, _ in renditions] == [
+            (GRID_RENDITION, 320), (PREVIEW_RENDITION, 1280), (LARGE_RENDITION, 2560)
+        ]
+        for _, size, data in renditions:
+            decoded = self._decode(data)
+            assert decoded.format == "WEBP"
+            assert decoded.size == (size, round(size * 2 / 3))
+        assert image.size == (3000, 2000)
+
+    def test_small_image_is_not_scaled_up(self):
+        image = Image.new("RGB", (800, 600), "red")
+        renditions = encode_renditions(image, RenditionOptions([GRID_RENDITION, PREVIEW_RENDITION, LARGE_RENDITION]))
+        # preview and large would both be the image itself
+        assert [(name, size) for name, size, _ in renditions] == [(GRID_RENDITION, 320), (PREVIEW_RENDITION, 800)]
+
+    def test_quality(self):
+        image = Image.effect_noise((1000, 1000), 64).convert("RGB")
+        low = encode_renditions(image, RenditionOptions([PREVIEW_RENDITION], quality=20))[0][2]
+        high = encode_renditions(image, RenditionOptions([PREVIEW_RENDITION], quality=95))[0][2]
+        assert len(low) < len(high)
+
+    def test_alpha_and_palette(self):
+        transparent = Image.new("RGBA", (400, 400), (255, 0, 0, 0))
+        assert self._decode(encode_renditions(transparent, RenditionOptions([GRID_RENDITION]))[0][2]).mode == "RGBA"
+        palette = Image.new("P", (400, 400))
+        assert self._decode(encode_renditions(palette, RenditionOptions([GRID_RENDITION]))[0][2]).mode == "RGB"
+
+    def test_exif_orientation(self):
+        image = Image.new("RGB", (600, 400), "red")
+        exif = image.getexif()
+        exif[ORIENTATION_TAG] = 6
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", exif=exif)
+        rotated = Image.open(io.BytesIO(buffer.getvalue()))
+        name, size, data = encode_renditions(rotated, RenditionOptions([GRID_RENDITION]))[0]
+        assert self._decode(data).size == (213, 320)
+
+    def test_unknown_rendition_and_format(self):
+        with self.assertRaises(ValueError):
+            RenditionOptions(["huge"])
+        with self.assertRaises(ValueError):
+            check_rendition_format("gif")
+        assert check_rendition_format(WEBP_FORMAT) == WEBP_FORMAT
+
+    def test_image_renditions_from_one_decode(self):
+        path = os.path.abspath(
+            os.path.join(
+                self.current_dir, '../../../resources/original_images/Car_moving.jpg'
+            )
+        )
+        psImage = PhotosphereImage(PhotospherePath(path))
+        with mock.patch('src.file.image.image.Image.open', wraps=Image.open) as image_open:
+            renditions = psImage.generate_renditions(RenditionOptions([GRID_RENDITION, PREVIEW_RENDITION]))
+            thumbnail = psImage.generate_thumbnail()
+        assert image_open.call_count == 1
+        # 5312x2988 decoded at 1/4, the smallest scale larger than the preview
+        assert [(rendition["name"], rendition["size"]) for rendition in renditions] == [
+            (GRID_RENDITION, 320), (PREVIEW_RENDITION, 1280)
+        ]
+        assert renditions[0]["file_name"] == f"Car_moving.jpg.{psImage.hash}.grid.webp"
+        # rotated by the EXIF orientation
+        assert self._decode(renditions[1]["data"]).size == (720, 1280)
+        assert thumbnail.startswith(b'\xff\xd8')
+        assert psImage.average_hash == "fe90fa90f991fc80f800f820f820f800f802f800fc00fe00ff00fc00fc00fc00"
+        psImage.__del__()
@@ -0,0 +1,105 @@
+import io
+import os
+import shutil
+import stat
+import sys
+import tempfile
+from unittest import TestCase, mock
+
+from PIL import Image
+
+from src.file.path import PhotospherePath
+from src.file.video.analyzer import analyze_video, parse_ffmetadata, HASH_FRAME_SIZE
+from src.file.video.video import PhotosphereVideo
+
+# writes what ffmpeg would write on the outputs of the command built by analyze_video
+FAKE_FFMPEG = '''#!{python}
+import os, sys
+args = sys.argv[1:]
+with open(os.environ["FAKE_FFMPEG_ARGS"], "w") as f:
+    f.write("\\n".join(args))
+frames = int(os.environ["FAKE_FFMPEG_FRAMES"])
+outputs = [arg for arg in args if arg.startswith("pipe:")]
+with os.fdopen(int(outputs[0][5:]), "wb") as f:
+    f.write(b";FFMETADATA1\\ncreation_time=2015-08-07T09:13:02.000000Z\\nlocation=+45.4642+009.1900/\\n")
+with os.fdopen(int(outputs[1][5:]), "wb") as f:
+    with open(os.environ["FAKE_FFMPEG_THUMBNAIL"], "rb") as thumbnail:
+        f.write(thumbnail.read())
+if len(outputs) > 2:
+    for i in range(frames):
+        sys.stdout.buffer.write(bytes([i % 256, 255 - i % 256, 128]) * ({size} * {size}))
+'''
+
+
+class TestVideoAnalyzer(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        ffmpeg = os.path.join(self.folder, "ffmpeg")
+        with open(ffmpeg, "w") as f:
+            f.write(FAKE_FFMPEG.format(python=sys.executable, size=HASH_FRAME_SIZE))
+        os.chmod(ffmpeg, os.stat(ffmpeg).st_mode | stat.S_IEXEC)
+        thumbnail = io.BytesIO()
+        Image.new("RGB", (280, 158), "blue").save(thumbnail, "JPEG")
+        self.thumbnail = thumbnail.getvalue()
+        with open(os.path.join(self.folder, "thumbnail.jpg"), "wb") as f:
+            f.write(self.thumbnail)
+        self.args_path = os.path.join(self.folder, "args.txt")
+        self.video = PhotospherePath(os.path.join(self.folder, "video.mp4"))
+        with open(self.video.get_string(), "wb") as f:
+            f.write(b"video")
+        patches = [
+            mock.patch("src.file.video.analyzer.FFMPEG_BINARY", ffmpeg),
+            mock.patch.dict(os.environ, {
+                "FAKE_FFMPEG_ARGS": self.args_path,
+                "FAKE_FFMPEG_FRAMES": "20",
+                "FAKE_FFMPEG_THUMBNAIL": os.path.join(self.folder, "thumbnail.jpg"),
+            }),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _args(self) -> list[str]:
+        with open(self.args_path) as f:
+            return f.read().split("\n")
+
+    def test_single_run_outputs(self):
+        analysis = analyze_video(self.video, 280)
+        assert analysis.tags["creation_time"] == "2015-08-07T09:13:02.000000Z"
+        assert analysis.thumbnail == self.thumbnail
+        assert len(analysis.frames) == 20
+        assert analysis.frames[3].getpixel((0, 0)) == (3, 252, 128)
+        hash = analysis.get_average_hash()
+        assert len(hash) == 66 and hash.startswith("0b")
+        assert "-skip_frame" in self._args()
+
+    def test_frames_are_decimated(self):
+        analysis = analyze_video(self.video, 280, max_frames=8)
+        assert [frame.getpixel((0, 0))[0] for frame in analysis.frames] == [0, 4, 8, 12, 16]
+
+    def test_interval_without_keyframes(self):
+        analyze_video(self.video, 280, frame_interval=2, keyframes_only=False)
+        args = self._args()
+        assert "-skip_frame" not in args
+        assert "fps=1/2,scale=144:144" in args
+
+    def test_thumbnail_only(self):
+        analysis = analyze_video(self.video, 280, max_frames=0)
+        assert analysis.frames == []
+        assert analysis.get_average_hash() is None
+        assert "pipe:1" not in self._args()
+
+    def test_video_from_one_run(self):
+        video = PhotosphereVideo(self.video)
+        assert video.created_at.isoformat() == "2015-08-07T09:13:02"
+        assert video.geohash is not None
+        assert video.average_hash is not None
+        assert video.generate_thumbnail() == self.thumbnail
+
+    def test_parse_ffmetadata(self):
+        tags = parse_ffmetadata(";FFMETADATA1\ntitle=a\\=b\\\nc\n[STREAM]\ntitle=stream\n")
+        assert tags == {"title": "a=b\nc"}
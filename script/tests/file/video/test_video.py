@@ -11,12 +11,11 @@ class TestPhotosphereVideo(TestCase):
     def test_video_metadata_hash(self):
         path = os.path.abspath(
             os.path.join(
-                self.current_dir, '../../../resources/original_videos/video_hash.mp4'
+                self.current_dir, '../../../resources/original_videos/sample_960x540.m4v'
             )
         )
         psVideo = PhotosphereVideo(PhotospherePath(path))
-        print(psVideo.average_hash)
-        assert psVideo.average_hash == "0b0100000101010111000110010111101001001111010100000100000111110000"
+        assert psVideo.average_hash == "0b1100011100000111000000001100000000111000001110000000000000000000"
 
         path = os.path.abspath(
             os.path.join(
@@ -24,7 +23,7 @@ class TestPhotosphereVideo(TestCase):
             )
         )
         psVideo = PhotosphereVideo(PhotospherePath(path))
-        assert psVideo.average_hash == "0b1111111111111010111011001100100001010001111100111000000011000000"
+        assert psVideo.average_hash == "0b1111011011100000101101100000000010001010000000000011000111010111"
 
     def test_video_metadata(self):
         path = os.path.abspath(
@@ -51,13 +50,10 @@ class TestPhotosphereVideo(TestCase):
             )
         )
         psVideo = PhotosphereVideo(PhotospherePath(path))
-        psVideo.generate_thumbnail()
-        thumbnail = psVideo.thumbnail_local_path.get_string()
-        psVideo.generate_thumbnail()
-        assert thumbnail is not None
-        assert thumbnail.endswith('.thumbnail.jpg')
-        psVideo.__del__()
-        assert not os.path.exists(thumbnail)
+        thumbnail = psVideo.generate_thumbnail()
+        assert psVideo.generate_thumbnail() is thumbnail
+        assert thumbnail.startswith(b'\xff\xd8')
+        assert psVideo.get_thumbnail_name().endswith('.thumbnail.jpg')
 
     def test_video_hash(self):
         path = os.path.abspath(
@@ -78,12 +74,9 @@ class TestPhotosphereVideo(TestCase):
         assert psVideo.hash == "015f72d916d06428baf9b6cc3a031ae47c596cb4"
         assert psVideo.TYPE == "VIDEO"
         assert psVideo.file_path.get_string().endswith('.m4v')
-        psVideo.generate_thumbnail()
-        thumbnail = psVideo.thumbnail_local_path.get_string()
-        assert thumbnail is not None
-        assert thumbnail.endswith('.thumbnail.jpg')
-        psVideo.__del__()
-        assert not os.path.exists(thumbnail)
+        thumbnail = psVideo.generate_thumbnail()
+        assert thumbnail.startswith(b'\xff\xd8')
+        assert psVideo.get_thumbnail_name().endswith('.thumbnail.jpg')
 
 
     def test_video_mov_extension(self):
@@ -97,9 +90,6 @@ class TestPhotosphereVideo(TestCase):
         assert psVideo.hash == "64bbbe58aa61c4d5966a8247b675256b12401819"
         assert psVideo.TYPE == "VIDEO"
         assert psVideo.file_path.get_string().endswith('.mov')
-        psVideo.generate_thumbnail()
-        thumbnail = psVideo.thumbnail_local_path.get_string()
-        assert thumbnail is not None
-        assert thumbnail.endswith('.thumbnail.jpg')
-        psVideo.__del__()
-        assert not os.path.exists(thumbnail)
+        thumbnail = psVideo.generate_thumbnail()
+        assert thumbnail.startswith(b'\xff\xd8')
+        assert psVideo.get_thumbnail_name().endswith('.thumbnail.jpg')
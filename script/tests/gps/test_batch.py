@@ -0,0 +1,75 @@
+import random
+from unittest import TestCase
+
+import numpy as np
+
+from src.gps.batch import decode_geohash_batch, encode_geohash_batch, geohash_neighbors_batch, MAX_PRECISION
+from src.gps.gps import encode_geohash
+
+
+class TestGeohashBatch(TestCase):
+
+    def setUp(self):
+        rng = random.Random(7)
+        # random positions, the edges of the world and positions on the cell boundaries
+        self.latitudes = [rng.uniform(-90, 90) for _ in range(2000)] + [90, -90, 0, 45, -45, 22.5, 100, -100]
+        self.longitudes = [rng.uniform(-180, 180) for _ in range(2000)] + [180, -180, 0, 90, -90, 45, 200, -200]
+
+    def test_encode_same_as_scalar(self):
+        for precision in range(1, MAX_PRECISION + 1):
+            expected = [encode_geohash(lat, lon, precision) for lat, lon in zip(self.latitudes, self.longitudes)]
+            assert encode_geohash_batch(self.latitudes, self.longitudes, precision).tolist() == expected, precision
+
+    def test_nan_same_as_scalar(self):
+        assert encode_geohash_batch([float('nan')], [float('nan')], 5).tolist() == [
+            encode_geohash(float('nan'), float('nan'), 5)
+        ]
+
+    def test_empty(self):
+        assert encode_geohash_batch([], [], 9).tolist() == []
+
+    def test_invalid_precision(self):
+        with self.assertRaises(ValueError):
+            encode_geohash_batch([0], [0], MAX_PRECISION + 1)
+
+    def test_decode_contains_the_position(self):
+        for precision in (1, 4, 9, 12):
+            geohashes = encode_geohash_batch(self.latitudes, self.longitudes, precision)
+            cells = decode_geohash_batch(geohashes)
+            latitudes = np.clip(self.latitudes, -90, 90)
+            longitudes = np.clip(self.longitudes, -180, 180)
+            assert np.all(cells["min_latitude"] <= latitudes) and np.all(latitudes <= cells["max_latitude"])
+            assert np.all(cells["min_longitude"] <= longitudes) and np.all(longitudes <= cells["max_longitude"])
+            # the centroid is in the same cell
+            assert encode_geohash_batch(cells["latitude"], cells["longitude"], precision).tolist() == \
+                geohashes.tolist()
+
+    def test_decode_known_cell(self):
+        cells = decode_geohash_batch(["ezs42"])
+        self.assertAlmostEqual(cells["latitude"][0], 42.605, places=3)
+        self.assertAlmostEqual(cells["longitude"][0], -5.603, places=3)
+
+    def test_decode_invalid(self):
+        with self.assertRaises(ValueError):
+            decode_geohash_batch(["ezs42", "ezs4"])
+        with self.assertRaises(ValueError):
+            decode_geohash_batch(["ezsa2"])
+
+    def test_neighbors(self):
+        neighbors = geohash_neighbors_batch(["u0", "zz", "00"])
+        assert neighbors.tolist() == [
+            ["u1", "u3", "u2", "sr", "sp", "ez", "gb", "gc"],
+            # north pole, the longitude wraps around
+            ["", "", "bp", "bn", "zy", "zw", "zx", ""],
+            # south pole
+            ["01", "03", "02", "", "", "", "pb", "pc"],
+        ]
+
+    def test_neighbors_are_adjacent(self):
+        geohashes = encode_geohash_batch(self.latitudes[:200], self.longitudes[:200], 7)
+        cells = decode_geohash_batch(geohashes)
+        neighbors = geohash_neighbors_batch(geohashes)
+        north = decode_geohash_batch([cell for cell in neighbors[:, 0] if cell])
+        inside = neighbors[:, 0] != ''
+        assert np.allclose(north["min_latitude"], cells["max_latitude"][inside])
+        assert np.allclose(north["min_longitude"], cells["min_longitude"][inside])
@@ -0,0 +1,109 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from src.database.tinydb_database import TinyDBPhotosphereDatabase
+from src.file.path import PhotospherePath
+from src.gps.batch import codes_to_geohashes, encode_geohash_batch
+from src.gps.spatial_index import SpatialIndex, geohash_cover, haversine_meters, load_spatial_index
+
+
+class TestSpatialIndex(TestCase):
+
+    def setUp(self):
+        rng = random.Random(11)
+        self.records = [
+            {"hash": str(i), "latitude": rng.uniform(-90, 90), "longitude": rng.uniform(-180, 180)}
+            for i in range(3000)
+        ]
+        # a dense city and the edges of the world
+        self.records += [
+            {"hash": f"c{i}", "latitude": 45.46 + rng.uniform(-0.05, 0.05), "longitude": 9.19 + rng.uniform(-0.05, 0.05)}
+            for i in range(500)
+        ]
+        self.records += [
+            {"hash": "antimeridian-east", "latitude": 10.0, "longitude": 179.999},
+            {"hash": "antimeridian-west", "latitude": 10.0, "longitude": -179.999},
+            {"hash": "north-pole", "latitude": 90.0, "longitude": 0.0},
+            {"hash": "no-position", "latitude": None, "longitude": None},
+        ]
+        self.index = SpatialIndex(self.records)
+
+    def _bbox_brute_force(self, min_lat, min_lon, max_lat, max_lon) -> set[str]:
+        return {
+            record["hash"] for record in self.records
+            if record["latitude"] is not None
+            and min_lat <= record["latitude"] <= max_lat
+            and (min_lon <= record["longitude"] <= max_lon if min_lon <= max_lon
+                 else record["longitude"] >= min_lon or record["longitude"] <= max_lon)
+        }
+
+    def test_records_without_position_are_ignored(self):
+        assert len(self.index) == len(self.records) - 1
+
+    def test_bbox_same_as_scan(self):
+        rng = random.Random(2)
+        boxes = [(45.44, 9.17, 45.48, 9.21), (-90, -180, 90, 180), (0, 170, 20, -170), (10.0, 179.999, 10.0, 179.999)]
+        for _ in range(50):
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            size = 10 ** rng.uniform(-3, 1.5)
+            boxes.append((lat, lon, min(lat + size, 90), min(lon + size, 180)))
+        for box in boxes:
+            found = [record["hash"] for record in self.index.query_bbox(*box)]
+            assert len(found) == len(set(found))
+            assert set(found) == self._bbox_brute_force(*box), box
+
+    def test_near_same_as_scan(self):
+        located = [record for record in self.records if record["latitude"] is not None]
+        latitudes = np.array([record["latitude"] for record in located])
+        longitudes = np.array([record["longitude"] for record in located])
+        for latitude, longitude, radius in ((45.46, 9.19, 2000), (10.0, 180.0, 5000), (89.9, 50, 20000),
+                                            (0, 0, 3_000_000)):
+            distances = haversine_meters(latitude, longitude, latitudes, longitudes)
+            expected = {located[i]["hash"] for i in np.nonzero(distances <= radius)[0]}
+            result = self.index.query_near(latitude, longitude, radius)
+            assert {record["hash"] for record, _ in result} == expected
+            found_distances = [distance for _, distance in result]
+            assert found_distances == sorted(found_distances)
+
+    def test_near_crosses_antimeridian(self):
+        result = self.index.query_near(10.0, 180.0, 1000)
+        assert {record["hash"] for record, _ in result} == {"antimeridian-east", "antimeridian-west"}
+
+    def test_cover_is_bounded(self):
+        cells, precision = geohash_cover(45.44, 9.17, 45.48, 9.21)
+        assert len(cells) <= 64
+        assert precision >= 5
+        # every corner is in a cell of the cover
+        corners = encode_geohash_batch([45.44, 45.44, 45.48, 45.48], [9.17, 9.21, 9.17, 9.21], precision)
+        assert set(corners.tolist()) <= set(codes_to_geohashes(cells, precision).tolist())
+
+    def test_cell_counts(self):
+        counts = self.index.cell_counts(3)
+        assert sum(counts.values()) == len(self.index)
+        assert list(counts) == sorted(counts)
+        assert counts[encode_geohash_batch([45.46], [9.19], 3)[0]] >= 500
+
+    def test_export_cell_counts_from_database(self):
+        folder = tempfile.mkdtemp()
+        try:
+            db_path = PhotospherePath(os.path.join(folder, "db.json"))
+            db = TinyDBPhotosphereDatabase(db_path)
+            db.insert_multiple(self.records)
+            db.close()
+            index = load_spatial_index(db_path)
+            out_path = PhotospherePath(os.path.join(folder, "cells.json"))
+            cells = index.export_cell_counts(out_path, 2)
+            with open(out_path.get_string(), encoding="utf-8") as f:
+                content = json.load(f)
+            assert content["precision"] == 2
+            assert content["count"] == len(self.records) - 1
+            assert len(content["cells"]) == cells
+            assert sum(content["cells"].values()) == content["count"]
+        finally:
+            shutil.rmtree(folder)
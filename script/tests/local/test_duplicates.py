@@ -0,0 +1,103 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+from itertools import combinations
+from unittest import TestCase
+
+from src.database.tinydb_database import TinyDBPhotosphereDatabase
+from src.file.path import PhotospherePath
+from src.local.duplicates import cluster_near_duplicates, find_duplicates, near_duplicate_pairs, \
+    parse_average_hash
+
+
+def _flip_bits(value: int, bits: int, count: int, rng: random.Random) -> int:
+    for position in rng.sample(range(bits), count):
+        value ^= 1 << position
+    return value
+
+
+class TestDuplicates(TestCase):
+
+    def test_parse_average_hash(self):
+        assert parse_average_hash(None) is None
+        assert parse_average_hash("ff00") == (16, 0xff00)
+        assert parse_average_hash("0b0101") == (4, 0b0101)
+        # hex hash starting with 0b
+        assert parse_average_hash("0b2f") == (16, 0x0b2f)
+
+    def test_pairs_match_all_pairs_comparison(self):
+        rng = random.Random(3)
+        for bits, max_distance in ((256, 0), (256, 2), (256, 10), (256, 40), (64, 5), (64, 63)):
+            values = set()
+            while len(values) < 300:
+                value = rng.getrandbits(bits)
+                values.add(value)
+                # near duplicates, some within the distance and some just outside
+                values.add(_flip_bits(value, bits, rng.randint(1, min(max_distance + 2, bits)), rng))
+            values = list(values)
+            expected = {
+                (i, j, (values[i] ^ values[j]).bit_count())
+                for i, j in combinations(range(len(values)), 2)
+                if (values[i] ^ values[j]).bit_count() <= max_distance
+            }
+            found = list(near_duplicate_pairs(values, bits, max_distance))
+            assert len(found) == len(set(found)), "a pair is returned more than once"
+            assert set(found) == expected, (bits, max_distance)
+
+    def test_distance_out_of_range(self):
+        with self.assertRaises(ValueError):
+            list(near_duplicate_pairs([1, 2], 64, 64))
+
+    def test_clusters(self):
+        rng = random.Random(5)
+        image = rng.getrandbits(256)
+        video = rng.getrandbits(64)
+        records = [
+            {"local_file_path": "a.jpg", "average_hash": f"{image:064x}"},
+            {"local_file_path": "b.jpg", "average_hash": f"{_flip_bits(image, 256, 4, rng):064x}"},
+            # same hash of a.jpg
+            {"local_file_path": "c.jpg", "average_hash": f"{image:064x}"},
+            {"local_file_path": "d.jpg", "average_hash": f"{rng.getrandbits(256):064x}"},
+            {"local_file_path": "e.jpg", "average_hash": None},
+            {"local_file_path": "f.mp4", "average_hash": "0b" + f"{video:064b}"},
+            {"local_file_path": "g.mp4", "average_hash": "0b" + f"{_flip_bits(video, 64, 2, rng):064b}"},
+            {"local_file_path": "h.mp4", "average_hash": "0b" + f"{video ^ ((1 << 64) - 1):064b}"},
+            {"local_file_path": "i.jpg", "average_hash": f"{rng.getrandbits(256):064x}"},
+        ]
+        clusters = cluster_near_duplicates(records, max_distance=5)
+        assert [[record["local_file_path"] for record in cluster] for cluster in clusters] == [
+            ["a.jpg", "b.jpg", "c.jpg"],
+            ["f.mp4", "g.mp4"],
+        ]
+
+    def test_identical_hashes_are_a_cluster(self):
+        records = [
+            {"local_file_path": "a.jpg", "average_hash": "f" * 64},
+            {"local_file_path": "b.jpg", "average_hash": "f" * 64},
+            {"local_file_path": "c.jpg", "average_hash": "0" * 64},
+        ]
+        clusters = cluster_near_duplicates(records, max_distance=0)
+        assert [[record["local_file_path"] for record in cluster] for cluster in clusters] == [["a.jpg", "b.jpg"]]
+
+    def test_find_duplicates_from_database(self):
+        folder = tempfile.mkdtemp()
+        try:
+            db_path = PhotospherePath(os.path.join(folder, "db.json"))
+            db = TinyDBPhotosphereDatabase(db_path)
+            db.insert_multiple([
+                {"hash": "1", "local_file_path": "a.jpg", "average_hash": "f" * 64},
+                {"hash": "2", "local_file_path": "b.jpg", "average_hash": "f" * 63 + "e"},
+                {"hash": "3", "local_file_path": "c.jpg", "average_hash": "0" * 64},
+            ])
+            db.close()
+            out_path = PhotospherePath(os.path.join(folder, "duplicates.json"))
+            clusters = find_duplicates(db_path, 1, out_path)
+            assert len(clusters) == 1
+            with open(out_path.get_string(), encoding="utf-8") as f:
+                content = json.load(f)
+            assert content["max_distance"] == 1
+            assert [record["hash"] for record in content["clusters"][0]] == ["1", "2"]
+        finally:
+            shutil.rmtree(folder)
@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from src.file.image.image import PhotosphereImage
+from src.file.local_file import PhotosphereFile
+from src.file.path import PhotospherePath
+from src.local.file_cache import FileStatCache, FILE_CACHE_FILE, cached_file_hash, get_file_cache_path, \
+    load_photosphere_file
+from src.local.organize_files import organize_all_files
+from src.local.scanner import scan_files
+
+
+class TestFileStatCache(TestCase):
+
+    current_dir = os.path.dirname(__file__)
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = FileStatCache(PhotospherePath(os.path.join(self.folder, "cache.sqlite")))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.folder)
+
+    def test_cached_file_hash_is_not_recomputed(self):
+        path = PhotospherePath(os.path.join(self.folder, "test.txt"))
+        with open(path.get_string(), "w") as f:
+            f.write("photosphere")
+        expected = cached_file_hash(path, self.cache)
+        with mock.patch("src.local.file_cache.file_hash") as file_hash:
+            assert cached_file_hash(path, self.cache) == expected
+            file_hash.assert_not_called()
+
+    def test_modified_file_is_invalidated(self):
+        path = PhotospherePath(os.path.join(self.folder, "test.txt"))
+        with open(path.get_string(), "w") as f:
+            f.write("photosphere")
+        first = cached_file_hash(path, self.cache)
+        with open(path.get_string(), "w") as f:
+            f.write("photosphere v2")
+        assert self.cache.get(path) is None
+        assert cached_file_hash(path, self.cache) != first
+
+    def test_stat_of_the_scan_is_reused(self):
+        path = os.path.join(self.folder, "test.txt")
+        with open(path, "w") as f:
+            f.write("photosphere")
+        scanned = next(scan_files(PhotospherePath(self.folder), {".txt"}))
+        with mock.patch("src.file.path.Path.stat") as stat:
+            first = cached_file_hash(scanned.get_path(), self.cache)
+            assert cached_file_hash(scanned.get_path(), self.cache) == first
+            stat.assert_not_called()
+
+    def test_load_image_from_cache(self):
+        source = os.path.abspath(
+            os.path.join(
+                self.current_dir, '../../resources/original_images/Car_moving.jpg'
+            )
+        )
+        path = PhotospherePath(os.path.join(self.folder, "Car_moving.jpg"))
+        shutil.copy2(source, path.get_string())
+        ps = load_photosphere_file(path, self.cache)
+        with mock.patch.object(PhotosphereImage, "__init__") as init:
+            cached = load_photosphere_file(path, self.cache)
+            init.assert_not_called()
+        assert isinstance(cached, PhotosphereImage)
+        assert cached.get_dic() == ps.get_dic()
+
+    def test_video_hashes_of_another_version_are_dropped(self):
+        path = PhotospherePath(os.path.join(self.folder, "test.mp4"))
+        with open(path.get_string(), "w") as f:
+            f.write("photosphere")
+        self.cache._put(path, "sha1", "0" * 40, "VIDEO", "0b" + "1" * 64, None, None, None)
+        self.cache.connection.execute("PRAGMA user_version = 1")
+        self.cache.connection.commit()
+        self.cache.close()
+        self.cache = FileStatCache(PhotospherePath(os.path.join(self.folder, "cache.sqlite")))
+        entry = self.cache.get(path)
+        assert entry["hash"] == "0" * 40
+        assert entry["average_hash"] is None
+
+    def test_load_hash_only_entry_is_completed(self):
+        path = PhotospherePath(os.path.join(self.folder, "test.txt"))
+        with open(path.get_string(), "w") as f:
+            f.write("photosphere")
+        hash = cached_file_hash(path, self.cache)
+        ps = load_photosphere_file(path, self.cache)
+        assert type(ps) is PhotosphereFile
+        assert ps.get_hash() == hash
+        assert self.cache.get(path)["file_type"] == "FILE"
+
+    def test_load_not_allowed_extension(self):
+        path = PhotospherePath(os.path.join(self.folder, "test.bin"))
+        with open(path.get_string(), "w") as f:
+            f.write("photosphere")
+        assert load_photosphere_file(path, self.cache) is None
+
+    def test_load_without_average_hash_is_completed_later(self):
+        source = os.path.abspath(
+            os.path.join(
+                self.current_dir, '../../resources/original_images/Car_moving.jpg'
+            )
+        )
+        path = PhotospherePath(os.path.join(self.folder, "Car_moving.jpg"))
+        shutil.copy2(source, path.get_string())
+        ps = load_photosphere_file(path, self.cache, with_average_hash=False)
+        assert ps.pilImage is None
+        assert self.cache.get(path)["created_at"] == '2014-10-20T17:18:53'
+        assert self.cache.get(path)["average_hash"] is None
+        ps = load_photosphere_file(path, self.cache)
+        assert self.cache.get(path)["average_hash"] == ps.get_average_hash()
+
+    def test_hash_of_another_algorithm_is_not_reused(self):
+        path = PhotospherePath(os.path.join(self.folder, "test.txt"))
+        with open(path.get_string(), "w") as f:
+            f.write("photosphere")
+        cached_file_hash(path, self.cache)
+        assert self.cache.get(path) is not None
+        assert self.cache.get(path, "xxh3_128") is None
+        with mock.patch("src.local.file_cache.file_hash", return_value="other") as file_hash:
+            assert cached_file_hash(path, self.cache, "xxh3_128") == "other"
+            file_hash.assert_called_once_with(path, "xxh3_128")
+        assert self.cache.get(path, "xxh3_128")["hash"] == "other"
+
+    def test_cache_without_hash_algorithm_is_sha1(self):
+        path = PhotospherePath(os.path.join(self.folder, "test.txt"))
+        with open(path.get_string(), "w") as f:
+            f.write("photosphere")
+        stat = os.stat(path.get_string())
+        old_path = os.path.join(self.folder, "old_cache.sqlite")
+        connection = sqlite3.connect(old_path)
+        connection.execute(
+            "CREATE TABLE file_cache (path TEXT PRIMARY KEY, inode INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, hash TEXT NOT NULL, file_type TEXT, average_hash TEXT, created_at TEXT, "
+            "latitude REAL, longitude REAL)"
+        )
+        connection.execute(
+            "INSERT INTO file_cache VALUES (?, ?, ?, ?, 'old', NULL, NULL, NULL, NULL, NULL)",
+            (path.get_string(), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        )
+        connection.commit()
+        connection.close()
+        cache = FileStatCache(PhotospherePath(old_path))
+        try:
+            assert cache.get(path, "sha1")["hash"] == "old"
+            assert cache.get(path, "blake3") is None
+        finally:
+            cache.close()
+
+    def test_cache_next_to_the_database(self):
+        database = PhotospherePath(os.path.join(self.folder, "db", "local_database.json"))
+        assert get_file_cache_path(database).get_string() == os.path.join(self.folder, "db", FILE_CACHE_FILE)
+        source = os.path.join(self.folder, "source")
+        os.makedirs(source)
+        with open(os.path.join(source, "test.txt"), "w") as f:
+            f.write("photosphere")
+        destination = os.path.join(self.folder, "organized")
+        organize_all_files(PhotospherePath(source), PhotospherePath(destination))
+        assert os.path.exists(os.path.join(destination, FILE_CACHE_FILE))
+        assert not os.path.exists(FILE_CACHE_FILE)
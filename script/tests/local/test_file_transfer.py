@@ -0,0 +1,131 @@
+import errno
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from src.file.path import PhotospherePath
+from src.local.file_cache import FILE_CACHE_FILE
+from src.local.file_transfer import transfer_file, COPY_MODE, MOVE_MODE, HARDLINK_MODE, REFLINK_MODE, EXISTING
+from src.local.local_folders_name import RESULT_FOLDER, SKIPPED_FOLDER, NO_DATETIME_FOLDER
+from src.local.organize_files import organize_all_files
+
+IMAGES_FOLDER = os.path.join(os.path.dirname(__file__), '../../resources/original_images')
+
+
+class TestFileTransfer(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.source = self._write("source/IMG_0001.jpg", b"camera a")
+        self.destination = PhotospherePath(os.path.join(self.folder, "destination"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, name: str, content: bytes) -> PhotospherePath:
+        path = os.path.join(self.folder, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(content)
+        return PhotospherePath(path)
+
+    @staticmethod
+    def _read(path: PhotospherePath) -> bytes:
+        with open(path.get_string(), "rb") as f:
+            return f.read()
+
+    def test_modes(self):
+        for mode in (COPY_MODE, HARDLINK_MODE, REFLINK_MODE):
+            new_path, used_mode = transfer_file(self.source, self.destination.join(mode), mode)
+            assert self._read(new_path) == b"camera a"
+            assert self.source.exists()
+            if mode == HARDLINK_MODE:
+                assert used_mode == HARDLINK_MODE
+                assert os.path.samefile(new_path.get_string(), self.source.get_string())
+            elif mode == COPY_MODE:
+                assert used_mode == COPY_MODE
+                assert not os.path.samefile(new_path.get_string(), self.source.get_string())
+            else:
+                # copy on filesystems without reflinks
+                assert used_mode in (REFLINK_MODE, COPY_MODE)
+        new_path, used_mode = transfer_file(self.source, self.destination, MOVE_MODE)
+        assert used_mode == MOVE_MODE
+        assert self._read(new_path) == b"camera a"
+        assert not self.source.exists()
+
+    def test_copy_keeps_modification_time(self):
+        os.utime(self.source.get_string(), (1000000000, 1000000000))
+        new_path, _ = transfer_file(self.source, self.destination, COPY_MODE)
+        assert os.stat(new_path.get_string()).st_mtime == 1000000000
+
+    def test_fallback_to_copy_on_another_filesystem(self):
+        cross_device = OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        with mock.patch('src.local.file_transfer.os.link', side_effect=cross_device):
+            new_path, used_mode = transfer_file(self.source, self.destination, HARDLINK_MODE)
+            assert used_mode == COPY_MODE
+            assert self._read(new_path) == b"camera a"
+            moved_path, used_mode = transfer_file(
+                self._write("source/IMG_0002.jpg", b"b"), self.destination, MOVE_MODE
+            )
+            assert used_mode == MOVE_MODE
+            assert self._read(moved_path) == b"b"
+            assert not os.path.exists(os.path.join(self.folder, "source/IMG_0002.jpg"))
+
+    def test_other_errors_are_raised(self):
+        with mock.patch('src.local.file_transfer.os.link', side_effect=PermissionError(errno.EACCES, "denied")):
+            with self.assertRaises(PermissionError):
+                transfer_file(self.source, self.destination, HARDLINK_MODE)
+
+    def test_name_collisions(self):
+        same_name = self._write("other_camera/IMG_0001.jpg", b"camera b")
+        first, _ = transfer_file(self.source, self.destination, COPY_MODE)
+        second, _ = transfer_file(same_name, self.destination, HARDLINK_MODE)
+        assert first.get_basename() == "IMG_0001.jpg"
+        assert second.get_basename() == "IMG_0001_1.jpg"
+        assert self._read(first) == b"camera a" and self._read(second) == b"camera b"
+        # again: the files are already there
+        for path in (self.source, same_name):
+            for mode in (COPY_MODE, HARDLINK_MODE, REFLINK_MODE):
+                _, used_mode = transfer_file(path, self.destination, mode)
+                assert used_mode == EXISTING
+        assert sorted(os.listdir(self.destination.get_string())) == ["IMG_0001.jpg", "IMG_0001_1.jpg"]
+        # a third camera
+        third, _ = transfer_file(self._write("third/IMG_0001.jpg", b"camera c"), self.destination, MOVE_MODE)
+        assert third.get_basename() == "IMG_0001_2.jpg"
+        # move of a file already there removes the source
+        existing, used_mode = transfer_file(same_name, self.destination, MOVE_MODE)
+        assert used_mode == EXISTING and existing.get_string() == second.get_string()
+        assert not same_name.exists() and second.exists()
+
+    def test_organize_modes(self):
+        source = os.path.join(self.folder, "photos")
+        os.makedirs(os.path.join(source, "camera_b"))
+        for name in ("Hurricane.r4118.arp.jpg", "Car_moving.jpg"):
+            shutil.copy(os.path.join(IMAGES_FOLDER, name), os.path.join(source, name))
+        # same name, different photo
+        shutil.copy(os.path.join(IMAGES_FOLDER, "Bubo_blakistoni.jpg"), os.path.join(source, "camera_b", "Car_moving.jpg"))
+        with open(os.path.join(source, "notes.txt"), "w") as f:
+            f.write("notes")
+        expected = sorted(self._read(PhotospherePath(os.path.join(root, file)))
+                          for root, _, names in os.walk(source) for file in names)
+        previous_cwd = os.getcwd()
+        os.chdir(self.folder)
+        try:
+            for mode in (HARDLINK_MODE, COPY_MODE, MOVE_MODE):
+                destination = os.path.join(self.folder, f"organized_{mode}")
+                counts = organize_all_files(PhotospherePath(source), PhotospherePath(destination), mode)
+                assert counts == {mode: 4}
+                files = [
+                    os.path.relpath(os.path.join(root, file), destination)
+                    for root, _, names in os.walk(destination) for file in names
+                    if not file.startswith(FILE_CACHE_FILE)
+                ]
+                assert os.path.join(SKIPPED_FOLDER, "notes.txt") in files
+                assert all(file.startswith((RESULT_FOLDER, NO_DATETIME_FOLDER, SKIPPED_FOLDER)) for file in files)
+                # nothing overwritten
+                assert sorted(self._read(PhotospherePath(os.path.join(destination, file))) for file in files) == expected
+        finally:
+            os.chdir(previous_cwd)
+        # moved: nothing left in the source
+        assert not any(names for _, _, names in os.walk(source))
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from src.database.photosphere_database import HASH_ALGORITHM_KEY
+from src.database.utils import open_database, DATABASE_BACKENDS, TINYDB_BACKEND
+from src.file.path import PhotospherePath
+from src.local.generate_local_database import resolve_hash_algorithm
+
+
+class TestGenerateLocalDatabase(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _json_path(self, backend: str) -> PhotospherePath:
+        return PhotospherePath(os.path.join(self.folder, f"{backend}.json"))
+
+    def test_new_database_records_the_algorithm(self):
+        for backend in DATABASE_BACKENDS:
+            db = open_database(self._json_path(backend), backend)
+            assert resolve_hash_algorithm(db) == "sha1"
+            db.close()
+            db = open_database(self._json_path(backend), backend)
+            assert db.get_metadata(HASH_ALGORITHM_KEY) == "sha1"
+            db.close()
+
+    def test_other_algorithm_is_refused(self):
+        for backend in DATABASE_BACKENDS:
+            db = open_database(self._json_path(backend), backend)
+            resolve_hash_algorithm(db, "sha1")
+            db.close()
+            db = open_database(self._json_path(backend), backend)
+            # the database keeps its algorithm
+            assert resolve_hash_algorithm(db) == "sha1"
+            with self.assertRaises(ValueError):
+                resolve_hash_algorithm(db, "xxh3_128")
+            assert db.get_metadata(HASH_ALGORITHM_KEY) == "sha1"
+            db.close()
+
+    def test_database_without_algorithm_is_sha1(self):
+        db = open_database(self._json_path(TINYDB_BACKEND), TINYDB_BACKEND)
+        db.insert({"hash": "0" * 40})
+        with self.assertRaises(ValueError):
+            resolve_hash_algorithm(db, "blake3")
+        assert resolve_hash_algorithm(db) == "sha1"
+        db.close()
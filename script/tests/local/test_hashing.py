@@ -0,0 +1,97 @@
+import hashlib
+import importlib.util
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock, skipUnless
+
+from src.file.path import PhotospherePath
+from src.local.hashing import hash_file, quick_hash, is_same_content, new_hash, check_hash_algorithm, \
+    SHA1_ALGORITHM, BLAKE3_ALGORITHM, XXH3_ALGORITHM, READ_BUFFER_SIZE, QUICK_HASH_SAMPLE_SIZE
+
+HAS_BLAKE3 = importlib.util.find_spec("blake3") is not None
+HAS_XXHASH = importlib.util.find_spec("xxhash") is not None
+
+
+class TestHashing(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _write(self, name: str, content: bytes) -> PhotospherePath:
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return PhotospherePath(path)
+
+    def test_sha1_of_every_read_path(self):
+        contents = [b"", b"a", os.urandom(READ_BUFFER_SIZE), os.urandom(READ_BUFFER_SIZE * 2 + 7)]
+        for index, content in enumerate(contents):
+            path = self._write(f"{index}.bin", content)
+            expected = hashlib.sha1(content).hexdigest()
+            assert hash_file(path) == expected
+            assert hash_file(path, buffer_size=1000) == expected
+            # memory mapped
+            with mock.patch("src.local.hashing.MMAP_MIN_SIZE", 1):
+                assert hash_file(path) == expected
+                # a file that can't be mapped is read
+                with mock.patch("src.local.hashing.mmap.mmap", side_effect=OSError("no mmap")):
+                    assert hash_file(path) == expected
+
+    def test_unknown_algorithm(self):
+        with self.assertRaises(ValueError):
+            new_hash("md4")
+
+    @skipUnless(not HAS_BLAKE3, "blake3 is installed")
+    def test_missing_package(self):
+        with self.assertRaisesRegex(ValueError, "pip install blake3"):
+            check_hash_algorithm(BLAKE3_ALGORITHM)
+
+    @skipUnless(HAS_BLAKE3, "needs blake3")
+    def test_blake3(self):
+        from blake3 import blake3
+        content = os.urandom(3 * READ_BUFFER_SIZE + 1)
+        path = self._write("file.bin", content)
+        assert hash_file(path, BLAKE3_ALGORITHM) == blake3(content).hexdigest()
+        with mock.patch("src.local.hashing.MMAP_MIN_SIZE", 1):
+            assert hash_file(path, BLAKE3_ALGORITHM) == blake3(content).hexdigest()
+
+    @skipUnless(HAS_XXHASH, "needs xxhash")
+    def test_xxh3(self):
+        from xxhash import xxh3_128
+        content = os.urandom(3 * READ_BUFFER_SIZE + 1)
+        path = self._write("file.bin", content)
+        assert hash_file(path, XXH3_ALGORITHM) == xxh3_128(content).hexdigest()
+        with mock.patch("src.local.hashing.MMAP_MIN_SIZE", 1):
+            assert hash_file(path, XXH3_ALGORITHM) == xxh3_128(content).hexdigest()
+
+    def test_quick_hash(self):
+        head, tail = os.urandom(QUICK_HASH_SAMPLE_SIZE), os.urandom(QUICK_HASH_SAMPLE_SIZE)
+        first = self._write("first.bin", head + b"a" * 1000 + tail)
+        # only the middle is different
+        second = self._write("second.bin", head + b"b" * 1000 + tail)
+        longer = self._write("longer.bin", head + b"a" * 1001 + tail)
+        small = self._write("small.bin", b"small")
+        assert quick_hash(first) == quick_hash(second)
+        assert quick_hash(first) != quick_hash(longer)
+        assert quick_hash(small) == quick_hash(self._write("small_copy.bin", b"small"))
+        assert quick_hash(small) != quick_hash(self._write("other.bin", b"smalL"))
+        assert quick_hash(first, SHA1_ALGORITHM) == quick_hash(first)
+
+    def test_is_same_content(self):
+        content = os.urandom(3 * QUICK_HASH_SAMPLE_SIZE)
+        first = self._write("first.bin", content)
+        copy = self._write("copy.bin", content)
+        middle = bytearray(content)
+        middle[len(content) // 2] ^= 1
+        changed = self._write("changed.bin", bytes(middle))
+        assert is_same_content(first, first)
+        assert is_same_content(first, copy)
+        assert not is_same_content(first, changed)
+        # different quick hashes: no full hash
+        with mock.patch("src.local.hashing.hash_file") as full_hash:
+            assert not is_same_content(first, self._write("other.bin", os.urandom(len(content))))
+            full_hash.assert_not_called()
@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+from itertools import islice
+from pathlib import Path
+from unittest import TestCase, mock
+
+from src.file.path import PhotospherePath
+from src.local.scanner import FileScanner, scan_files
+from src.local.utils import loop_on_files_in_folder_decorator, list_files_in_folder
+
+
+def _walk(folder: str) -> list[str]:
+    return [os.path.join(root, file) for root, dirs, files in os.walk(folder) for file in files]
+
+
+class TestScanner(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        for directory in range(5):
+            for subdirectory in range(3):
+                path = os.path.join(self.folder, f"d{directory}", f"s{subdirectory}")
+                os.makedirs(path)
+                for index, extension in enumerate((".jpg", ".JPG", ".txt", ".xmp", "")):
+                    with open(os.path.join(path, f"f{index}{extension}"), "w") as f:
+                        f.write("x" * index)
+        with open(os.path.join(self.folder, "top.mp4"), "w") as f:
+            f.write("top")
+        # a hidden file without extension, like PhotospherePath(".jpg").is_allowed_extension
+        with open(os.path.join(self.folder, ".jpg"), "w") as f:
+            f.write("hidden")
+        self.outside = tempfile.mkdtemp()
+        with open(os.path.join(self.outside, "linked.jpg"), "w") as f:
+            f.write("linked")
+        os.symlink(self.outside, os.path.join(self.folder, "link_to_folder"))
+        os.symlink(os.path.join(self.outside, "linked.jpg"), os.path.join(self.folder, "link_to_file.jpg"))
+        os.symlink(os.path.join(self.outside, "missing.jpg"), os.path.join(self.folder, "broken.jpg"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        shutil.rmtree(self.outside)
+
+    def test_same_files_and_order_of_os_walk(self):
+        expected = [path for path in _walk(self.folder) if not path.endswith("broken.jpg")]
+        for workers in (1, 4):
+            scanned = list(scan_files(PhotospherePath(self.folder), workers=workers))
+            assert [scanned_file.path for scanned_file in scanned] == expected
+            for scanned_file in scanned:
+                stat = os.stat(scanned_file.path)
+                assert (scanned_file.st_size, scanned_file.st_mtime_ns, scanned_file.st_ino) == \
+                       (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                assert scanned_file.name == os.path.basename(scanned_file.path)
+
+    def test_extensions(self):
+        extensions = {".jpg", ".mp4"}
+        expected = [
+            path for path in _walk(self.folder)
+            if PhotospherePath(path).is_allowed_extension(extensions) and not path.endswith("broken.jpg")
+        ]
+        scanner = FileScanner(PhotospherePath(self.folder), extensions)
+        assert [scanned_file.path for scanned_file in scanner] == expected
+        assert scanner.found == len(expected) == 32
+        assert [path.get_string() for path in list_files_in_folder(PhotospherePath(self.folder), extensions)] == expected
+
+    def test_stop_early(self):
+        files = scan_files(PhotospherePath(self.folder), workers=2)
+        assert len(list(islice(files, 3))) == 3
+        files.close()
+
+    def test_read_ahead_is_bounded(self):
+        scanner = FileScanner(PhotospherePath(self.folder), workers=4, read_ahead=2)
+        with mock.patch.object(scanner, '_scan_directory', wraps=scanner._scan_directory) as scan_directory:
+            files = iter(scanner)
+            # the 3 files of the root, then the first one of d0/s0
+            assert len(list(islice(files, 4))) == 4
+            # the root, d0 and d1 listed ahead, then d0/s0 (d1 is still waiting to be yielded)
+            assert scan_directory.call_count == 4
+            rest = list(files)
+        # every directory listed once: the root, 5 directories and 15 subdirectories
+        assert scan_directory.call_count == 21
+        assert len(rest) == 74
+
+    def test_scanned_stat_is_reused(self):
+        scanned = next(scan_files(PhotospherePath(self.folder)))
+        with mock.patch.object(Path, 'stat', side_effect=AssertionError("stat read again")):
+            assert scanned.get_path().get_stat().st_mtime_ns == scanned.st_mtime_ns
+
+    def test_missing_folder(self):
+        assert list(scan_files(PhotospherePath(os.path.join(self.folder, "missing")))) == []
+
+    def test_decorator(self):
+        found = []
+
+        @loop_on_files_in_folder_decorator(extensions={".txt"})
+        def only_text(file_path: PhotospherePath, suffix: str):
+            found.append(file_path.get_string() + suffix)
+
+        @loop_on_files_in_folder_decorator
+        def every_file(file_path: PhotospherePath):
+            found.append(file_path.get_string())
+
+        only_text(PhotospherePath(self.folder), "!")
+        assert found == [path + "!" for path in _walk(self.folder) if path.endswith(".txt")]
+        found.clear()
+        every_file(PhotospherePath(self.folder))
+        # 75 files, top.mp4, .jpg and the link to a file
+        assert len(found) == 78
@@ -0,0 +1,125 @@
+import os
+import random
+import shutil
+import tempfile
+from unittest import TestCase
+
+from google.protobuf.internal.decoder import _DecodeVarint32
+
+from src.file.path import PhotospherePath
+from src.protobuf.converter import create_protobuf_file_list, read_protobuf_file_list, _varint_bytes, \
+    create_compact_file_list, read_compact_file_list, pack_geohash, unpack_geohash
+from src.protobuf.dist import photosphere_file_pb2
+from tests.synthetic_library import photo_record
+
+
+def _expected_bytes(files: list[dict]) -> bytes:
+    result = b''
+    for file in sorted(files, key=lambda x: x.get('created_at_timestamp') or 0, reverse=True):
+        message = photosphere_file_pb2.PhotosphereFile(
+            source_bucket_uri=file["source_bucket_uri"],
+            file_type=file["file_type"],
+            created_at_timestamp=file["created_at_timestamp"],
+            geohash=file["geohash"],
+            hash=file["hash"]
+        ).SerializeToString()
+        result += _varint_bytes(len(message)) + message
+    return result
+
+
+class TestConverter(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.out = PhotospherePath(os.path.join(self.folder, "out.pb"))
+        random.seed(1)
+        # few distinct timestamps, so the stability of the sort is checked too
+        self.files = [
+            photo_record(
+                i,
+                created_at_timestamp=random.choice([None, -86400, 1500000000, 1600000000, 1700000000]),
+                file_type=random.choice(["FILE", "IMAGE", "VIDEO"]),
+                geohash=random.choice([None, "u0nd9hdfq"])
+            )
+            for i in range(1000)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _read(self) -> bytes:
+        with open(self.out.get_string(), 'rb') as f:
+            return f.read()
+
+    def test_varint_bytes(self):
+        for value in [0, 1, 127, 128, 300, 2 ** 31]:
+            encoded = _varint_bytes(value)
+            assert _DecodeVarint32(encoded, 0) == (value, len(encoded))
+
+    def test_in_memory_sort(self):
+        assert create_protobuf_file_list(self.files, self.out) == 1000
+        assert self._read() == _expected_bytes(self.files)
+
+    def test_external_merge_sort(self):
+        assert create_protobuf_file_list(iter(self.files), self.out, chunk_size=64) == 1000
+        assert self._read() == _expected_bytes(self.files)
+
+    def test_empty(self):
+        assert create_protobuf_file_list([], self.out) == 0
+        assert self._read() == b''
+
+    def test_renditions(self):
+        renditions = [
+            {"name": "grid", "size": 320, "uri": "gs://bucket/renditions/photo.jpg.h.grid.webp"},
+            {"name": "preview", "size": 1280, "uri": "gs://bucket/renditions/photo.jpg.h.preview.webp"},
+        ]
+        files = [
+            photo_record(0, created_at_timestamp=1600000000, renditions=renditions),
+            photo_record(1, created_at_timestamp=1500000000, renditions=None)
+        ]
+        assert create_protobuf_file_list(files, self.out) == 2
+        messages = list(read_protobuf_file_list(self.out))
+        assert [(rendition.size, rendition.uri) for rendition in messages[0].renditions] == [
+            (320, "gs://bucket/renditions/photo.jpg.h.grid.webp"),
+            (1280, "gs://bucket/renditions/photo.jpg.h.preview.webp")
+        ]
+        assert len(messages[1].renditions) == 0
+
+    def _compact_round_trip(self, files: list[dict], chunk_size: int = 64) -> list:
+        v1 = PhotospherePath(os.path.join(self.folder, "v1.pb"))
+        assert create_compact_file_list(iter(files), self.out, chunk_size=chunk_size) == len(files)
+        create_protobuf_file_list(files, v1)
+        messages = list(read_compact_file_list(self.out))
+        assert messages == list(read_protobuf_file_list(v1))
+        assert os.path.getsize(self.out.get_string()) < os.path.getsize(v1.get_string()) or not files
+        return messages
+
+    def test_compact_round_trip(self):
+        self._compact_round_trip(self.files)
+
+    def test_compact_renditions_and_missing_values(self):
+        renditions = [
+            {"name": "grid", "size": 320, "uri": "gs://bucket/renditions/photo.jpg.h.grid.webp"},
+            {"name": "preview", "size": 1280, "uri": "gs://bucket/renditions/photo.jpg.h.preview.webp"},
+        ]
+        files = [
+            photo_record(0, created_at_timestamp=1600000000, renditions=renditions, geohash="u0nd9hdfq"),
+            photo_record(1, created_at_timestamp=None, source_bucket_uri=None, hash=None, file_type=None),
+            photo_record(2, created_at_timestamp=-86400, source_bucket_uri="photo.jpg", geohash="s"),
+        ]
+        messages = self._compact_round_trip(files)
+        assert messages[0].renditions[1].uri == "gs://bucket/renditions/photo.jpg.h.preview.webp"
+        assert [message.created_at_timestamp for message in messages] == [1600000000, 0, -86400]
+
+    def test_compact_empty(self):
+        assert self._compact_round_trip([]) == []
+
+    def test_not_a_compact_catalogue(self):
+        create_protobuf_file_list(self.files, self.out)
+        with self.assertRaises(ValueError):
+            next(read_compact_file_list(self.out))
+
+    def test_pack_geohash(self):
+        for geohash in ["", "0", "zzzzzzzzzzzz", "u0nd9hdfq", "00000"]:
+            assert unpack_geohash(pack_geohash(geohash)) == geohash
+        assert pack_geohash("u0nd9hdfq") < 2 ** 46
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+from unittest import TestCase
+
+from src.file.path import PhotospherePath
+from src.protobuf.converter import read_protobuf_file_list
+from src.protobuf.shards import create_protobuf_shards, read_shard_index, get_shard_name, UNDATED_SHARD
+from tests.synthetic_library import photo_record
+
+
+class TestShards(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.out = PhotospherePath(os.path.join(self.folder, "shards"))
+        random.seed(2)
+        # from 2019-01 to 2023-12, some files without date
+        self.files = [
+            photo_record(i, created_at_timestamp=None if i % 50 == 0 else random.randint(1546300800, 1703980800))
+            for i in range(2000)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def _read_shard(self, shard: dict) -> list:
+        return list(read_protobuf_file_list(self.out.join(shard["file"])))
+
+    def test_round_trip(self):
+        index = create_protobuf_shards(self.files, self.out, chunk_size=128)
+        assert index == read_shard_index(self.out)
+        assert index["count"] == len(self.files)
+        hashes = []
+        for shard in index["shards"]:
+            messages = self._read_shard(shard)
+            timestamps = [message.created_at_timestamp for message in messages]
+            assert timestamps == sorted(timestamps, reverse=True)
+            assert {get_shard_name(timestamp) for timestamp in timestamps} == {shard["name"]}
+            assert shard["count"] == len(messages)
+            assert shard["min_created_at_timestamp"] == timestamps[-1]
+            assert shard["max_created_at_timestamp"] == timestamps[0]
+            with open(self.out.join(shard["file"]).get_string(), 'rb') as f:
+                content = f.read()
+            assert shard["size"] == len(content)
+            assert shard["sha1"] == hashlib.sha1(content).hexdigest()
+            hashes.extend(message.hash for message in messages)
+        assert sorted(hashes) == sorted(file["hash"] for file in self.files)
+
+    def test_shards_are_months_newest_first(self):
+        index = create_protobuf_shards(self.files, self.out)
+        names = [shard["name"] for shard in index["shards"]]
+        assert names[-1] == UNDATED_SHARD
+        assert names[:-1] == sorted(names[:-1], reverse=True)
+        assert len(names[:-1]) == 60
+        assert index["shards"][-1]["count"] == 40
+
+    def test_unchanged_months_keep_their_file(self):
+        first = create_protobuf_shards(self.files, self.out)
+        # a new file in 2023-12
+        second = create_protobuf_shards(self.files + [photo_record(5000, created_at_timestamp=1703980000)], self.out)
+        changed = [
+            shard["name"] for shard, previous in zip(second["shards"], first["shards"])
+            if shard["file"] != previous["file"]
+        ]
+        assert changed == ["2023-12"]
+        files = {file_name for file_name in os.listdir(self.out.get_string()) if file_name.endswith('.pb')}
+        assert files == {shard["file"] for shard in second["shards"]}
+
+    def test_empty(self):
+        index = create_protobuf_shards([], self.out)
+        assert index["count"] == 0
+        assert index["shards"] == []
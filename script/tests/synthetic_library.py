@@ -0,0 +1,290 @@
+"""
+Synthetic photo library for the benchmarks, every file has a different content:
+ - JPEG photos with a random EXIF date and GPS position (a few encoded templates, the EXIF segment is written for
+   every file, so creating a large library doesn't encode a JPEG per file)
+ - PNG images with alpha and a random EXIF date (eXIf chunk), without GPS position
+ - short MP4 videos made by ffmpeg with a creation time, skipped when ffmpeg is not installed
+in folders of FILES_PER_FOLDER files, about 120 KiB per file. The same seed creates the same library.
+
+Run from the script folder:
+    python -m tests.synthetic_library folder [files] [seed]
+"""
+import io
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+
+from PIL import Image, TiffImagePlugin
+
+from src.file.image.exif import DATE_TIME_TAG, EXIF_IFD_TAG, GPS_IFD_TAG, DATE_TIME_ORIGINAL_TAG
+
+FILES_PER_FOLDER = 500
+# out of 100 files
+PNG_PER_100 = 15
+VIDEO_PER_100 = 5
+JPEG_SIZES = [(1600, 1200), (1200, 1600), (2048, 1536), (1024, 768)]
+PNG_SIZES = [(320, 320), (400, 300)]
+VIDEO_SECONDS = 1
+FIRST_DATE = datetime(2005, 1, 1)
+DATES_DAYS = 20 * 365
+GPS_LATITUDE_TAG = 2
+GPS_LATITUDE_REF_TAG = 1
+GPS_LONGITUDE_TAG = 4
+GPS_LONGITUDE_REF_TAG = 3
+EXIF_HEADER = b"Exif\x00\x00"
+
+
+def _noise_image(size: tuple[int, int], mode: str, rng: random.Random) -> Image.Image:
+    """
+    A smooth random image (a small noise scaled up), compressed like a photo and not like a flat color
+    """
+    small = Image.frombytes(mode, (16, 12), rng.randbytes(16 * 12 * len(mode)))
+    return small.resize(size, Image.Resampling.BICUBIC)
+
+
+def _jpeg_templates(rng: random.Random) -> list[bytes]:
+    templates = []
+    for size in JPEG_SIZES:
+        buffer = io.BytesIO()
+        _noise_image(size, "RGB", rng).save(buffer, "JPEG", quality=85)
+        templates.append(buffer.getvalue())
+    return templates
+
+
+def _png_templates(rng: random.Random) -> list[bytes]:
+    templates = []
+    for size in PNG_SIZES:
+        buffer = io.BytesIO()
+        _noise_image(size, "RGBA", rng).save(buffer, "PNG")
+        templates.append(buffer.getvalue())
+    return templates
+
+
+def _video_templates(folder: str) -> list[bytes]:
+    """
+    :return: an empty list when ffmpeg is not installed
+    """
+    if shutil.which("ffmpeg") is None:
+        return []
+    templates = []
+    for index, pattern in enumerate(("testsrc", "testsrc2", "smptebars")):
+        path = os.path.join(folder, f"template_{index}.mp4")
+        subprocess.run(
+            [
+                "ffmpeg", "-v", "error", "-y",
+                "-f", "lavfi", "-i", f"{pattern}=duration={VIDEO_SECONDS}:size=320x240:rate=15",
+                "-c:v", "libx264", "-pix_fmt", "yuv420p",
+                "-metadata", f"creation_time={(FIRST_DATE + timedelta(days=index)).isoformat()}Z",
+                path
+            ],
+            check=True
+        )
+        with open(path, "rb") as f:
+            templates.append(f.read())
+    return templates
+
+
+def _random_date(rng: random.Random) -> str:
+    date = FIRST_DATE + timedelta(seconds=rng.randrange(DATES_DAYS * 24 * 3600))
+    return date.strftime("%Y:%m:%d %H:%M:%S")
+
+
+def _dms(value: float) -> tuple:
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round((value - degrees - minutes / 60) * 3600, 2)
+    return (
+        TiffImagePlugin.IFDRational(degrees),
+        TiffImagePlugin.IFDRational(minutes),
+        TiffImagePlugin.IFDRational(int(seconds * 100), 100)
+    )
+
+
+def exif_bytes(rng: random.Random, gps: bool = True) -> bytes:
+    """
+    :return: the EXIF data with a random date and, if gps, a random position, starting with the Exif header
+    """
+    exif = Image.Exif()
+    date = _random_date(rng)
+    exif[DATE_TIME_TAG] = date
+    exif.get_ifd(EXIF_IFD_TAG)[DATE_TIME_ORIGINAL_TAG] = date
+    if gps:
+        latitude = rng.uniform(-80, 80)
+        longitude = rng.uniform(-180, 180)
+        gps_ifd = exif.get_ifd(GPS_IFD_TAG)
+        gps_ifd[GPS_LATITUDE_REF_TAG] = "N" if latitude >= 0 else "S"
+        gps_ifd[GPS_LATITUDE_TAG] = _dms(abs(latitude))
+        gps_ifd[GPS_LONGITUDE_REF_TAG] = "E" if longitude >= 0 else "W"
+        gps_ifd[GPS_LONGITUDE_TAG] = _dms(abs(longitude))
+    return exif.tobytes()
+
+
+def jpeg_with_exif(template: bytes, exif: bytes) -> bytes:
+    """
+    :return: the JPEG with an APP1 segment with the exif right after the start of image marker
+    """
+    return template[:2] + b"\xff\xe1" + (len(exif) + 2).to_bytes(2, "big") + exif + template[2:]
+
+
+def png_with_exif(template: bytes, exif: bytes) -> bytes:
+    """
+    :return: the PNG with an eXIf chunk right after the IHDR chunk (8 bytes of signature and 25 of IHDR)
+    """
+    data = exif.removeprefix(EXIF_HEADER)
+    chunk = len(data).to_bytes(4, "big") + b"eXIf" + data + zlib.crc32(b"eXIf" + data).to_bytes(4, "big")
+    return template[:33] + chunk + template[33:]
+
+
+def mp4_with_padding(template: bytes, rng: random.Random) -> bytes:
+    """
+    :return: the MP4 with a free box of random bytes at the end, ignored by the players
+    """
+    payload = rng.randbytes(16)
+    return template + (len(payload) + 8).to_bytes(4, "big") + b"free" + payload
+
+
+def _append_ifd(data: bytearray, entries: list[tuple[int, int, tuple | bytes]]) -> int:
+    """
+    Appends a little endian IFD to data, with its values larger than 4 bytes before it.
+    :param entries: (tag, TIFF type, values) with the values of SHORT (3) and LONG (4) as a tuple of int and the
+        ones of ASCII (2) and UNDEFINED (7) as bytes
+    :return: the offset of the IFD
+    """
+    fields = []
+    for tag, tiff_type, values in sorted(entries):
+        payload = values if isinstance(values, bytes) else struct.pack(
+            '<' + {3: 'H', 4: 'L'}[tiff_type] * len(values), *values
+        )
+        count = len(values)
+        if len(payload) > 4:
+            offset = len(data)
+            data += payload + b'\x00' * (len(payload) % 2)
+            payload = struct.pack('<L', offset)
+        fields.append(struct.pack('<HHL', tag, tiff_type, count) + payload.ljust(4, b'\x00'))
+    offset = len(data)
+    data += struct.pack('<H', len(fields)) + b''.join(fields) + struct.pack('<L', 0)
+    return offset
+
+
+def raw_with_previews(
+        previews: list[bytes],
+        size: tuple[int, int],
+        orientation: int = 1,
+        date: str = "2021:06:01 10:00:00"
+    ) -> bytes:
+    """
+    :return: a TIFF based RAW file like a DNG: IFD0 with the first JPEG preview (JPEGInterchangeFormat), the
+        orientation and the date, and sub IFDs with the other previews (JPEG strips) and the raw data of the size
+    """
+    data = bytearray(b'II*\x00\x00\x00\x00\x00')
+    positions = []
+    for preview in previews:
+        positions.append(len(data))
+        data += preview
+    raw_position = len(data)
+    data += bytes(64)
+    sub_ifds = [
+        _append_ifd(data, [(0x00FE, 4, (1,)), (0x0103, 3, (7,)), (0x0111, 4, (position,)), (0x0117, 4, (len(preview),))])
+        for position, preview in zip(positions[1:], previews[1:])
+    ]
+    sub_ifds.append(_append_ifd(data, [
+        (0x00FE, 4, (0,)), (0x0100, 4, (size[0],)), (0x0101, 4, (size[1],)), (0x0103, 3, (1,)),
+        (0x0111, 4, (raw_position,)), (0x0117, 4, (64,))
+    ]))
+    ifd0 = [(0x00FE, 4, (1,)), (0x0112, 3, (orientation,)), (0x0132, 2, date.encode() + b'\x00'),
+            (0x014A, 4, tuple(sub_ifds))]
+    if previews:
+        ifd0 += [(0x0201, 4, (positions[0],)), (0x0202, 4, (len(previews[0]),))]
+    struct.pack_into('<L', data, 4, _append_ifd(data, ifd0))
+    return bytes(data)
+
+
+def jpeg_with_mpf_preview(image: bytes, preview: bytes) -> bytes:
+    """
+    :return: the JPEG with an APP2 multi-picture format segment right after the start of image marker, indexing
+        the preview appended after the image, like the large previews of the camera JPEGs
+    """
+    # the offsets are relative to the TIFF header, after the marker, the length and MPF\0
+    base = 2 + 4 + 4
+    segment = bytearray(b'II*\x00\x08\x00\x00\x00')
+    entries_size = 2 * 16
+    # the entries are after the IFD of 3 fields
+    entries_offset = 8 + 2 + 3 * 12 + 4
+    preview_position = 2 + 4 + 4 + entries_offset + entries_size + len(image) - 2
+    entries = struct.pack('<LLLHH', 0x030000, len(image), 0, 0, 0)
+    entries += struct.pack('<LLLHH', 0x010002, len(preview), preview_position - base, 0, 0)
+    segment += struct.pack('<H', 3)
+    segment += struct.pack('<HHL', 0xB000, 7, 4) + b'0100'
+    segment += struct.pack('<HHLL', 0xB001, 4, 1, 2)
+    segment += struct.pack('<HHLL', 0xB002, 7, entries_size, entries_offset)
+    segment += struct.pack('<L', 0) + entries
+    app2 = b'\xff\xe2' + (len(segment) + 6).to_bytes(2, 'big') + b'MPF\x00' + segment
+    return image[:2] + app2 + image[2:] + preview
+
+
+def photo_record(i: int, **fields) -> dict:
+    """
+    :param i: number of the photo, every photo has its own hash
+    :param fields: values replacing the default ones
+    :return: the database record (like PhotosphereFile.get_dic) of a photo of a synthetic catalogue
+    """
+    return {
+        "local_file_path": f"/tmp/photo_{i}.jpg",
+        "source_bucket_uri": f"gs://bucket/photo_{i}.jpg",
+        "thumbnail_bucket_uri": None,
+        "file_type": "IMAGE",
+        "created_at": None,
+        "created_at_timestamp": 1600000000 + i,
+        "latitude": None,
+        "longitude": None,
+        "geohash": None,
+        "hash": f"{i:040x}",
+        "average_hash": f"{i % 3:064x}",
+        **fields
+    }
+
+
+def create_library(folder: str, count: int, seed: int = 0) -> Counter:
+    """
+    :param folder: created if it doesn't exist
+    :param count: number of files
+    :return: number of files by extension
+    """
+    rng = random.Random(seed)
+    jpegs = _jpeg_templates(rng)
+    pngs = _png_templates(rng)
+    with tempfile.TemporaryDirectory() as tmp_folder:
+        videos = _video_templates(tmp_folder)
+    counts = Counter()
+    current = None
+    for index in range(count):
+        if index % FILES_PER_FOLDER == 0:
+            current = os.path.join(folder, f"{index // FILES_PER_FOLDER:04d}")
+            os.makedirs(current, exist_ok=True)
+        kind = index % 100
+        if kind < VIDEO_PER_100 and videos:
+            extension, content = ".mp4", mp4_with_padding(rng.choice(videos), rng)
+        elif kind < VIDEO_PER_100 + PNG_PER_100:
+            extension, content = ".png", png_with_exif(rng.choice(pngs), exif_bytes(rng, gps=False))
+        else:
+            extension, content = ".jpg", jpeg_with_exif(rng.choice(jpegs), exif_bytes(rng))
+        with open(os.path.join(current, f"IMG_{index:07d}{extension}"), "wb") as f:
+            f.write(content)
+        counts[extension] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    created = create_library(
+        sys.argv[1],
+        int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+        int(sys.argv[3]) if len(sys.argv) > 3 else 0
+    )
+    print(", ".join(f"{count} {extension}" for extension, count in sorted(created.items())))
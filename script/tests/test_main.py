@@ -0,0 +1,59 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+import click
+from PIL import Image
+
+from src.main import cli, LAZY_COMMANDS
+
+SCRIPT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# runs the cli in a new interpreter, then prints the heavy modules it imported
+RUN_CLI = """
+import sys
+from src.main import cli
+cli(sys.argv[1:], standalone_mode=False)
+print([module for module in ('firebase_admin', 'google.cloud.storage', 'src.cloud.sync_in_cloud') if module in sys.modules])
+"""
+
+
+def _heavy_modules(cwd: str, *args: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", RUN_CLI, *args],
+        cwd=cwd,
+        env=dict(os.environ, PYTHONPATH=SCRIPT_FOLDER),
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return result.stdout.strip().splitlines()[-1]
+
+
+class TestMain(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_lazy_commands(self):
+        with click.Context(cli) as ctx:
+            assert cli.list_commands(ctx) == sorted(LAZY_COMMANDS)
+            for name in LAZY_COMMANDS:
+                command = cli.get_command(ctx, name)
+                assert isinstance(command, click.Command) and command.name == name
+            assert cli.get_command(ctx, "missing") is None
+
+    def test_organize_does_not_import_firebase(self):
+        source = os.path.join(self.folder, "source")
+        os.makedirs(source)
+        Image.new("RGB", (32, 24), "blue").save(os.path.join(source, "photo.jpg"))
+        assert _heavy_modules(self.folder, "organize", "--source", source, "--out", os.path.join(self.folder, "out")) == "[]"
+        assert os.listdir(os.path.join(self.folder, "out"))
+
+    def test_help_does_not_import_firebase(self):
+        assert _heavy_modules(self.folder, "--help") == "[]"
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from click.testing import CliRunner
+from PIL import Image
+
+from src.file.path import PhotospherePath
+from src.local.hashing import hash_file
+from src.util import profiling
+
+
+class TestProfiling(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        profiling.disable()
+        shutil.rmtree(self.folder)
+
+    def test_disabled(self):
+        assert profiling.get_profiler() is None
+        first, second = profiling.span("stage", 10), profiling.span("other")
+        assert first is second
+        with first as stage:
+            stage.add_bytes(5)
+        assert profiling.drain() is None
+        assert profiling.get_options() is None
+
+    def test_stats(self):
+        profiler = profiling.enable()
+        for duration in range(1, 101):
+            profiler.record("stage", 0, duration * 1_000_000, 10)
+        with self.assertRaises(RuntimeError):
+            with profiling.span("failed", 3) as stage:
+                stage.add_bytes(4)
+                raise RuntimeError("recorded anyway")
+        stats = {stage["name"]: stage for stage in profiler.get_stats()}
+        assert stats["stage"]["count"] == 100
+        assert (stats["stage"]["p50_ms"], stats["stage"]["p95_ms"], stats["stage"]["p99_ms"]) == (50, 95, 99)
+        assert stats["stage"]["total_ms"] == 5050
+        assert stats["stage"]["bytes"] == 1000
+        assert stats["failed"]["count"] == 1 and stats["failed"]["bytes"] == 7
+        # the events are kept only for the trace
+        assert profiler.events == []
+
+    def test_drain_merge_and_trace(self):
+        path = os.path.join(self.folder, "file.bin")
+        with open(path, "wb") as f:
+            f.write(b"x" * 1000)
+        profiling.enable(trace=True)
+        hash_file(PhotospherePath(path))
+        # the spans of a worker process
+        spans = profiling.drain()
+        assert spans["durations"].keys() == {"file.hash"} and spans["bytes"]["file.hash"] == 1000
+        assert profiling.get_profiler().get_stats() == []
+        profiling.merge(spans)
+        profiling.merge(spans)
+        assert profiling.get_profiler().get_stats()[0]["bytes"] == 2000
+        trace_path = os.path.join(self.folder, "trace.json")
+        assert profiling.get_profiler().write_trace(trace_path) == 2
+        with open(trace_path) as f:
+            events = json.load(f)["traceEvents"]
+        assert [(event["name"], event["cat"], event["ph"], event["args"]) for event in events] == \
+               [("file.hash", "file", "X", {"bytes": 1000})] * 2
+        assert events[0]["pid"] == os.getpid()
+
+    def test_cli(self):
+        from src.main import cli
+        source = os.path.join(self.folder, "source")
+        os.makedirs(source)
+        Image.new("RGB", (64, 48), "red").save(os.path.join(source, "photo.png"))
+        trace_path = os.path.join(self.folder, "trace.json")
+        result = CliRunner().invoke(cli, [
+            "--profile-trace", trace_path, "organize", "--source", source, "--out", os.path.join(self.folder, "out")
+        ])
+        assert result.exit_code == 0, result.output
+        assert "p99 ms" in result.output and "file.hash" in result.output and "image.metadata" in result.output
+        with open(trace_path) as f:
+            assert json.load(f)["traceEvents"]
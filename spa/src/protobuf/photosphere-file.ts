@@ -14,12 +14,18 @@ enum FileType {
   VIDEO = 2;
 }
 
+message Rendition {
+  uint32 size = 1;
+  string uri = 2;
+}
+
 message PhotosphereFile {
   string source_bucket_uri = 2;
   FileType file_type = 4;
   int64 created_at_timestamp = 6;
   string geohash = 9;
   string hash = 10;
+  repeated Rendition renditions = 11;
 }
 `;
 